@@ -1,12 +1,54 @@
-from .kitti_mono import KITTIMonoDataset
-from .kitti_mono import KITTIMonoDataset_v2
-from .kitti_stereo import KITTIStereoDataset
-from .kitti_stereo import KITTIMonoStereoDataset
-
-from .cityscapes_mono import CityscapesMonoDataset
-# from .cityscapes_mono import CityscapesMonoDataset_v2
-# from .cityscapes_stereo import CityscapesStereoDataset
-# from .cityscapes_stereo import CityscapesMonoStereoDataset
-
-from .tools import GetKITTI
-from .tools import GetCityscapes
\ No newline at end of file
+import importlib
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+모든 이름은 처음 쓸 때 하위 모듈을 import (PEP 562 module __getattr__)
+import model_loader만으로는 torch, torchvision, cv2, albumentations를 읽지 않고,
+GetKITTI, GetCityscapes, KITTIManifest, CityscapesManifest는 numpy만으로 import 됨 (스플릿 생성 스크립트, spawn 워커)
+from model_loader import *는 __all__의 모든 이름을 읽으므로 이전처럼 전부 import
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# 이름 -> 정의된 하위 모듈
+EXPORTS = {
+    "KITTIMonoDataset":       ".kitti_mono",
+    "KITTIMonoDataset_v2":    ".kitti_mono",
+    "KITTIStereoDataset":     ".kitti_stereo",
+    "KITTIMonoStereoDataset": ".kitti_stereo",
+
+    "CityscapesMonoDataset":  ".cityscapes_mono",
+    # "CityscapesMonoDataset_v2":    ".cityscapes_mono",
+    # "CityscapesStereoDataset":     ".cityscapes_stereo",
+    # "CityscapesMonoStereoDataset": ".cityscapes_stereo",
+
+    "GetKITTI":               ".tools",
+    "GetCityscapes":          ".tools",
+
+    "DepthStore":             ".depth_store",
+    "VelodyneStore":          ".velodyne_store",
+    "SparseDepthCollate":     ".collate",
+    "SharedBatchCollate":     ".collate",
+    "ConstantCollate":        ".collate",
+    "FrameCache":             ".frame_cache",
+    "SequenceChunkSampler":   ".sampler",
+    "ImageStore":             ".image_store",
+    "BatchColorJitter":       ".augment",
+    "KITTIManifest":          ".manifest",
+    "CityscapesManifest":     ".manifest",
+    "ThreadedLoader":         ".threaded",
+    "ReadAheadSampler":       ".prefetch",
+    "StageTimer":             ".timing",
+    "LoaderProfiler":         ".profiler"}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(EXPORTS[name], __name__), name)
+    globals()[name] = value # 다음부터는 __getattr__을 거치지 않음
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
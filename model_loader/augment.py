@@ -0,0 +1,149 @@
+import torch
+from torchvision.transforms import functional as F
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+배치 단위 color augmentation 모듈, 모든 함수는 [B, 3, H, W] float (0 ~ 1) 텐서를 받음
+def adjust_brightness  샘플마다 밝기 배율
+def adjust_contrast    샘플마다 (이미지 평균 밝기 기준) 대비 배율
+def adjust_saturation  샘플마다 (그레이 이미지 기준) 채도 배율
+def adjust_hue         샘플마다 HSV 색상 이동
+class BatchColorJitter collate 이후의 배치 전체에 ColorJitter를 적용해서 ("color_aug", frame_id, scale) 키를 만듬
+def jitter_image       (샘플 단위) ColorJitter.get_params로 뽑은 파라미터를 PIL 이미지 하나에 적용
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+def rgb_to_grayscale(images):
+    return (0.299 * images[:, 0] + 0.587 * images[:, 1] + 0.114 * images[:, 2]).unsqueeze(1)
+
+
+def blend(images, others, factors):
+    return (factors * images + (1 - factors) * others).clamp_(0, 1)
+
+
+def adjust_brightness(images, factors):
+    return (images * factors.view(-1, 1, 1, 1)).clamp_(0, 1)
+
+
+def adjust_contrast(images, factors):
+    mean = rgb_to_grayscale(images).mean(dim = (1, 2, 3), keepdim = True)
+    return blend(images, mean, factors.view(-1, 1, 1, 1))
+
+
+def adjust_saturation(images, factors):
+    return blend(images, rgb_to_grayscale(images), factors.view(-1, 1, 1, 1))
+
+
+def rgb_to_hsv(images):
+    r, g, b = images.unbind(dim = 1)
+    maxc    = images.amax(dim = 1)
+    delta   = maxc - images.amin(dim = 1)
+    safe    = torch.where(delta > 0, delta, torch.ones_like(delta))
+    s       = delta / torch.where(maxc > 0, maxc, torch.ones_like(maxc))
+
+    h = torch.where(maxc == r, g - b, torch.where(maxc == g, 2.0 * safe + b - r, 4.0 * safe + r - g)) / safe
+    h = torch.where(delta > 0, (h / 6.0) % 1.0, torch.zeros_like(h))
+    return torch.stack((h, s, maxc), dim = 1)
+
+
+def hsv_to_rgb(images):
+    """
+    채널마다 f(n) = v - v * s * clamp(min(k, 4 - k), 0, 1), k = (n + 6h) mod 6 (n = 5, 3, 1)로 한 번에 계산
+    """
+    h, s, v = images[:, 0:1], images[:, 1:2], images[:, 2:3]
+    k       = (torch.tensor([5.0, 3.0, 1.0], dtype = images.dtype, device = images.device).view(1, 3, 1, 1) + 6.0 * h) % 6.0
+    return v - v * s * torch.minimum(k, 4.0 - k).clamp_(0, 1)
+
+
+def adjust_hue(images, factors):
+    hsv       = rgb_to_hsv(images)
+    hsv[:, 0] = (hsv[:, 0] + factors.view(-1, 1, 1)) % 1.0
+    return hsv_to_rgb(hsv)
+
+
+class BatchColorJitter(object):
+    def __init__(self, brightness = (0.8, 1.2), contrast = (0.8, 1.2), saturation = (0.8, 1.2), hue = (-0.1, 0.1),
+                 p = 0.5, generator = None):
+        """
+        샘플마다 워커에서 프레임 수 x 스케일 수만큼 ColorJitter를 부르는 대신, collate 이후 배치 전체에 한 번에 적용
+        파라미터 (배율 4개 + 적용 순서)는 샘플마다 한 번만 뽑아서 그 샘플의 모든 frame_id, scale에 똑같이 적용 (monodepth2와 동일)
+        GPU로 옮긴 배치에 부르면 augmentation 비용이 워커에서 완전히 빠짐
+
+        Args:
+            brightness, contrast, saturation, hue: 데이터셋의 ColorJitter와 같은 범위
+            p:         샘플마다 augmentation을 적용할 확률 (데이터셋의 random.random() > 0.5)
+            generator: 파라미터 샘플링용 torch.Generator (CPU), None이면 전역 RNG
+
+        ex)
+        dataset = KITTIMonoDataset(..., batch_color = True) # 워커에서는 color_aug를 만들지 않음
+        color_aug = BatchColorJitter()
+        for inputs in loader:
+            inputs = {key: value.to(device) for key, value in inputs.items()}
+            inputs = images_to_float(inputs) # uint8 = True인 경우
+            inputs = color_aug(inputs)
+        """
+        self.ranges    = [brightness, contrast, saturation, hue]
+        self.functions = [adjust_brightness, adjust_contrast, adjust_saturation, adjust_hue]
+        self.p         = p
+        self.generator = generator
+
+
+    def sample_params(self, batch_size):
+        """
+        returns:
+            apply:   [B] bool, augmentation을 적용할 샘플
+            factors: [4, B] 밝기, 대비, 채도, 색상 파라미터
+            order:   [B, 4] 샘플마다 네 연산을 적용할 순서
+        """
+        apply   = torch.rand(batch_size, generator = self.generator) < self.p
+        factors = torch.stack([low + (high - low) * torch.rand(batch_size, generator = self.generator)
+                               for low, high in self.ranges])
+        order   = torch.argsort(torch.rand((batch_size, 4), generator = self.generator), dim = 1)
+        return apply, factors, order
+
+    def jitter(self, images, factors, order):
+        for position in range(order.shape[1]):
+            for function_index, function in enumerate(self.functions):
+                index = torch.nonzero(order[:, position] == function_index).flatten()
+                if len(index) > 0:
+                    images[index] = function(images[index], factors[function_index, index])
+        return images
+
+
+    def __call__(self, inputs):
+        color_keys = [key for key in inputs if isinstance(key, tuple) and key[0] == "color"]
+        if not color_keys:
+            return inputs
+        if inputs[color_keys[0]].dtype == torch.uint8:
+            raise TypeError("uint8 이미지는 collate.images_to_float로 먼저 변환할 것")
+
+        batch_size            = inputs[color_keys[0]].shape[0]
+        apply, factors, order = self.sample_params(batch_size)
+        index                 = torch.nonzero(apply).flatten()
+        for key in color_keys:
+            images = inputs[key]
+            output = images.clone()
+            if len(index) > 0:
+                device = images.device
+                output[index.to(device)] = self.jitter(
+                    images[index.to(device)], factors[:, index].to(device), order[index].to(device))
+            inputs[("color_aug",) + key[1:]] = output
+        return inputs
+
+
+
+def jitter_image(image, params):
+    """
+    transforms.ColorJitter.get_params(...)의 (순서, 밝기, 대비, 채도, 색상)을 이미지에 적용
+    get_params는 변환이 아니라 파라미터 튜플을 반환하므로, 샘플마다 한 번 뽑아서 그 샘플의 모든 frame_id, scale에 이 함수로 적용
+
+    ex)
+    params    = transforms.ColorJitter.get_params((0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1))
+    color_aug = jitter_image(image, params)
+    """
+    order, brightness, contrast, saturation, hue = params
+    functions = [(F.adjust_brightness, brightness), (F.adjust_contrast, contrast), (F.adjust_saturation, saturation), (F.adjust_hue, hue)]
+    for index in order:
+        function, factor = functions[int(index)]
+        if factor is not None:
+            image = function(image, factor)
+    return image
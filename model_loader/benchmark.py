@@ -0,0 +1,634 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import subprocess
+import multiprocessing
+from queue import Empty
+import cv2
+import pickle
+import resource
+import torch
+import numpy as np
+from PIL import Image
+from collections import Counter
+from model_utility import *
+from .kitti_mono import KITTIMonoDataset
+from .kitti_mono import KITTIMonoDataset_v2
+from .kitti_stereo import KITTIStereoDataset
+from .kitti_stereo import KITTIMonoStereoDataset
+from .cityscapes_mono import CityscapesMonoDataset
+from .velodyne_store import VelodyneStore
+from .manifest import KITTIManifest
+from .manifest import CityscapesManifest
+from .threaded import ThreadedLoader
+from .prefetch import ReadAheadSampler
+from torch.utils.data import DataLoader
+from torch.utils.data.dataloader import default_collate
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+데이터 로더의 각 단계 속도를 측정하기 위한 함수 모듈
+def point2depth_counter    Counter + np.where 루프를 쓰던 이전 point2depth (비교 기준)
+def benchmark_point2depth  스캔 하나당 point2depth 지연 시간을 이전 / 현재 구현으로 비교
+def decode_resize          JPEG 디코딩 (draft 선택) + 스케일 0 리사이즈
+def benchmark_draft        원본 디코딩과 draft 디코딩의 디코딩 + 리사이즈 시간, 화질 비교
+def sample_nbytes          샘플 하나가 DataLoader IPC (공유 메모리)로 넘기는 텐서 바이트 수
+def benchmark_ipc          float32 / uint8 출력의 샘플당 IPC 바이트 비교
+def benchmark_manifest     순차 os.listdir / 병렬 스캔 / mtime 캐시로 드라이브 프레임 목록을 만드는 시간 비교
+def peak_rss_mb            /proc/<pid>/status의 최대 RSS (VmHWM)
+def time_loader            로더의 첫 배치까지 시간과 이후 배치 처리량, 배치 지연 시간 분위수, 워커 최대 RSS
+def benchmark_loaders      같은 코어 수에서 multi-process DataLoader와 ThreadedLoader 비교
+def evict_paths            POSIX_FADV_DONTNEED로 파일을 page cache에서 내림 (콜드 읽기 재현)
+def benchmark_prefetch     page cache를 비운 상태에서 ReadAheadSampler 유무에 따른 처리량 비교
+def benchmark_dataset      데이터셋 트리 전체를 스플릿으로 쓰는 데이터셋 (클래스 이름으로 생성, synthetic 트리용)
+def run_config             설정 하나 (데이터셋, frame_ids, 해상도, 워커 수, 배치 크기)의 처리량, 지연 시간, 최대 RSS
+def wait_report            spawn 프로세스의 run_config 결과를 기다림, 결과 없이 죽거나 시간을 넘기면 에러로 기록
+def benchmark_datasets     모든 데이터셋 클래스 x frame_ids x 해상도 x 워커 수 x 배치 크기를 설정마다 새 프로세스에서 측정
+def benchmark_imports      새 인터프리터에서 import 시간을 재고 IMPORT_BUDGET (시간, 읽으면 안 되는 모듈)과 비교
+def benchmark_velodyne     샘플당 벨로다인 바이트와 뎁스 지연 시간을 원본 .bin / VelodyneStore로 비교
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+def point2depth_counter(calib_path, point_path, cam = 2, vel_depth = False):
+    """
+    중복 픽셀을 Counter와 np.where로 하나씩 처리하던 이전 point2depth
+    벡터화된 model_utility.point2depth와 결과가 같은지, 얼마나 빨라졌는지 확인하는 용도로만 남겨둠
+    """
+    cam2cam  = read_velo2cam(os.path.join(calib_path + "/" + "calib_cam_to_cam.txt"))
+    velo2cam = read_velo2cam(os.path.join(calib_path + "/" + "calib_velo_to_cam.txt"))
+    velo2cam = np.hstack((velo2cam['R'].reshape(3, 3), velo2cam['T'][..., np.newaxis]))
+    velo2cam = np.vstack((velo2cam, np.array([0, 0, 0, 1.0])))
+    im_shape = cam2cam["S_rect_02"][::-1].astype(np.int32)
+
+    R_cam2rect = np.eye(4)
+    R_cam2rect[:3, :3] = cam2cam['R_rect_00'].reshape(3, 3)
+    P_rect = cam2cam['P_rect_0'+str(cam)].reshape(3, 4)
+    P_velo2im = np.dot(np.dot(P_rect, R_cam2rect), velo2cam)
+
+    velo = read_velodyne_points(point_path)
+    velo = velo[velo[:, 0] >= 0, :]
+    velo_pts_im        = np.dot(P_velo2im, velo.T).T
+    velo_pts_im[:, :2] = velo_pts_im[:, :2] / velo_pts_im[:, 2][..., np.newaxis]
+    if vel_depth:
+        velo_pts_im[:, 2] = velo[:, 0]
+
+    velo_pts_im[:, 0] = np.round(velo_pts_im[:, 0]) - 1
+    velo_pts_im[:, 1] = np.round(velo_pts_im[:, 1]) - 1
+    val_inds          = (velo_pts_im[:, 0] >= 0) & (velo_pts_im[:, 1] >= 0)
+    val_inds          = val_inds & (velo_pts_im[:, 0] < im_shape[1]) & (velo_pts_im[:, 1] < im_shape[0])
+    velo_pts_im       = velo_pts_im[val_inds, :]
+
+    depth = np.zeros((im_shape[:2]))
+    depth[velo_pts_im[:, 1].astype(np.int64), velo_pts_im[:, 0].astype(np.int64)] = velo_pts_im[:, 2]
+
+    inds = sub2ind(depth.shape, velo_pts_im[:, 1], velo_pts_im[:, 0])
+    dupe_inds = [item for item, count in Counter(inds).items() if count > 1]
+    for dd in dupe_inds:
+        pts   = np.where(inds == dd)[0]
+        x_loc = int(velo_pts_im[pts[0], 0])
+        y_loc = int(velo_pts_im[pts[0], 1])
+        depth[y_loc, x_loc] = velo_pts_im[pts, 2].min()
+
+    depth[depth < 0] = 0
+    return depth
+
+
+def benchmark_point2depth(calib_path, point_paths, cam = 2, repeat = 3):
+    """
+    스캔 하나당 point2depth 지연 시간을 이전 (Counter) 구현과 현재 (벡터화) 구현으로 비교
+    두 결과가 bit 단위로 같지 않으면 AssertionError
+    Args:
+        calib_path:  ./dataset/kitti/2011_09_26
+        point_paths: velodyne_points/data/*.bin 경로 리스트
+        cam:         2 or 3
+        repeat:      스캔마다 반복 측정 횟수 (최솟값을 사용)
+
+    returns:
+        {"before": 스캔당 ms, "after": 스캔당 ms, "speedup": before / after}
+    """
+    before, after = [], []
+    for point_path in point_paths:
+        timing = {}
+        for name, function in (("before", point2depth_counter), ("after", point2depth)):
+            elapsed = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                depth = function(calib_path, point_path, cam)
+                elapsed.append(time.perf_counter() - start)
+            timing[name] = (min(elapsed), depth)
+
+        assert np.array_equal(timing["before"][1], timing["after"][1]), point_path
+        before.append(timing["before"][0])
+        after.append(timing["after"][0])
+
+    report = {
+        "before":  1000 * float(np.mean(before)),
+        "after":   1000 * float(np.mean(after)),
+        "speedup": float(np.mean(before) / np.mean(after))}
+    print(">>>  point2depth per scan (ms)  :  before {before:.2f}  after {after:.2f}  x{speedup:.1f}".format(**report))
+    return report
+
+
+def decode_resize(image_path, height, width, draft = False):
+    """
+    데이터셋의 decode_image + 스케일 0 리사이즈 (cv2.INTER_AREA)와 같은 경로
+    """
+    with open(image_path, 'rb') as f:
+        with Image.open(f) as img:
+            if draft == True:
+                img.draft("RGB", (width, height))
+            decoded = img.size
+            image   = np.array(img.convert('RGB'))
+    return cv2.resize(image, (width, height), interpolation = cv2.INTER_AREA), decoded
+
+
+def benchmark_draft(image_paths, height, width, repeat = 3):
+    """
+    이미지 한 장당 디코딩 + 리사이즈 시간을 원본 디코딩과 draft 디코딩으로 비교
+    draft는 (width, height)보다 작아지지 않는 가장 작은 DCT 스케일을 고르므로
+    KITTI 1242x375 -> 640x192는 1/2이 621x188로 작아져서 줄일 수 없고, Cityscapes 2048x1024 -> 512x256은 1/4로 디코딩함
+    Args:
+        image_paths: JPEG 경로 리스트
+        height:      스케일 0 높이
+        width:       스케일 0 너비
+        repeat:      이미지마다 반복 측정 횟수 (최솟값을 사용)
+
+    returns:
+        {"before": 장당 ms, "after": 장당 ms, "speedup": before / after, "decoded": draft 디코딩 크기, "max_abs": 최대 차이, "psnr": 평균 PSNR}
+    """
+    before, after, max_abs, psnr = [], [], [], []
+    for image_path in image_paths:
+        timing = {}
+        for name, draft in (("before", False), ("after", True)):
+            elapsed = []
+            for _ in range(repeat):
+                start          = time.perf_counter()
+                image, decoded = decode_resize(image_path, height, width, draft)
+                elapsed.append(time.perf_counter() - start)
+            timing[name] = (min(elapsed), image.astype(np.float64), decoded)
+
+        diff = np.abs(timing["before"][1] - timing["after"][1])
+        before.append(timing["before"][0])
+        after.append(timing["after"][0])
+        max_abs.append(diff.max())
+        psnr.append(10 * np.log10(255.0 ** 2 / max(np.mean(diff ** 2), 1e-12)))
+
+    report = {
+        "before":  1000 * float(np.mean(before)),
+        "after":   1000 * float(np.mean(after)),
+        "speedup": float(np.mean(before) / np.mean(after)),
+        "decoded": timing["after"][2],
+        "max_abs": float(np.max(max_abs)),
+        "psnr":    float(np.mean(psnr))}
+    print(">>>  decode + resize per image (ms) :  before {before:.2f}  after {after:.2f}  x{speedup:.1f}".format(**report))
+    print(">>>  draft decoded size             :  {decoded}  max_abs {max_abs:.0f}  psnr {psnr:.1f}".format(**report))
+    return report
+
+
+def sample_nbytes(sample):
+    """
+    returns:
+        {"images": color, color_aug 텐서 바이트, "total": 모든 텐서 바이트, "pickle": 텐서를 값으로 pickle한 바이트}
+        워커는 텐서 storage를 공유 메모리로 옮기고 핸들만 보내므로 실제로 복사되는 양은 "total", "pickle"은 그 상한
+    """
+    images = sum(value.nbytes for key, value in sample.items() if isinstance(key, tuple) and key[0] in ("color", "color_aug"))
+    total  = sum(value.nbytes for value in sample.values() if torch.is_tensor(value))
+    return {"images": images, "total": total, "pickle": len(pickle.dumps(sample, protocol = pickle.HIGHEST_PROTOCOL))}
+
+
+def benchmark_ipc(float_dataset, uint8_dataset, indices):
+    """
+    uint8 = False / True로 만든 같은 설정의 데이터셋에서 샘플당 IPC 바이트를 비교
+    Args:
+        float_dataset: uint8 = False 데이터셋
+        uint8_dataset: uint8 = True 데이터셋
+        indices:       측정할 샘플 인덱스
+
+    returns:
+        {"float": {...}, "uint8": {...}} 샘플당 평균 바이트 (sample_nbytes 참고)
+    """
+    report = {}
+    for name, dataset in (("float", float_dataset), ("uint8", uint8_dataset)):
+        nbytes       = [sample_nbytes(dataset[index]) for index in indices]
+        report[name] = {key: float(np.mean([value[key] for value in nbytes])) for key in ("images", "total", "pickle")}
+
+    for key in ("images", "total", "pickle"):
+        print(">>>  IPC {0:<6} per sample (MB) :  float {1:.2f}  uint8 {2:.2f}  x{3:.1f}".format(
+            key, report["float"][key] / 2**20, report["uint8"][key] / 2**20, report["float"][key] / report["uint8"][key]))
+    return report
+
+
+def benchmark_manifest(datapath, drives, cache_path, num_workers = 8, subdir = "velodyne_points/data"):
+    """
+    GetKITTI.search가 프레임 목록을 만드는 시간을 비교
+    listdir: 이전 방식 (드라이브마다 순차 os.listdir, 정렬 안 됨)
+    cold:    캐시 없이 병렬 scandir + 숫자 정렬 후 캐시 저장
+    warm:    캐시가 있는 상태 (드라이브마다 stat만)
+
+    returns:
+        {"listdir": 초, "cold": 초, "warm": 초, "rescanned": warm에서 다시 스캔한 드라이브 수}
+    """
+    if os.path.isfile(cache_path):
+        os.remove(cache_path)
+
+    start = time.perf_counter()
+    for drive in drives:
+        os.listdir(os.path.join(datapath, drive, subdir))
+    report = {"listdir": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    KITTIManifest(datapath, drives, cache_path, num_workers, subdir)
+    report["cold"] = time.perf_counter() - start
+
+    start    = time.perf_counter()
+    manifest = KITTIManifest(datapath, drives, cache_path, num_workers, subdir)
+    report["warm"]      = time.perf_counter() - start
+    report["rescanned"] = len(manifest.rescanned)
+
+    print(">>>  Manifest listdir (s)  :  {0:.3f}".format(report["listdir"]))
+    print(">>>  Manifest cold (s)     :  {0:.3f}".format(report["cold"]))
+    print(">>>  Manifest warm (s)     :  {0:.3f}  rescanned {1}".format(report["warm"], report["rescanned"]))
+    return report
+
+
+def peak_rss_mb(pid = "self"):
+    """
+    /proc/<pid>/status의 VmHWM (최대 RSS), ru_maxrss와 달리 exec 이전 (spawn의 fork) 메모리가 섞이지 않음, 없으면 0
+    """
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def child_pids():
+    pids = []
+    for task in os.listdir("/proc/self/task") if os.path.isdir("/proc/self/task") else []:
+        try:
+            with open("/proc/self/task/{}/children".format(task)) as f:
+                pids += f.read().split()
+        except OSError:
+            pass
+    return pids
+
+
+def time_loader(loader, num_batches):
+    """
+    returns:
+        {"first": 첫 배치까지 초 (워커 시작 포함), "samples_per_sec": 두 번째 배치부터 num_batches개의 초당 샘플 수,
+         "p50_ms", "p99_ms": 두 번째 배치부터 배치 하나를 기다린 시간의 분위수,
+         "rss_worker_mb": 워커 프로세스 중 가장 큰 최대 RSS (워커가 없으면 0)}
+    """
+    start    = time.perf_counter()
+    iterator = iter(loader)
+    batch    = next(iterator)
+    first    = time.perf_counter() - start
+
+    samples   = 0
+    latencies = []
+    start     = time.perf_counter()
+    previous  = start
+    for _, batch in zip(range(num_batches), iterator):
+        now      = time.perf_counter()
+        latencies.append(now - previous)
+        samples += len(next(value for value in batch.values() if torch.is_tensor(value)))
+        previous = time.perf_counter()
+    elapsed = time.perf_counter() - start
+    workers = max([peak_rss_mb(pid) for pid in child_pids()] + [0.0]) # 워커가 끝나기 전에 읽음
+    del iterator # 프로세스 워커 종료
+    latencies = np.array(latencies if latencies else [0.0]) * 1000
+    return {"first": first, "samples_per_sec": samples / max(elapsed, 1e-9),
+            "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99)), "rss_worker_mb": workers}
+
+
+def benchmark_loaders(dataset, batch_size, num_workers, num_batches = 20, collate_fn = default_collate):
+    """
+    같은 코어 수 (num_workers 프로세스 vs num_workers 스레드)에서 두 로더의 처리량과 메모리를 비교
+    ru_maxrss는 메인 프로세스의 최대 RSS와 워커 프로세스 중 가장 큰 RSS (KB)
+
+    returns:
+        {"process": {...}, "thread": {...}} time_loader 결과 + "maxrss_self", "maxrss_children"
+    """
+    report  = {}
+    loaders = {
+        "process": DataLoader(dataset, batch_size, shuffle = True, num_workers = num_workers, collate_fn = collate_fn, drop_last = True),
+        "thread":  ThreadedLoader(dataset, batch_size, shuffle = True, num_threads = num_workers, collate_fn = collate_fn, drop_last = True)}
+    for name, loader in loaders.items():
+        report[name] = time_loader(loader, num_batches)
+        report[name]["maxrss_self"]     = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report[name]["maxrss_children"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    for name in loaders:
+        print(">>>  {0:<7} x{1} :  first batch {2:.2f} s  {3:.1f} samples/s  maxrss self {4} KB  children {5} KB".format(
+            name, num_workers, report[name]["first"], report[name]["samples_per_sec"],
+            report[name]["maxrss_self"], report[name]["maxrss_children"]))
+    return report
+
+
+def evict_paths(paths):
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def benchmark_prefetch(dataset, indices, batch_size, num_workers, window = 64, max_bytes = 256 * 2**20, mode = None):
+    """
+    indices 샘플의 파일을 page cache에서 내린 다음, 같은 순서로 한 번은 그냥, 한 번은 ReadAheadSampler로 읽어서 비교
+    page cache를 실제로 비우려면 파일이 dirty가 아니어야 함 (posix_fadvise가 없는 플랫폼에서는 측정 불가)
+
+    returns:
+        {"plain": 초당 샘플 수, "prefetch": 초당 샘플 수, "stats": ReadAheadSampler.stats()}
+    """
+    paths   = sorted({path for index in indices for path in dataset.sample_paths(index)})
+    batches = [indices[start: start + batch_size] for start in range(0, len(indices), batch_size)]
+    report  = {}
+    for name in ["plain", "prefetch"]:
+        evict_paths(paths)
+        sampler = ReadAheadSampler(batches, dataset, window, max_bytes, mode = mode) if name == "prefetch" else batches
+        start   = time.perf_counter()
+        for _ in DataLoader(dataset, batch_sampler = sampler, num_workers = num_workers):
+            pass
+        report[name] = len(indices) / (time.perf_counter() - start)
+        if name == "prefetch":
+            report["stats"] = sampler.stats()
+
+    print(">>>  Prefetch plain        :  {0:.1f} samples/s".format(report["plain"]))
+    print(">>>  Prefetch read-ahead   :  {0:.1f} samples/s  hit_rate {1:.2f}".format(report["prefetch"], report["stats"]["hit_rate"]))
+    return report
+
+
+BENCHMARK_DATASETS = ["KITTIMonoDataset", "KITTIMonoDataset_v2", "KITTIStereoDataset", "KITTIMonoStereoDataset", "CityscapesMonoDataset"]
+
+
+def benchmark_dataset(name, datapath, frame_ids, height, width, ext, is_training = True, mode = "train", **kwargs):
+    """
+    datapath 트리 전체를 manifest로 스캔해서 스플릿으로 쓰는 데이터셋, frame_ids 범위를 벗어나는 키프레임은 뺌
+    KITTIStereoDataset은 frame_ids를 받지 않고, KITTIMonoStereoDataset은 frame_ids에 "s"가 없으면 붙임
+
+    Args:
+        name:   BENCHMARK_DATASETS 중 하나
+        mode:   Cityscapes의 "train" or "val" or "test"
+        kwargs: 데이터셋에 그대로 넘김 (uint8, draft, frame_cache, batch_color ...)
+    """
+    if name not in BENCHMARK_DATASETS:
+        raise ValueError("name은 {} 중 하나".format(BENCHMARK_DATASETS))
+    offsets = sorted(frame_id for frame_id in frame_ids if frame_id != "s")
+    if name == "CityscapesMonoDataset":
+        lines = CityscapesManifest(datapath, mode).lines((-offsets[0], offsets[-1]))
+        return CityscapesMonoDataset(datapath, lines, is_training, frame_ids, mode, ext, height, width, **kwargs)
+
+    drives = sorted(os.path.join(date.name, drive.name) for date in os.scandir(datapath) if date.is_dir()
+                    for drive in os.scandir(date.path) if drive.is_dir() and drive.name.endswith("_sync"))
+    manifest = KITTIManifest(datapath, drives)
+    lines    = ["{} {:010d} {}".format(drive, frame, side) for drive in drives for frame in manifest[drive].tolist() for side in ["l", "r"]]
+    if name == "KITTIStereoDataset":
+        return KITTIStereoDataset(datapath, removelines(datapath, lines, [0]), is_training, height, width, ext, **kwargs)
+    lines = removelines(datapath, lines, offsets)
+    if name == "KITTIMonoStereoDataset":
+        frame_ids = list(frame_ids) if "s" in frame_ids else list(frame_ids) + ["s"]
+        return KITTIMonoStereoDataset(datapath, lines, is_training, frame_ids, height, width, ext, **kwargs)
+    return globals()[name](datapath, lines, is_training, frame_ids, height, width, ext, **kwargs)
+
+
+def run_config(config, queue = None):
+    """
+    설정 하나를 측정, benchmark_datasets가 설정마다 새 (spawn) 프로세스에서 부르기 때문에 최대 RSS가 이 설정만의 값
+    config: {"dataset", "datapath", "frame_ids", "resolution", "ext", "num_workers", "batch_size", "num_batches", "kwargs"}
+
+    returns:
+        time_loader 결과 + "rss_main_mb" (메인 프로세스 최대 RSS), "rss_worker_mb" (가장 큰 워커의 최대 RSS)
+        실패하면 {"error": traceback 마지막 줄}, queue가 있으면 결과를 queue에 넣음
+    """
+    try:
+        height, width = config["resolution"]
+        dataset = benchmark_dataset(config["dataset"], config["datapath"], config["frame_ids"], height, width, config["ext"], **config["kwargs"])
+        loader  = DataLoader(dataset, config["batch_size"], shuffle = True, num_workers = config["num_workers"], drop_last = True)
+        report  = time_loader(loader, config["num_batches"])
+        report["rss_main_mb"] = peak_rss_mb()
+    except Exception:
+        report = {"error": traceback.format_exc().strip().splitlines()[-1]}
+    if queue is not None:
+        queue.put(report)
+    return report
+
+
+def wait_report(process, queue, timeout = None, poll = 1.0):
+    """
+    queue.get()을 poll 초마다 나눠서 기다리면서 프로세스가 살아있는지 확인
+    결과를 넣기 전에 죽으면 (OOM kill, segfault, spawn이 __main__을 다시 import할 수 없는 stdin 스크립트 등) exitcode를,
+    timeout (초)을 넘기면 프로세스를 종료하고 에러로 기록 (스윕 전체가 멈추지 않음)
+
+    returns:
+        run_config 결과 or {"error": ...}
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            return queue.get(timeout = poll)
+        except Empty:
+            pass
+        if not process.is_alive():
+            try:
+                return queue.get(timeout = poll) # 종료 직전에 넣은 결과가 아직 파이프에 있을 수 있음
+            except Empty:
+                process.join()
+                code = process.exitcode
+                return {"error": "killed by signal {}".format(-code) if code < 0 else "exited with code {} before reporting".format(code)}
+        if timeout is not None and time.perf_counter() - start > timeout:
+            process.terminate()
+            process.join()
+            return {"error": "timed out after {:.0f} s".format(timeout)}
+
+
+def benchmark_datasets(kitti_path = None, city_path = None, datasets = None, frame_ids = ([0, -1, 1],), resolutions = None,
+                       num_workers = (0, 2), batch_sizes = (8,), num_batches = 20, kitti_ext = ".jpg", city_ext = ".png",
+                       isolate = True, timeout = None, **kwargs):
+    """
+    데이터셋 클래스 x frame_ids x 해상도 x 워커 수 x 배치 크기의 모든 조합을 측정 (synthetic.make_kitti, make_cityscapes 트리로 충분)
+    최대 RSS는 프로세스가 살아있는 동안 줄지 않으므로 isolate = True면 설정마다 spawn 프로세스를 새로 띄워서 측정
+    rss_worker_mb는 fork된 워커 하나의 RSS라 메인 프로세스와 공유하는 페이지 (copy-on-write)도 들어 있음
+
+    Args:
+        kitti_path:  KITTI 트리, None이면 KITTI 클래스는 건너뜀
+        city_path:   Cityscapes 트리, None이면 CityscapesMonoDataset은 건너뜀
+        datasets:    BENCHMARK_DATASETS 중 측정할 클래스 이름, None이면 경로가 있는 모든 클래스
+        frame_ids:   frame_ids 리스트들
+        resolutions: [(height, width), ...] None이면 KITTI (192, 640), Cityscapes (256, 512)
+        timeout:     isolate = True일 때 설정 하나의 최대 시간 (초), None이면 제한 없음 (프로세스가 죽는 경우는 항상 에러로 기록)
+        kwargs:      데이터셋에 그대로 넘김 (uint8 = True, batch_color = True ...)
+
+    returns:
+        설정마다 {"dataset", "frame_ids", "resolution", "num_workers", "batch_size"} + run_config 결과 리스트
+    """
+    if datasets is None:
+        datasets = [name for name in BENCHMARK_DATASETS if (city_path if name == "CityscapesMonoDataset" else kitti_path) is not None]
+
+    configs = []
+    for name in datasets:
+        is_city = name == "CityscapesMonoDataset"
+        for frame_id, resolution, workers, batch_size in [(f, r, w, b) for f in frame_ids
+                                                          for r in (resolutions or [(256, 512) if is_city else (192, 640)])
+                                                          for w in num_workers for b in batch_sizes]:
+            configs.append({"dataset": name, "datapath": city_path if is_city else kitti_path, "frame_ids": list(frame_id),
+                            "resolution": tuple(resolution), "ext": city_ext if is_city else kitti_ext, "num_workers": workers,
+                            "batch_size": batch_size, "num_batches": num_batches, "kwargs": kwargs})
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    print(">>>  {0:<23} {1:<14} {2:>9} {3:>3} {4:>3} {5:>10} {6:>9} {7:>9} {8:>9} {9:>10}".format(
+        "dataset", "frame_ids", "size", "nw", "bs", "samples/s", "p50 (ms)", "p99 (ms)", "rss (MB)", "worker"))
+    for config in configs:
+        if isolate:
+            queue   = context.Queue()
+            process = context.Process(target = run_config, args = (config, queue))
+            process.start()
+            report  = wait_report(process, queue, timeout)
+            process.join()
+        else:
+            report  = run_config(config)
+
+        result = {key: config[key] for key in ["dataset", "frame_ids", "resolution", "num_workers", "batch_size"]}
+        result.update(report)
+        results.append(result)
+        head = ">>>  {0:<23} {1:<14} {2:>9} {3:>3} {4:>3}".format(
+            config["dataset"], ",".join(str(frame_id) for frame_id in config["frame_ids"]),
+            "{}x{}".format(*config["resolution"]), config["num_workers"], config["batch_size"])
+        if "error" in report:
+            print(head, " ", report["error"])
+        else:
+            print(head, "{0:>10.1f} {1:>9.1f} {2:>9.1f} {3:>9.0f} {4:>10.0f}".format(
+                report["samples_per_sec"], report["p50_ms"], report["p99_ms"], report["rss_main_mb"], report["rss_worker_mb"]))
+    return results
+
+
+
+# (import 문, 시간 예산 (초), import 후에 sys.modules에 없어야 하는 모듈), 예산 None은 측정만
+# 1 CPU 측정 기준 import model_loader 0.004 s, 스플릿 유틸리티 0.16 s (대부분 numpy), 데이터셋 클래스 4.9 s (torch, torchvision)
+IMPORT_BUDGET = [
+    ("import model_loader",                                           0.05, ["torch", "cv2", "matplotlib", "albumentations"]),
+    ("from model_loader import GetKITTI, GetCityscapes",              0.4,  ["torch", "cv2", "matplotlib", "albumentations"]),
+    ("from model_utility import readlines, removelines, check_split", 0.4,  ["torch", "cv2", "matplotlib", "scipy"]),
+    ("from model_loader import KITTIMonoDataset",                     None, ["matplotlib"])]
+
+
+def benchmark_imports(budget = IMPORT_BUDGET, repeat = 3):
+    """
+    import 문마다 새 인터프리터를 repeat번 띄워서 가장 짧은 시간을 예산과 비교 (인터프리터 시작 시간은 빼고 import만 잼)
+
+    returns:
+        [{"statement", "seconds", "budget", "loaded": 읽으면 안 되는데 읽힌 모듈, "ok"}, ...]
+    """
+    root    = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for statement, limit, forbidden in budget:
+        code = "import sys, time\nstart = time.perf_counter()\n{}\nprint(time.perf_counter() - start)\nprint(' '.join(sorted(sys.modules)))".format(statement)
+        runs = [subprocess.run([sys.executable, "-c", code], cwd = root, capture_output = True, text = True, check = True).stdout.splitlines()
+                for _ in range(repeat)]
+        seconds = min(float(run[0]) for run in runs)
+        modules = set(runs[0][1].split())
+        loaded  = [module for module in forbidden if module in modules]
+        results.append({"statement": statement, "seconds": seconds, "budget": limit, "loaded": loaded,
+                        "ok": not loaded and (limit is None or seconds <= limit)})
+
+    for result in results:
+        print(">>>  {0:<62} {1:>7.3f} s  budget {2:>5}  {3}".format(
+            result["statement"], result["seconds"], "-" if result["budget"] is None else result["budget"],
+            "OK" if result["ok"] else "OVER " + " ".join(result["loaded"])))
+    return results
+
+
+def benchmark_velodyne(datapath, store, keys, cam = 2, repeat = 3, tolerance = 0.01):
+    """
+    keys의 스캔마다 원본 .bin + point2depth와 VelodyneStore + load_depth를 비교
+    page cache가 따뜻한 상태의 지연 시간이므로 바이트 비율이 콜드 읽기에서의 이득에 가까움
+    int16 store는 양자화로 포인트가 옆 픽셀로 넘어갈 수 있으므로 바이트뿐 아니라 픽셀 단위 일치율도 보고
+
+    Args:
+        store:     build_velodyne_store의 경로 (또는 VelodyneStore)
+        keys:      [(folder, frame), ...]
+        tolerance: 같은 픽셀의 뎁스 차이가 이 값 (m) 이하면 일치
+
+    returns:
+        {"raw_bytes", "store_bytes": 샘플당 평균 바이트, "raw", "store": 스캔당 초, "identical": 뎁스 맵이 bit 단위로 같은 스캔 수,
+         "pixels": 두 맵 중 하나라도 뎁스가 있는 픽셀 수, "agree": 양쪽 모두 있고 차이가 tolerance 이하인 픽셀 수,
+         "only_one": 한쪽 맵에만 뎁스가 있는 픽셀 수, "max_error": 양쪽 모두 있는 픽셀의 최대 차이 (m)}
+    """
+    store  = VelodyneStore(store) if isinstance(store, str) else store
+    report = {"raw_bytes": 0.0, "store_bytes": 0.0, "raw": 0.0, "store": 0.0, "identical": 0,
+              "pixels": 0, "agree": 0, "only_one": 0, "max_error": 0.0}
+    for folder, frame in keys:
+        calib_path = os.path.join(datapath, folder.split("/")[0])
+        point_path = os.path.join(datapath, folder, "velodyne_points/data/{:010d}.bin".format(frame))
+        report["raw_bytes"]   += os.path.getsize(point_path)
+        report["store_bytes"] += store.load_points(folder, frame, cam)[0].nbytes
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            raw = point2depth(calib_path, point_path, cam)
+        report["raw"] += (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            depth = store.load_depth(datapath, folder, frame, cam)
+        report["store"] += (time.perf_counter() - start) / repeat
+
+        both   = (raw > 0) & (depth > 0)
+        error  = np.abs(raw[both] - depth[both])
+        report["identical"] += int(np.array_equal(raw, depth))
+        report["pixels"]    += int(((raw > 0) | (depth > 0)).sum())
+        report["agree"]     += int((error <= tolerance).sum())
+        report["only_one"]  += int(((raw > 0) != (depth > 0)).sum())
+        report["max_error"]  = max(report["max_error"], float(error.max()) if len(error) else 0.0)
+
+    for key in ["raw_bytes", "store_bytes", "raw", "store"]:
+        report[key] /= max(len(keys), 1)
+    pixels = max(report["pixels"], 1)
+    print(">>>  Velodyne bytes / scan :  raw {0:.0f} KB  store ({1}) {2:.0f} KB  ({3:.1f}x)".format(
+        report["raw_bytes"] / 1024, store.dtype, report["store_bytes"] / 1024, report["raw_bytes"] / max(report["store_bytes"], 1)))
+    print(">>>  Depth per scan (ms)   :  raw {0:.2f}  store {1:.2f}".format(report["raw"] * 1000, report["store"] * 1000))
+    print(">>>  Identical depth maps  :  {0} / {1}".format(report["identical"], len(keys)))
+    print(">>>  Pixel agreement       :  {0:.3f}%  (|error| <= {1} m)  only in one map {2:.3f}%  max error {3:.3f} m".format(
+        100 * report["agree"] / pixels, tolerance, 100 * report["only_one"] / pixels, report["max_error"]))
+    return report
+
+
+if __name__ == "__main__":
+    """
+    python -m model_loader.synthetic --root ./dataset/kitti_synthetic --drives 2 --frames 200
+    python -m model_loader.benchmark --kitti ./dataset/kitti_synthetic \
+        --frame_ids 0,-1,1 0,-2,-1,1,2 --resolutions 192x640 320x1024 --num_workers 0 4 --batch_sizes 8 \
+        --options '{"uint8": true}' --output ./benchmark.json
+    """
+    parser = argparse.ArgumentParser(description = "benchmark every dataset class on a (synthetic) dataset tree")
+    parser.add_argument("--kitti",       type = str, default = None)
+    parser.add_argument("--cityscapes",  type = str, default = None)
+    parser.add_argument("--datasets",    type = str, nargs = "+", default = None, choices = BENCHMARK_DATASETS)
+    parser.add_argument("--frame_ids",   type = str, nargs = "+", default = ["0,-1,1"])
+    parser.add_argument("--resolutions", type = str, nargs = "+", default = None)
+    parser.add_argument("--num_workers", type = int, nargs = "+", default = [0, 2])
+    parser.add_argument("--batch_sizes", type = int, nargs = "+", default = [8])
+    parser.add_argument("--num_batches", type = int, default = 20)
+    parser.add_argument("--kitti_ext",   type = str, default = ".jpg")
+    parser.add_argument("--city_ext",    type = str, default = ".png")
+    parser.add_argument("--timeout",     type = float, default = None, help = "seconds per config")
+    parser.add_argument("--options",     type = str, default = "{}", help = "dataset kwargs as JSON")
+    parser.add_argument("--output",      type = str, default = None)
+    args = parser.parse_args()
+
+    frame_ids   = [[frame_id if frame_id == "s" else int(frame_id) for frame_id in value.split(",")] for value in args.frame_ids]
+    resolutions = None if args.resolutions is None else [tuple(int(size) for size in value.split("x")) for value in args.resolutions]
+    results     = benchmark_datasets(args.kitti, args.cityscapes, args.datasets, frame_ids, resolutions, args.num_workers,
+                                     args.batch_sizes, args.num_batches, args.kitti_ext, args.city_ext,
+                                     timeout = args.timeout, **json.loads(args.options))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
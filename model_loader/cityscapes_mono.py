@@ -3,7 +3,6 @@ import cv2
 import random
 import numpy as np
 from PIL import Image
-from natsort import natsorted
 
 import torch
 from torch.utils.data import Dataset
@@ -19,16 +18,28 @@ else:
 from albumentations.augmentations.transforms import HorizontalFlip
 from albumentations.augmentations.transforms import ColorJitter
 from model_utility import *
+from .frame_cache import FrameCache
+from .timing import instrument
+from .pyramid import PYRAMID_MODES
+from .pyramid import build_pyramid
+from .image_store import ImageStore
 
 
 
 class CityscapesMonoDataset(Dataset):
-    def __init__(self, datapath, filename, is_training, frame_ids, mode, ext, height, width, scale = 4):
+    # 단계 이름 -> 감쌀 메서드 (또는 호출 가능한 속성), timing.instrument 참고
+    timing_stages = {"decode": "decode_image", "store": "load_stored_image", "resize": "resize_pyramid",
+                     "color": "recolor_image", "to_tensor": "numpy2tensor", "intrinsics": "preprocessing_intrinsic"}
+
+    def __init__(self, datapath, filename, is_training, frame_ids, mode, ext, height, width, scale = 4,
+                 frame_cache = 0, pyramid = "direct", draft = False,
+                 image_store = None, batch_color = False, uint8 = False, batch_constants = False,
+                 timer = None):
         super(CityscapesMonoDataset, self).__init__()
         """
         Args:
             datapath:    "./dataset/cityscapes"
-            filename:    splits file of KITTI
+            filename:    splits file of KITTI (readlines의 리스트 or SplitIndex)
             is_training: True or False
             frame_ids:   relative position list of key frame
             mode:        "train" or "val" or "test"
@@ -36,6 +47,14 @@ class CityscapesMonoDataset(Dataset):
             height:      height of image
             width:       width of image
             scale:       pyramid scale of image
+            frame_cache: 워커마다 디코딩한 프레임을 담아둘 LRU 캐시의 바이트 수 (또는 FrameCache), 0이면 사용 안 함
+            pyramid:     "direct"면 스케일마다 원본에서 리사이즈, "cascade"면 이전 스케일에서 리사이즈, "exact"면 정수배 축소를 블록 평균으로 (pyramid.py)
+            draft:       True면 JPEG를 (width, height)보다 작아지지 않는 범위에서 1/2, 1/4, 1/8 DCT 스케일로 디코딩 (PIL draft)
+            image_store: build_image_store로 만든 스케일 0 이미지 저장소 경로 (또는 ImageStore), 있으면 디코딩 + 스케일 0 리사이즈 없이 memmap에서 바로 읽음
+            batch_color: True면 워커에서 color_aug를 만들지 않음, collate 이후 augment.BatchColorJitter로 배치 단위 적용
+            uint8:       True면 color, color_aug를 [3, H, W] uint8 텐서로 반환 (IPC 바이트 1/4), 배치는 collate.images_to_float로 한 번에 변환
+            batch_constants: True면 K, inv_K (스테레오는 stereo 대신 stereo_index)를 샘플에 넣지 않음, collate.ConstantCollate가 배치마다 공유 상수로 붙임
+            timer:       timing.StageTimer, 있으면 timing_stages의 단계별 시간과 바이트를 기록 (None이면 메서드를 감싸지 않으므로 오버헤드 없음)
 
         albumentation Resize interpolation option
         0 : cv2.INTER_NEAREST, 
@@ -46,6 +65,8 @@ class CityscapesMonoDataset(Dataset):
         """
         if height % 32 != 0 or width % 32 != 0:
             raise "(H, W)는 32의 나눗셉 나머지가 0일 것, Cityscapes 권장 사이즈는 (512, 1024) or (256, 512)"
+        if pyramid not in PYRAMID_MODES:
+            raise ValueError("pyramid는 {} 중 하나".format(PYRAMID_MODES))
 
         self.datapath     = datapath
         self.filename     = filename
@@ -54,6 +75,14 @@ class CityscapesMonoDataset(Dataset):
         self.mode         = mode
         self.ext          = ext
         self.scale        = scale
+        self.frame_cache  = frame_cache if isinstance(frame_cache, FrameCache) else (FrameCache(frame_cache) if frame_cache else None)
+        self.pyramid      = pyramid
+        self.draft        = draft
+        self.image_store  = ImageStore(image_store) if isinstance(image_store, str) else image_store
+        self.batch_color  = batch_color
+        self.uint8        = uint8
+        self.batch_constants = batch_constants
+        self.timer        = timer
         self.inter        = cv2.INTER_AREA # Image.ANTIALIAS와 동등한가?
         self.side_map = {
             "l": "_leftImg8bit", 
@@ -72,6 +101,8 @@ class CityscapesMonoDataset(Dataset):
         self.scales        = list(range(scale))
         self.origin_scale  = (1024, 2048)
         self.scale_list    = [(self.height//(2**i), self.width//(2**i)) for i in self.scales]
+        if self.image_store is not None and self.image_store.shape != self.scale_list[0]:
+            raise ValueError("image_store 크기 {}와 (height, width) {}가 다름".format(self.image_store.shape, self.scale_list[0]))
 
         for scale, (height, width) in enumerate(self.scale_list):
             self.resize[scale] = Resize(
@@ -97,6 +128,9 @@ class CityscapesMonoDataset(Dataset):
         print(">>>  Interpolation     :  {0}".format(self.inter))
         print(">>>  Is training???    :  {0}".format(self.is_training))
         print(">>>  Resolution List   :  {0}".format(self.scale_list))
+        self.intrinsics = self.build_intrinsics()
+        if self.timer is not None:
+            instrument(self, self.timer)
 
 
 
@@ -108,11 +142,18 @@ class CityscapesMonoDataset(Dataset):
         numpy_image = self.resize[scale](image = numpy_image)
         return numpy_image[self.augment_key]
 
+    def resize_pyramid(self, numpy_image):
+        if self.pyramid == "direct":
+            return [self.resize_image(scale, numpy_image) for scale in self.scales]
+        return build_pyramid(numpy_image, self.scale_list, self.inter, self.pyramid)
+
     def recolor_image(self, numpy_image):
         numpy_image = self.ColorJitter(image = numpy_image)
         return numpy_image[self.augment_key]
 
     def numpy2tensor(self, numpy_image):
+        if self.uint8 == True: # [H, W, 3] uint8 -> [3, H, W] uint8, float 변환은 배치 단위로
+            return torch.from_numpy(np.ascontiguousarray(numpy_image.transpose(2, 0, 1)))
         if albumentations.__version__ == "0.5.2":
             tensor_image = self.image2tensor(image = numpy_image)
         else:
@@ -131,45 +172,98 @@ class CityscapesMonoDataset(Dataset):
     #     camera_path = os.path.join(self.datapath, self.cam, self.mode, folder_name, camera_name)
     #     return camera_path
 
-    def load_image(self, image_path, do_flip): # 이미지를 로드, 나중에 PIL로 고치기
+    def decode_image(self, image_path):
         with open(image_path, 'rb') as f:
             with Image.open(f) as img:
+                if self.draft == True: # 리사이즈 결과가 원본 디코딩과 거의 같도록 스케일 0 크기 이상으로만 줄임
+                    img.draft("RGB", (self.width, self.height))
                 image_instance = img.convert('RGB')
-                numpy_image    = np.array(image_instance)
+                return np.array(image_instance)
+
+    def load_image(self, image_path, do_flip): # 이미지를 로드, 나중에 PIL로 고치기
+        if self.frame_cache is not None:
+            return self.frame_cache.load(image_path, lambda: self.decode_image(image_path), self.flip_image, do_flip)
+
+        numpy_image = self.decode_image(image_path)
+        if do_flip == True:
+            numpy_image = self.flip_image(numpy_image)
+        return numpy_image
+
+    def load_stored_image(self, folder_name, frame_name, side, do_flip):
+        numpy_image = self.image_store.load(folder_name, frame_name, side)
+        if do_flip == True:
+            numpy_image = self.flip_image(numpy_image)
+        return numpy_image
+
+    def image_entries(self):
+        """
+        스플릿 파일과 frame_ids로 필요한 모든 프레임의 ((folder, frame, side), image_path) 리스트 (build_image_store에서 사용)
+        frame은 "aachen_000000_000019"처럼 이미지 이름 앞부분
+        """
+        keys = set()
+        for line in self.filename:
+            folder_name, key_frame, side = line.split()
+            location, frame_num, frame_index = key_frame.split("_")
+            keys |= {(folder_name, "{}_{}_{:06d}".format(location, frame_num, int(frame_index) + frame_id), side)
+                     for frame_id in self.frame_ids}
+        return [((folder, frame, side), self.get_image_path(folder, frame, side)) for folder, frame, side in sorted(keys)]
 
-                if do_flip == True:
-                    numpy_image = self.flip_image(numpy_image)
-                return numpy_image
+    def sample_paths(self, index):
+        """
+        index번째 샘플이 __getitem__에서 읽는 파일 경로 리스트 (prefetch.ReadAheadSampler가 미리 읽음)
+        image_store를 쓰면 이미지 파일은 읽지 않으므로 제외
+        """
+        folder_name, key_frame, side = split_entry(self.filename, index)
+        if self.image_store is not None:
+            return []
+        location, frame_num, frame_index = key_frame.split("_")
+        return [self.get_image_path(folder_name, "{}_{}_{:06d}".format(location, frame_num, int(frame_index) + frame_id), side)
+                for frame_id in self.frame_ids]
 
     def preprocessing_image(self, input_data, folder_name, key_frame, do_flip, side):
         """
         key_frame는 키프레임 (시퀀스의 중앙에 있을수도, 맨 뒤에 있을수도 있음)
         frame_ids가 중요한데 key_frame (키 프레임) 기준으로 상대적인 위치를 나타냄
         ex)
-        key_frame = 123, frame_ids = [-1, 0, 1]
+        key_frame = "aachen_000000_000123", frame_ids = [-1, 0, 1]
         for index in frame_ids:
-            outputs = load_image(index + key_frame)
+            outputs = load_image(index + 123)
+        위치, 시퀀스 번호는 인스턴스에 저장하지 않고 지역 변수로만 다룸 (여러 스레드에서 동시에 불러도 안전)
         """
+        location, frame_num, frame_index = key_frame.split("_")
         for frame_id in self.frame_ids:
-            relative_frame_id = "{:06d}".format(int(key_frame) + frame_id)
-            image_path  = self.get_image_path(folder_name, self.location + "_" + self.frame_num + "_" + relative_frame_id, side)
-            image_array = self.load_image(image_path, do_flip)
-            input_data.update({("color", frame_id, scale): self.resize_image(scale, image_array) for scale in self.scales})
+            relative_frame_id = "{:06d}".format(int(frame_index) + frame_id)
+            frame_name  = location + "_" + frame_num + "_" + relative_frame_id
+            if self.image_store is not None: # 스케일 0 이미지를 memmap에서 읽고, 나머지 스케일은 스케일 0에서 리사이즈
+                image_array = self.load_stored_image(folder_name, frame_name, side, do_flip)
+            else:
+                image_path  = self.get_image_path(folder_name, frame_name, side)
+                image_array = self.load_image(image_path, do_flip)
+            pyramid     = self.resize_pyramid(image_array)
+            input_data.update({("color", frame_id, scale): pyramid[scale] for scale in self.scales})
         return input_data
 
-    def preprocessing_intrinsic(self, input_data):
+    def build_intrinsics(self):
         """
+        K, inv_K는 데이터셋 설정에만 의존하므로 __init__에서 스케일마다 한 번만 계산
         1. 원본 intrinsic을 사용할 경우, "스케일링 크기 / 원본 크기" 비율을 곱해서 intrinsic을 줄여줌
         2. monodepth2의 intrinsic을 사용할 경우, 스케일링 크기만 곱해서 intrinsic을 늘려줌
         """
+        intrinsics = {}
         for scale in self.scales:
             K_copy       = self.K.copy()
             K_copy[0, :] = K_copy[0, :] * self.scale_list[scale][1]
             K_copy[1, :] = K_copy[1, :] * self.scale_list[scale][0]
             inv_K        = np.linalg.pinv(K_copy)
 
-            input_data[("K", scale)]     = torch.from_numpy(K_copy)
-            input_data[("inv_K", scale)] = torch.from_numpy(inv_K)
+            intrinsics[("K", scale)]     = torch.from_numpy(K_copy)
+            intrinsics[("inv_K", scale)] = torch.from_numpy(inv_K)
+        return intrinsics
+
+    def preprocessing_intrinsic(self, input_data):
+        if self.batch_constants == False:
+            # 샘플을 in-place로 고쳐도 캐시가 바뀌지 않도록 복사 (4x4)
+            input_data.update({key: value.clone() for key, value in self.intrinsics.items()})
         return input_data
 
 
@@ -187,19 +281,15 @@ class CityscapesMonoDataset(Dataset):
         do_flip     = self.is_training and random.random() > 0.5
         do_auge     = self.is_training and random.random() > 0.5
         
-        batch_line  = self.filename[index].split() # 폴더이름, 키프레임 인덱스, 카메라
-        folder_name = batch_line[0]
-        key_frame   = batch_line[1]
-        side        = batch_line[2]
-        self.location, self.frame_num, self.frame_index = key_frame.split("_")
+        folder_name, key_frame, side = split_entry(self.filename, index) # 폴더이름, 키프레임 이름 (aachen_000000_000019), 카메라
     
         input_data = {}
-        input_data = self.preprocessing_image(input_data, folder_name, self.frame_index, do_flip, side) 
-        if do_auge:
+        input_data = self.preprocessing_image(input_data, folder_name, key_frame, do_flip, side) 
+        if do_auge and self.batch_color == False:
             for frame_id in self.frame_ids:
                 input_data.update({("color_aug", frame_id, scale):
                     self.recolor_image(input_data[("color", frame_id, scale)]) for scale in self.scales})
-        else:
+        elif self.batch_color == False: # batch_color면 color_aug는 collate 이후 BatchColorJitter가 만듬
             for frame_id in self.frame_ids:
                 input_data.update({("color_aug", frame_id, scale):
                     input_data[("color", frame_id, scale)] for scale in self.scales})
@@ -0,0 +1,193 @@
+import torch
+from torch.utils.data import get_worker_info
+from torch.utils.data.dataloader import default_collate
+
+
+
+# SharedBatchCollate 세그먼트 안에서 키마다 시작 위치를 맞추는 bytes
+SEGMENT_ALIGNMENT = 64
+
+
+
+def densify_depth(points, shape = (375, 1242)):
+    """
+    패딩된 희소 뎁스를 뎁스 맵으로 되돌리는 함수, 소비하는 쪽에서 필요할 때만 호출
+    Args:
+        points: [B, N, 3] (u, v, z), z = 0인 행은 패딩
+        shape:  (H, W)
+
+    returns:
+        [B, 1, H, W] float32
+    """
+    batch_size = points.shape[0]
+    depth      = torch.zeros((batch_size, 1) + tuple(shape), dtype = points.dtype, device = points.device)
+    valid      = points[..., 2] > 0
+    batch      = torch.arange(batch_size, device = points.device)[:, None].expand_as(valid)[valid]
+    u          = points[..., 0][valid].long()
+    v          = points[..., 1][valid].long()
+    depth[batch, 0, v, u] = points[..., 2][valid]
+    return depth
+
+
+def images_to_float(inputs, keys = ("color", "color_aug")):
+    """
+    uint8 = True로 만든 배치의 [B, 3, H, W] uint8 이미지를 키마다 한 번에 float32 (0 ~ 1)로 변환
+    GPU로 옮긴 뒤에 부르면 pinned memory, H2D 복사량도 1/4로 줄어듬
+
+    ex)
+    inputs = {key: value.to(device, non_blocking = True) for key, value in inputs.items()}
+    inputs = images_to_float(inputs)
+    """
+    for key, value in inputs.items():
+        if isinstance(key, tuple) and key[0] in keys and value.dtype == torch.uint8:
+            inputs[key] = value.float().div_(255.0)
+    return inputs
+
+
+def pad_points(values):
+    """
+    [N_i, 3] (u, v, z) 텐서들을 가장 긴 N에 맞춰 z = 0으로 패딩해서 [B, N, 3]으로 묶음
+    """
+    length = max(value.shape[0] for value in values)
+    points = torch.zeros((len(values), length, 3), dtype = torch.float32)
+    for index, value in enumerate(values):
+        points[index, :value.shape[0]] = value
+    return points
+
+
+class SparseDepthCollate(object):
+    def __init__(self, densify = False, shape = (375, 1242)):
+        """
+        depth_mode = "sparse"로 만든 샘플을 배치로 묶는 collate_fn
+        ("depth", ...) 키의 [N_i, 3] (u, v, z) 텐서는 배치에서 가장 긴 N에 맞춰 z = 0으로 패딩하고
+        나머지 키는 default_collate로 묶음
+
+        Args:
+            densify: True면 워커 안에서 바로 [B, 1, H, W] 뎁스 맵으로 변환 (IPC 절감 효과는 없어짐)
+            shape:   densify할 뎁스 맵 모양 (H, W)
+
+        ex)
+        DataLoader(dataset, batch_size, True, num_workers = 4, collate_fn = SparseDepthCollate())
+        """
+        self.densify = densify
+        self.shape   = shape
+
+
+    def __call__(self, batch):
+        depth_keys = [key for key in batch[0] if isinstance(key, tuple) and key[0] == "depth"]
+        outputs    = default_collate([{key: value for key, value in sample.items() if key not in depth_keys} for sample in batch])
+
+        for key in depth_keys:
+            points       = pad_points([sample[key] for sample in batch])
+            outputs[key] = densify_depth(points, self.shape) if self.densify else points
+        return outputs
+
+
+
+class SharedBatchCollate(object):
+    def __init__(self, batch_size, densify = False, shape = (375, 1242)):
+        """
+        첫 배치에서 샘플 구조 (키마다 모양, dtype)를 배우고, 배치마다 모든 키를 공유 메모리 세그먼트 하나에 이어서 써 넣는 collate_fn
+        default_collate는 워커 안에서 키마다 공유 메모리를 따로 만들어서 메인 프로세스로 키 수만큼 fd를 넘기지만
+        이 collate는 배치당 세그먼트 하나, fd 하나만 넘김 (키가 40개 넘는 스테레오 샘플에서 IPC 비용이 크게 줄어듬)
+
+        세그먼트는 배치마다 새로 만들고 다시 쓰지 않음, 메인 프로세스가 배치를 언제 놓는지는 워커에서 알 수 없기 때문
+        DataLoader 워커가 아니면 (num_workers = 0, ThreadedLoader) 넘길 fd가 없으므로 세그먼트 없이 default_collate로 묶음
+        모양이 샘플마다 다른 키는 세그먼트에 넣지 않음 (sparse 뎁스는 SparseDepthCollate와 같이 패딩, 나머지는 default_collate)
+
+        Args:
+            batch_size: DataLoader의 batch_size
+            densify:    sparse 뎁스를 [B, 1, H, W]로 변환 (SparseDepthCollate와 같음)
+            shape:      densify할 뎁스 맵 모양 (H, W)
+
+        ex)
+        DataLoader(dataset, 8, True, num_workers = 4, collate_fn = SharedBatchCollate(8))
+        """
+        self.batch_size = batch_size
+        self.densify    = densify
+        self.shape      = shape
+        self.schema     = None
+
+
+    def learn_schema(self, batch):
+        """
+        returns:
+            {key: (모양, dtype)}, 첫 배치의 모든 샘플에서 모양이 같은 텐서 키만
+        """
+        schema = {}
+        for key, value in batch[0].items():
+            if not torch.is_tensor(value):
+                continue
+            if all(torch.is_tensor(sample.get(key)) and sample[key].shape == value.shape for sample in batch):
+                schema[key] = (tuple(value.shape), value.dtype)
+        return schema
+
+    def allocate(self, keys, batch_size):
+        """
+        keys를 [batch_size, ...]로 담을 공유 메모리 세그먼트 하나를 만들고 키마다 그 안의 view를 반환
+        키마다 시작 위치는 SEGMENT_ALIGNMENT bytes 배수 (dtype view를 위해)
+        """
+        offsets = []
+        nbytes  = 0
+        for key in keys:
+            shape, dtype = self.schema[key]
+            offsets.append(nbytes)
+            nbytes += -(-batch_size * torch.Size(shape).numel() * dtype.itemsize // SEGMENT_ALIGNMENT) * SEGMENT_ALIGNMENT
+        segment = torch.empty(max(nbytes, 1), dtype = torch.uint8).share_memory_()
+        buffers = {}
+        for key, offset in zip(keys, offsets):
+            shape, dtype = self.schema[key]
+            size         = batch_size * torch.Size(shape).numel() * dtype.itemsize
+            buffers[key] = segment[offset: offset + size].view(dtype).view((batch_size,) + shape)
+        return buffers
+
+
+    def __call__(self, batch):
+        if self.schema is None:
+            self.schema = self.learn_schema(batch)
+
+        keys    = [key for key in batch[0] if key in self.schema and len(batch) <= self.batch_size and
+                   all(sample[key].shape == self.schema[key][0] and sample[key].dtype == self.schema[key][1] for sample in batch)]
+        buffers = self.allocate(keys, len(batch)) if get_worker_info() is not None else {}
+        outputs = {}
+        for key in batch[0]:
+            values = [sample[key] for sample in batch]
+            if key in buffers:
+                outputs[key] = torch.stack(values, out = buffers[key])
+            elif key not in keys and isinstance(key, tuple) and key[0] == "depth" and values[0].dim() == 2:
+                points       = pad_points(values)
+                outputs[key] = densify_depth(points, self.shape) if self.densify else points
+            else:
+                outputs[key] = default_collate(values)
+        return outputs
+
+
+
+class ConstantCollate(object):
+    def __init__(self, dataset, collate_fn = default_collate):
+        """
+        batch_constants = True로 만든 샘플을 묶은 뒤, 데이터셋에 미리 계산된 상수를 배치에 붙이는 collate_fn
+        ("K", scale), ("inv_K", scale)은 B개를 stack하지 않고 [B, 4, 4] expand view (복사 없음, stride 0)로 붙이고
+        (데이터셋의 캐시와 메모리를 공유하므로 배치의 K, inv_K를 in-place로 고치려면 먼저 clone)
+        "stereo"는 샘플의 stereo_index로 데이터셋의 stereo_table [4, 4, 4]에서 골라서 만듬
+
+        Args:
+            dataset:    batch_constants = True인 데이터셋 (intrinsics, 스테레오면 stereo_table을 사용)
+            collate_fn: 나머지 키를 묶을 collate (default_collate, SparseDepthCollate, SharedBatchCollate)
+
+        ex)
+        DataLoader(dataset, 8, True, num_workers = 4, collate_fn = ConstantCollate(dataset, SharedBatchCollate(8)))
+        """
+        self.intrinsics   = dataset.intrinsics
+        self.stereo_table = getattr(dataset, "stereo_table", None)
+        self.collate_fn   = collate_fn
+
+
+    def __call__(self, batch):
+        outputs    = self.collate_fn(batch)
+        batch_size = len(batch)
+        for key, value in self.intrinsics.items():
+            outputs[key] = value.expand((batch_size,) + tuple(value.shape))
+        if "stereo_index" in outputs:
+            outputs["stereo"] = self.stereo_table[outputs.pop("stereo_index")]
+        return outputs
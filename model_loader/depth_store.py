@@ -0,0 +1,152 @@
+import os
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from model_utility import *
+
+
+
+# 포인트 하나 = (row, col, depth) 8 bytes
+POINT_DTYPE = np.dtype([("row", "<u2"), ("col", "<u2"), ("depth", "<f4")])
+
+
+def project_entry(args):
+    """
+    (datapath, folder, frame, cam) 하나를 사영해서 유효한 픽셀의 (row, col, depth)와 뎁스 맵 모양을 반환
+    multiprocessing.Pool에 넘기기 위해 모듈 함수로 둠
+    """
+    datapath, folder, frame, cam = args
+    calib_path = os.path.join(datapath, folder.split("/")[0])
+    point_path = os.path.join(datapath, folder, "velodyne_points/data/{:010d}.bin".format(frame))
+    depth      = point2depth(calib_path, point_path, cam)
+
+    rows, cols      = np.nonzero(depth > 0)
+    points          = np.empty(len(rows), dtype = POINT_DTYPE)
+    points["row"]   = rows
+    points["col"]   = cols
+    points["depth"] = depth[rows, cols]
+    return points, depth.shape
+
+
+def build_depth_store(datapath, filename, store_path, cams = (2, 3), num_workers = 0):
+    """
+    스플릿 파일에 등장하는 모든 스캔을 한 번만 사영해서 희소 (row, col, depth) 형태로 저장하는 함수
+    Args:
+        datapath:    "./dataset/kitti"
+        filename:    splits file of KITTI
+        store_path:  "./dataset/kitti_depth/eigen_zhou" 저장할 폴더
+        cams:        저장할 카메라, 스테레오 데이터셋은 반대쪽 카메라도 필요하므로 기본 값은 (2, 3)
+        num_workers: 0이면 현재 프로세스에서, 아니면 Pool(num_workers)로 사영
+
+    store 구조
+        points.bin   POINT_DTYPE 배열, 모든 엔트리의 포인트를 이어 붙임 (np.memmap)
+        offsets.npy  [N + 1] int64, 엔트리 i의 포인트는 points[offsets[i]: offsets[i + 1]]
+        shapes.npy   [N, 2] int32, 엔트리 i의 뎁스 맵 모양 (날짜마다 다름)
+        index.txt    엔트리 i의 "folder frame cam"
+    """
+    keys    = sorted({(line.split()[0], int(line.split()[1])) for line in filename})
+    entries = [(datapath, folder, frame, cam) for folder, frame in keys for cam in cams]
+
+    os.makedirs(store_path, exist_ok = True)
+    offsets = np.zeros(len(entries) + 1, dtype = np.int64)
+    shapes  = np.zeros((len(entries), 2), dtype = np.int32)
+
+    pool    = Pool(num_workers) if num_workers > 0 else None
+    results = pool.imap(project_entry, entries, chunksize = 16) if pool else map(project_entry, entries)
+    with open(os.path.join(store_path, "points.bin"), "wb") as f:
+        for index, (points, shape) in enumerate(results):
+            f.write(points.tobytes())
+            offsets[index + 1] = offsets[index] + len(points)
+            shapes[index]      = shape
+    if pool:
+        pool.close()
+        pool.join()
+
+    np.save(os.path.join(store_path, "offsets.npy"), offsets)
+    np.save(os.path.join(store_path, "shapes.npy"), shapes)
+    savelines(["{} {} {}".format(folder, frame, cam) for _, folder, frame, cam in entries],
+              os.path.join(store_path, "index.txt"))
+
+    print(">>>  Depth store entries   :  {0}".format(len(entries)))
+    print(">>>  Depth store points    :  {0}".format(offsets[-1]))
+    print(">>>  Depth store size (MB) :  {0:.1f}".format(offsets[-1] * POINT_DTYPE.itemsize / 2**20))
+    return store_path
+
+
+
+class DepthStore(object):
+    def __init__(self, store_path):
+        """
+        build_depth_store로 만든 GT 뎁스 저장소를 읽는 클래스
+        points.bin은 np.memmap으로 열기 때문에 DataLoader 워커들이 같은 page cache를 공유함
+        pickle (spawn, forkserver 워커)에는 memmap 대신 경로만 넘기고 받은 쪽에서 다시 열음
+
+        Args:
+            store_path: build_depth_store의 store_path
+        """
+        self.store_path = store_path
+        self.offsets    = np.load(os.path.join(store_path, "offsets.npy"))
+        self.points     = self.open_memmap()
+        self.shapes     = np.load(os.path.join(store_path, "shapes.npy"))
+        self.index      = {}
+        for entry, line in enumerate(readlines(os.path.join(store_path, "index.txt"))):
+            folder, frame, cam = line.split()
+            self.index[(folder, int(frame), int(cam))] = entry
+
+
+    def open_memmap(self):
+        if self.offsets[-1] == 0: # 크기가 0인 파일은 memmap으로 열 수 없음
+            return np.zeros(0, dtype = POINT_DTYPE)
+        return np.memmap(os.path.join(self.store_path, "points.bin"), dtype = POINT_DTYPE, mode = "r")
+
+    def __getstate__(self):
+        state = self.__dict__.copy() # np.memmap을 pickle하면 파일 내용 전체가 직렬화됨
+        state["points"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.points = self.open_memmap()
+
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+
+    def load_points(self, folder, frame, cam):
+        """
+        returns:
+            (row, col, depth) 구조체 배열 (memmap의 view, 복사 없음), 뎁스 맵 모양
+        """
+        entry = self.index[(folder, int(frame), int(cam))]
+        return self.points[self.offsets[entry]: self.offsets[entry + 1]], tuple(self.shapes[entry])
+
+    def load(self, folder, frame, cam):
+        """
+        point2depth(calib_path, point_path, cam)와 같은 뎁스 맵을 반환 (뎁스 값은 float32 정밀도)
+        """
+        points, shape = self.load_points(folder, frame, cam)
+        depth = np.zeros(shape)
+        depth[points["row"], points["col"]] = points["depth"]
+        return depth
+
+
+
+if __name__ == "__main__":
+    """
+    python -m model_loader.depth_store \
+        --datapath ./dataset/kitti --split ./splits/kitti_eigen_zhou/train_files.txt \
+        --store ./dataset/kitti_depth/eigen_zhou_train --num_workers 8
+    """
+    parser = argparse.ArgumentParser(description = "precompute KITTI GT depth for a split file")
+    parser.add_argument("--datapath",    type = str, required = True)
+    parser.add_argument("--split",       type = str, required = True)
+    parser.add_argument("--store",       type = str, required = True)
+    parser.add_argument("--cams",        type = int, nargs = "+", default = [2, 3])
+    parser.add_argument("--num_workers", type = int, default = 0)
+    args = parser.parse_args()
+
+    build_depth_store(args.datapath, readlines(args.split), args.store, tuple(args.cams), args.num_workers)
@@ -0,0 +1,131 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+
+import torch
+from torch.utils.data import get_worker_info
+
+
+
+def frame_nbytes(frame):
+    """
+    디코딩된 프레임이 차지하는 바이트 수, numpy 배열과 PIL 이미지 모두 지원
+    """
+    if isinstance(frame, np.ndarray):
+        return frame.nbytes
+    return frame.width * frame.height * len(frame.getbands())
+
+
+class FrameCache(object):
+    def __init__(self, max_bytes, flipped = False, max_workers = 64):
+        """
+        디코딩된 프레임을 담아두는 바이트 기준 LRU 캐시
+        frame_ids = [-1, 0, 1]이면 "drive 473 l"과 "drive 474 l"이 같은 JPEG를 두 번씩 디코딩하므로
+        워커마다 최근 프레임을 들고 있다가 이웃 샘플에서 재사용
+
+        캐시 내용은 워커마다 따로 (fork 이후 각자 채움), hit / miss 카운터는 공유 메모리 텐서라서
+        메인 프로세스에서 stats()를 부르면 모든 워커의 합계를 볼 수 있음
+        ThreadedLoader처럼 한 프로세스의 여러 스레드가 같이 쓰는 경우를 위해 조회 / 삽입은 lock으로 보호 (디코딩은 lock 밖에서)
+
+        Args:
+            max_bytes:   워커 하나가 들고 있을 최대 바이트 수
+            flipped:     True면 좌우 반전된 프레임도 따로 캐싱 (메모리를 더 쓰는 대신 반전 연산도 생략)
+            max_workers: 카운터를 둘 최대 워커 수, 메인 프로세스 (num_workers = 0)는 0번 행을 사용, DataLoader의 num_workers 이상이어야 함 (아니면 ValueError)
+        """
+        self.max_bytes = max_bytes
+        self.flipped   = flipped
+        self.frames    = OrderedDict()
+        self.nbytes    = 0
+        # 워커별 [hit, miss, hit으로 아낀 바이트, 디코딩한 바이트]
+        self.counters  = torch.zeros((max_workers + 1, 4), dtype = torch.int64).share_memory_()
+        self.lock      = threading.Lock()
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy() # spawn 워커로 넘길 때 lock은 pickle할 수 없으므로 새로 만듬
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+    def counter(self):
+        worker_info = get_worker_info()
+        worker      = 0 if worker_info is None else worker_info.id + 1
+        if worker >= len(self.counters): # 행을 같이 쓰면 프로세스 사이의 += 갱신이 서로 덮어씀
+            raise ValueError("워커 {}번의 카운터가 없음, FrameCache(max_bytes, max_workers = num_workers 이상)를 데이터셋에 넘길 것".format(worker_info.id))
+        return self.counters[worker]
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+        return frame
+
+    def put(self, key, frame):
+        nbytes = frame_nbytes(frame)
+        if nbytes > self.max_bytes:
+            return frame
+        if isinstance(frame, np.ndarray):
+            frame.setflags(write = False) # 캐싱된 배열을 누군가 제자리에서 수정하면 이웃 샘플이 오염됨
+        if key in self.frames:
+            self.nbytes -= frame_nbytes(self.frames.pop(key))
+
+        self.frames[key] = frame
+        self.nbytes     += nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted   = self.frames.popitem(last = False)
+            self.nbytes -= frame_nbytes(evicted)
+        return frame
+
+
+    def load(self, key, decode, flip, do_flip):
+        """
+        Args:
+            key:     이미지 경로 (drive, side, frame과 1:1 대응)
+            decode:  캐시에 없을 때 프레임을 디코딩하는 함수, decode() -> frame
+            flip:    좌우 반전 함수, flip(frame) -> frame
+            do_flip: 반전 여부
+        """
+        if self.flipped:
+            key = (key, do_flip)
+
+        counter = self.counter()
+        with self.lock:
+            frame = self.get(key)
+            if frame is not None:
+                counter[0] += 1
+                counter[2] += frame_nbytes(frame)
+        if frame is None: # 여러 스레드가 같은 프레임을 동시에 놓치면 각자 디코딩하고 마지막 것이 남음
+            frame = decode()
+            if self.flipped and do_flip == True:
+                frame = flip(frame)
+            with self.lock:
+                counter[1] += 1
+                counter[3] += frame_nbytes(frame)
+                frame = self.put(key, frame)
+
+        if do_flip == True and not self.flipped:
+            frame = flip(frame)
+        return frame
+
+
+    def stats(self):
+        """
+        returns:
+            모든 워커의 hit / miss 합계와 hit rate, 그리고 현재 프로세스의 캐시 상태
+        """
+        hits, misses, saved_bytes, decoded_bytes = [int(value) for value in self.counters.sum(dim = 0)]
+        return {
+            "hits":          hits,
+            "misses":        misses,
+            "hit_rate":      hits / max(hits + misses, 1),
+            "saved_bytes":   saved_bytes,
+            "decoded_bytes": decoded_bytes,
+            "frames":        len(self.frames),
+            "bytes":         self.nbytes}
+
+    def reset_stats(self):
+        self.counters.zero_()
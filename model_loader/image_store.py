@@ -0,0 +1,145 @@
+import os
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from model_utility import *
+
+
+
+# encode_entry가 사용하는 데이터셋, Pool 워커에는 initializer로 한 번만 넘김
+DATASET = None
+
+
+def set_dataset(dataset):
+    global DATASET
+    DATASET = dataset
+
+
+def encode_entry(args):
+    """
+    (key, image_path) 하나를 데이터셋과 같은 경로 (decode_image -> 스케일 0 resize_image)로 uint8 [H, W, 3]로 만듬
+    multiprocessing.Pool에 넘기기 위해 모듈 함수로 둠
+    """
+    key, image_path = args
+    return DATASET.resize_image(0, DATASET.decode_image(image_path))
+
+
+def build_image_store(dataset, store_path, num_workers = 0):
+    """
+    스플릿 파일과 frame_ids로 필요한 모든 프레임을 스케일 0 크기로 한 번만 디코딩 + 리사이즈해서 저장하는 함수
+    Args:
+        dataset:     KITTIMonoDataset or CityscapesMonoDataset (datapath, filename, frame_ids, height, width가 정해진 상태)
+        store_path:  "./dataset/kitti_image/eigen_zhou_192x640" 저장할 폴더
+        num_workers: 0이면 현재 프로세스에서, 아니면 Pool(num_workers)로 디코딩
+
+    store 구조
+        images.bin   [N, H, W, 3] uint8, 엔트리 i의 이미지는 images[i] (np.memmap)
+        shape.npy    [H, W] 스케일 0 크기
+        index.txt    엔트리 i의 "folder frame side"
+    """
+    entries = dataset.image_entries()
+    height, width = dataset.scale_list[0]
+
+    os.makedirs(store_path, exist_ok = True)
+    pool    = Pool(num_workers, initializer = set_dataset, initargs = (dataset,)) if num_workers > 0 else None
+    if pool is None:
+        set_dataset(dataset)
+    results = pool.imap(encode_entry, entries, chunksize = 16) if pool else map(encode_entry, entries)
+    with open(os.path.join(store_path, "images.bin"), "wb") as f:
+        for image in results:
+            f.write(np.ascontiguousarray(image, dtype = np.uint8).tobytes())
+    if pool:
+        pool.close()
+        pool.join()
+
+    np.save(os.path.join(store_path, "shape.npy"), np.array([height, width], dtype = np.int32))
+    savelines([" ".join(key) for key, _ in entries], os.path.join(store_path, "index.txt"))
+
+    print(">>>  Image store entries   :  {0}".format(len(entries)))
+    print(">>>  Image store shape     :  {0}".format((height, width, 3)))
+    print(">>>  Image store size (MB) :  {0:.1f}".format(len(entries) * height * width * 3 / 2**20))
+    return store_path
+
+
+
+class ImageStore(object):
+    def __init__(self, store_path):
+        """
+        build_image_store로 만든 스케일 0 이미지 저장소를 읽는 클래스
+        images.bin은 np.memmap으로 열기 때문에 DataLoader 워커들이 같은 page cache를 공유하고, load는 복사 없이 슬라이스만 반환
+        pickle (spawn, forkserver 워커)에는 memmap 대신 경로만 넘기고 받은 쪽에서 다시 열음 (워커마다 저장소 전체를 메모리로 복사하지 않음)
+
+        Args:
+            store_path: build_image_store의 store_path
+        """
+        self.store_path = store_path
+        self.shape      = tuple(int(size) for size in np.load(os.path.join(store_path, "shape.npy")))
+        self.index      = {}
+        for entry, line in enumerate(readlines(os.path.join(store_path, "index.txt"))):
+            folder, frame, side = line.split()
+            self.index[(folder, frame, side)] = entry
+        self.images     = self.open_memmap()
+
+
+    def open_memmap(self):
+        if not self.index:
+            return None
+        return np.memmap(os.path.join(self.store_path, "images.bin"), dtype = np.uint8, mode = "r",
+                         shape = (len(self.index),) + self.shape + (3,))
+
+    def __getstate__(self):
+        state = self.__dict__.copy() # np.memmap을 pickle하면 파일 내용 전체가 직렬화됨
+        state["images"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.images = self.open_memmap()
+
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        folder, frame, side = key
+        return (folder, str(frame), side) in self.index
+
+
+    def load(self, folder, frame, side):
+        """
+        returns:
+            [H, W, 3] uint8 (memmap의 view, 복사 없음, 읽기 전용)
+        """
+        return self.images[self.index[(folder, str(frame), side)]]
+
+
+
+if __name__ == "__main__":
+    """
+    python -m model_loader.image_store --dataset kitti \
+        --datapath ./dataset/kitti --split ./splits/kitti_eigen_zhou/train_files.txt \
+        --frame_ids 0 -1 1 --height 192 --width 640 --store ./dataset/kitti_image/eigen_zhou_train_192x640 --num_workers 8
+    """
+    from .kitti_mono import KITTIMonoDataset
+    from .cityscapes_mono import CityscapesMonoDataset
+
+    parser = argparse.ArgumentParser(description = "precompute scale 0 images for a split file")
+    parser.add_argument("--dataset",     type = str, default = "kitti", choices = ["kitti", "cityscapes"])
+    parser.add_argument("--datapath",    type = str, required = True)
+    parser.add_argument("--split",       type = str, required = True)
+    parser.add_argument("--store",       type = str, required = True)
+    parser.add_argument("--frame_ids",   type = int, nargs = "+", default = [0, -1, 1])
+    parser.add_argument("--height",      type = int, default = 192)
+    parser.add_argument("--width",       type = int, default = 640)
+    parser.add_argument("--ext",         type = str, default = ".jpg")
+    parser.add_argument("--mode",        type = str, default = "train", help = "Cityscapes split folder")
+    parser.add_argument("--num_workers", type = int, default = 0)
+    args = parser.parse_args()
+
+    if args.dataset == "kitti":
+        dataset = KITTIMonoDataset(
+            args.datapath, readlines(args.split), False, args.frame_ids, args.height, args.width, args.ext)
+    else:
+        dataset = CityscapesMonoDataset(
+            args.datapath, readlines(args.split), False, args.frame_ids, args.mode, args.ext, args.height, args.width)
+    build_image_store(dataset, args.store, args.num_workers)
@@ -19,22 +19,49 @@ from albumentations.augmentations.transforms import HorizontalFlip
 from albumentations.augmentations.transforms import ColorJitter
 from skimage.transform import resize
 from model_utility import *
+from .frame_cache import FrameCache
+from .timing import instrument
+from .pyramid import PYRAMID_MODES
+from .pyramid import build_pyramid
+from .image_store import ImageStore
+from .depth_store import DepthStore
+from .velodyne_store import VelodyneStore
+from .augment import jitter_image
 
 
 
 class KITTIMonoDataset(Dataset):
-    def __init__(self, datapath, filename, is_training, frame_ids, height, width, ext = "jpg", scale = 4):
+    # 단계 이름 -> 감쌀 메서드 (또는 호출 가능한 속성), timing.instrument 참고
+    timing_stages = {"decode": "decode_image", "store": "load_stored_image", "resize": "resize_pyramid",
+                     "color": "recolor_image", "to_tensor": "numpy2tensor", "depth": "load_point", "intrinsics": "preprocessing_intrinsic"}
+
+    def __init__(self, datapath, filename, is_training, frame_ids, height, width, ext = "jpg", scale = 4,
+                 depth_store = None, depth_mode = "dense", frame_cache = 0, pyramid = "direct", draft = False,
+                 image_store = None, batch_color = False, uint8 = False, batch_constants = False,
+                 validate = False, timer = None, velodyne_store = None):
         super(KITTIMonoDataset, self).__init__()
         """
         Args:
             datapath:    "./dataset/kitti"
-            filename:    splits file of KITTI
+            filename:    splits file of KITTI (readlines의 리스트 or SplitIndex)
             is_training: True or False
             frame_ids:   relative position list of key frame
             ext:         ".jpg" or ".png"
             height:      height of image
             width:       width of image
             scale:       pyramid scale of image
+            depth_store: build_depth_store로 만든 저장소 경로 (또는 DepthStore), None이면 매번 포인트 클라우드를 사영
+            depth_mode:  "dense"면 [1, H, W] 뎁스 맵, "sparse"면 유효한 픽셀의 [N, 3] (u, v, z), 배치는 collate.SparseDepthCollate로 묶음
+            frame_cache: 워커마다 디코딩한 프레임을 담아둘 LRU 캐시의 바이트 수 (또는 FrameCache), 0이면 사용 안 함
+            pyramid:     "direct"면 스케일마다 원본에서 리사이즈, "cascade"면 이전 스케일에서 리사이즈, "exact"면 정수배 축소를 블록 평균으로 (pyramid.py)
+            draft:       True면 JPEG를 (width, height)보다 작아지지 않는 범위에서 1/2, 1/4, 1/8 DCT 스케일로 디코딩 (PIL draft)
+            image_store: build_image_store로 만든 스케일 0 이미지 저장소 경로 (또는 ImageStore), 있으면 디코딩 + 스케일 0 리사이즈 없이 memmap에서 바로 읽음
+            batch_color: True면 워커에서 color_aug를 만들지 않음, collate 이후 augment.BatchColorJitter로 배치 단위 적용
+            uint8:       True면 color, color_aug를 [3, H, W] uint8 텐서로 반환 (IPC 바이트 1/4), 배치는 collate.images_to_float로 한 번에 변환
+            batch_constants: True면 K, inv_K (스테레오는 stereo 대신 stereo_index)를 샘플에 넣지 않음, collate.ConstantCollate가 배치마다 공유 상수로 붙임
+            validate:    True면 생성할 때 frame_ids가 요구하는 모든 이미지와 (depth_store, velodyne_store가 없으면) 키 프레임의 벨로다인 파일이 있는지 확인, 없으면 ValueError
+            timer:       timing.StageTimer, 있으면 timing_stages의 단계별 시간과 바이트를 기록 (None이면 메서드를 감싸지 않으므로 오버헤드 없음)
+            velodyne_store: build_velodyne_store로 만든 frustum 포인트 저장소 경로 (또는 VelodyneStore), depth_store가 없을 때 벨로다인 .bin 대신 memmap에서 읽어서 사영
         
         interpolation 1은 쓰지 말 것, 성능이 나오지 않음, 0 아니면 3으로 실험
         (albumentation Resize interpolation option)
@@ -46,6 +73,10 @@ class KITTIMonoDataset(Dataset):
         """
         if height % 32 != 0 or width % 32 != 0:
             raise "(H, W)는 32의 나눗셉 나머지가 0일 것, KITTI 권장 사이즈는 (320, 1024) or (192, 640)"
+        if pyramid not in PYRAMID_MODES:
+            raise ValueError("pyramid는 {} 중 하나".format(PYRAMID_MODES))
+        if depth_mode not in ["dense", "sparse"]:
+            raise ValueError("depth_mode는 'dense' or 'sparse'")
             
         self.datapath     = datapath
         self.filename     = filename
@@ -55,6 +86,21 @@ class KITTIMonoDataset(Dataset):
         self.width        = width
         self.ext          = ext
         self.scale        = scale
+        self.depth_store  = DepthStore(depth_store) if isinstance(depth_store, str) else depth_store
+        self.depth_mode   = depth_mode
+        self.frame_cache  = frame_cache if isinstance(frame_cache, FrameCache) else (FrameCache(frame_cache) if frame_cache else None)
+        self.pyramid      = pyramid
+        self.draft        = draft
+        self.image_store  = ImageStore(image_store) if isinstance(image_store, str) else image_store
+        self.batch_color  = batch_color
+        self.uint8        = uint8
+        self.batch_constants = batch_constants
+        self.validate     = validate
+        self.timer        = timer
+        self.velodyne_store = VelodyneStore(velodyne_store) if isinstance(velodyne_store, str) else velodyne_store
+        load_calibrations(self.datapath, self.filename) # 워커 fork 전에 날짜별 캘리브레이션을 한 번만 파싱
+        if self.validate == True:
+            check_split(self.datapath, self.filename, self.frame_ids, velodyne = self.depth_store is None and self.velodyne_store is None)
         
         self.inter        = cv2.INTER_AREA # Image.ANTIALIAS와 동등한가?
         self.side_map     = {"2": 2, "3": 3, "l": 2, "r": 3}
@@ -68,6 +114,8 @@ class KITTIMonoDataset(Dataset):
         self.origin_scale  = (375, 1242)
         self.resize_scale  = (self.height, self.width) # 권장 스케일 (320, 1024), (192, 640)
         self.scale_list    = [(self.height//(2**i), self.width//(2**i)) for i in self.scales]
+        if self.image_store is not None and self.image_store.shape != self.scale_list[0]:
+            raise ValueError("image_store 크기 {}와 (height, width) {}가 다름".format(self.image_store.shape, self.scale_list[0]))
 
         self.resize        = {}
         for scale, (height, width) in enumerate(self.scale_list):
@@ -92,6 +140,9 @@ class KITTIMonoDataset(Dataset):
         print(">>>  Interpolation     :  {0}".format(self.inter))
         print(">>>  Is training???    :  {0}".format(self.is_training))
         print(">>>  Resolution List   :  {0}".format(self.scale_list))
+        self.intrinsics = self.build_intrinsics()
+        if self.timer is not None:
+            instrument(self, self.timer)
 
 
     def flip_image(self, numpy_image):
@@ -102,11 +153,18 @@ class KITTIMonoDataset(Dataset):
         numpy_image = self.resize[scale](image = numpy_image)
         return numpy_image[self.augment_key]
 
+    def resize_pyramid(self, numpy_image):
+        if self.pyramid == "direct":
+            return [self.resize_image(scale, numpy_image) for scale in self.scales]
+        return build_pyramid(numpy_image, self.scale_list, self.inter, self.pyramid)
+
     def recolor_image(self, numpy_image):
         numpy_image = self.ColorJitter(image = numpy_image)
         return numpy_image[self.augment_key]
 
     def numpy2tensor(self, numpy_image):
+        if self.uint8 == True: # [H, W, 3] uint8 -> [3, H, W] uint8, float 변환은 배치 단위로
+            return torch.from_numpy(np.ascontiguousarray(numpy_image.transpose(2, 0, 1)))
         if albumentations.__version__ == "0.5.2":
             tensor_image = self.image2tensor(image = numpy_image)
         else:
@@ -127,19 +185,54 @@ class KITTIMonoDataset(Dataset):
         point_path = os.path.join(self.datapath, folder_name, point_name)
         return calib_path, point_path
 
-    def load_image(self, image_path, do_flip): # 이미지를 로드, 나중에 PIL로 고치기
+    def decode_image(self, image_path):
         with open(image_path, 'rb') as f:
             with Image.open(f) as img:
+                if self.draft == True: # 리사이즈 결과가 원본 디코딩과 거의 같도록 스케일 0 크기 이상으로만 줄임
+                    img.draft("RGB", (self.width, self.height))
                 image_instance = img.convert('RGB')
-                numpy_image    = np.array(image_instance)
+                return np.array(image_instance)
+
+    def load_image(self, image_path, do_flip): # 이미지를 로드, 나중에 PIL로 고치기
+        if self.frame_cache is not None:
+            return self.frame_cache.load(image_path, lambda: self.decode_image(image_path), self.flip_image, do_flip)
 
-                if do_flip == True:
-                    numpy_image = self.flip_image(numpy_image)
-                return numpy_image
+        numpy_image = self.decode_image(image_path)
+        if do_flip == True:
+            numpy_image = self.flip_image(numpy_image)
+        return numpy_image
 
-    def load_point(self, calib_path, point_path, side, do_flip):
+    def load_stored_image(self, folder_name, frame_index, side, do_flip):
+        numpy_image = self.image_store.load(folder_name, frame_index, side)
+        if do_flip == True:
+            numpy_image = self.flip_image(numpy_image)
+        return numpy_image
+
+    def image_entries(self):
+        """
+        스플릿 파일과 frame_ids로 필요한 모든 프레임의 ((folder, frame, side), image_path) 리스트 (build_image_store에서 사용)
+        """
+        keys = sorted({(line.split()[0], int(line.split()[1]) + frame_id, line.split()[2])
+                       for line in self.filename for frame_id in self.frame_ids})
+        return [((folder, str(frame), side), self.get_image_path(folder, frame, side)) for folder, frame, side in keys]
+
+    def sample_paths(self, index):
+        """
+        index번째 샘플이 __getitem__에서 읽는 파일 경로 리스트 (prefetch.ReadAheadSampler가 미리 읽음)
+        image_store, depth_store, velodyne_store를 쓰면 그 파일들은 읽지 않으므로 제외
         """
-        키 프레임의 포인트 클라우드를 불러오고, 원본 스케일로 리사이즈하여 input_data 뎁스 키에 저장
+        folder_name, key_frame, side = split_entry(self.filename, index)
+        key_frame = int(key_frame)
+        paths     = []
+        if self.image_store is None:
+            paths += [self.get_image_path(folder_name, key_frame + frame_id, side) for frame_id in self.frame_ids]
+        if self.depth_store is None and self.velodyne_store is None:
+            paths.append(self.get_point_path(folder_name, key_frame)[1])
+        return paths
+
+    def load_point(self, folder_name, key_frame, side, do_flip):
+        """
+        키 프레임의 포인트 클라우드를 불러오고 (depth_store가 있으면 미리 사영해둔 뎁스를 읽고), 원본 스케일로 리사이즈하여 input_data 뎁스 키에 저장
         Args:
             input_data: 데이터를 담을 딕셔너리
             index:      배치로 들어갈 데이터의 인덱스
@@ -161,14 +254,24 @@ class KITTIMonoDataset(Dataset):
         포인트 클라우드 좌표가 몇 번 카메라로 매핑될지 결정해야함, 기본 값은 cam = 2이였는데
         3번 카메라를 쓰면 3번 카메라 좌표로 변환되어야 하지만 메트릭이 정확해지지 않음
         """
-        depth = point2depth(calib_path = calib_path, point_path = point_path, cam = self.side_map[side])
-        depth = resize(depth, self.origin_scale, order = 0, preserve_range = True, mode = "constant")
+        if self.depth_store is not None:
+            depth = self.depth_store.load(folder_name, key_frame, self.side_map[side])
+        elif self.velodyne_store is not None:
+            depth = self.velodyne_store.load_depth(self.datapath, folder_name, key_frame, self.side_map[side])
+        else:
+            calib_path, point_path = self.get_point_path(folder_name, key_frame)
+            depth = point2depth(calib_path = calib_path, point_path = point_path, cam = self.side_map[side])
+        if depth.shape != self.origin_scale: # 같은 크기로의 order = 0 resize는 항등 변환이므로 생략
+            depth = resize(depth, self.origin_scale, order = 0, preserve_range = True, mode = "constant")
         depth = np.reshape(depth, (1, depth.shape[0], depth.shape[1])).astype(np.float32)
         # depth = self.depth_resize(image = depth)
         # depth = np.reshape(depth["image"], (1, depth["image"].shape[0], depth["image"].shape[1]))
         
         if do_flip == True:
             depth = self.flip_image(depth)
+
+        if self.depth_mode == "sparse":
+            depth = dense2sparse(depth)
         return depth
 
     def preprocessing_image(self, input_data, folder_name, key_frame, side, do_flip):
@@ -181,9 +284,13 @@ class KITTIMonoDataset(Dataset):
             outputs = load_image(index + key_frame)
         """
         for frame_id in self.frame_ids:
-            image_path  = self.get_image_path(folder_name, frame_id + key_frame, side)
-            image_array = self.load_image(image_path, do_flip)
-            input_data.update({("color", frame_id, scale): self.resize_image(scale, image_array) for scale in self.scales})
+            if self.image_store is not None: # 스케일 0 이미지를 memmap에서 읽고, 나머지 스케일은 스케일 0에서 리사이즈
+                image_array = self.load_stored_image(folder_name, frame_id + key_frame, side, do_flip)
+            else:
+                image_path  = self.get_image_path(folder_name, frame_id + key_frame, side)
+                image_array = self.load_image(image_path, do_flip)
+            pyramid     = self.resize_pyramid(image_array)
+            input_data.update({("color", frame_id, scale): pyramid[scale] for scale in self.scales})
         return input_data
 
     def preprocessing_point(self, input_data, folder_name, key_frame, side, do_flip):
@@ -192,24 +299,31 @@ class KITTIMonoDataset(Dataset):
         2. 포인트 클라우드 -> 뎁스 이미지로 변환한 데이터를 로드
         3. input_data 딕셔너리에 키 프레임의 뎁스 이미지 데이터 저장
         """
-        calib_path, point_path   = self.get_point_path(folder_name, key_frame)
-        depth                    = self.load_point(calib_path, point_path, side, do_flip)
+        depth                    = self.load_point(folder_name, key_frame, side, do_flip)
         input_data[("depth", 0)] = torch.from_numpy(depth)
         return input_data
 
-    def preprocessing_intrinsic(self, input_data):
+    def build_intrinsics(self):
         """
+        K, inv_K는 데이터셋 설정에만 의존하므로 __init__에서 스케일마다 한 번만 계산
         1. 원본 intrinsic을 사용할 경우, "스케일링 크기 / 원본 크기" 비율을 곱해서 intrinsic을 줄여줌
         2. monodepth2의 intrinsic을 사용할 경우, 스케일링 크기만 곱해서 intrinsic을 늘려줌
         """
+        intrinsics = {}
         for scale in self.scales:
             K_copy       = self.K.copy()
             K_copy[0, :] = K_copy[0, :] * self.scale_list[scale][1]
             K_copy[1, :] = K_copy[1, :] * self.scale_list[scale][0]
             inv_K        = np.linalg.pinv(K_copy)
 
-            input_data[("K", scale)]     = torch.from_numpy(K_copy)
-            input_data[("inv_K", scale)] = torch.from_numpy(inv_K)
+            intrinsics[("K", scale)]     = torch.from_numpy(K_copy)
+            intrinsics[("inv_K", scale)] = torch.from_numpy(inv_K)
+        return intrinsics
+
+    def preprocessing_intrinsic(self, input_data):
+        if self.batch_constants == False:
+            # 샘플을 in-place로 고쳐도 캐시가 바뀌지 않도록 복사 (4x4)
+            input_data.update({key: value.clone() for key, value in self.intrinsics.items()})
         return input_data
 
 
@@ -227,20 +341,18 @@ class KITTIMonoDataset(Dataset):
         do_flip     = self.is_training and random.random() > 0.5
         do_auge     = self.is_training and random.random() > 0.5
         
-        batch_line  = self.filename[index].split()
-        folder_name = batch_line[0]
-        key_frame   = int(batch_line[1])
-        side        = batch_line[2]
+        folder_name, key_frame, side = split_entry(self.filename, index) # SplitIndex면 문자열 파싱 없음
+        key_frame   = int(key_frame)
     
         # input_data 딕셔너리를 지정하고, folder_name, key_frame, side 여부 입력
         # 이미지 로드하고, 넘파이 타입에서 이미지 전처리 (flip -> resize -> recolor)
         input_data = {}
         input_data = self.preprocessing_image(input_data, folder_name, key_frame, side, do_flip)      
-        if do_auge:
+        if do_auge and self.batch_color == False:
             for frame_id in self.frame_ids:
                 input_data.update({("color_aug", frame_id, scale):
                     self.recolor_image(input_data[("color", frame_id, scale)]) for scale in self.scales})
-        else:
+        elif self.batch_color == False: # batch_color면 color_aug는 collate 이후 BatchColorJitter가 만듬
             for frame_id in self.frame_ids:
                 input_data.update({("color_aug", frame_id, scale):
                     input_data[("color", frame_id, scale)] for scale in self.scales})
@@ -259,13 +371,35 @@ class KITTIMonoDataset(Dataset):
 
 
 class KITTIMonoDataset_v2(Dataset):
-    def __init__(self, datapath, filename, is_training, frame_ids, height = 192, width = 640, ext = "jpg", scale = 4):
+    # 단계 이름 -> 감쌀 메서드 (또는 호출 가능한 속성), timing.instrument 참고
+    timing_stages = {"decode": "decode_image", "resize": "resize_pyramid", "color": "recolor_image",
+                     "to_tensor": "numpy2tensor", "depth": "load_point", "intrinsics": "resize_intrinsic"}
+
+    def __init__(self, datapath, filename, is_training, frame_ids, height = 192, width = 640, ext = "jpg", scale = 4,
+                 depth_store = None, depth_mode = "dense", frame_cache = 0, pyramid = "direct", draft = False,
+                 batch_color = False, uint8 = False, batch_constants = False,
+                 validate = False, timer = None, velodyne_store = None):
         super(KITTIMonoDataset_v2, self).__init__()
         """
         KITTIMonoDataset for torchvision
+        depth_store: build_depth_store로 만든 저장소 경로 (또는 DepthStore), None이면 매번 포인트 클라우드를 사영
+        depth_mode:  "dense"면 [1, H, W] 뎁스 맵, "sparse"면 유효한 픽셀의 [N, 3] (u, v, z), 배치는 collate.SparseDepthCollate로 묶음
+        frame_cache: 워커마다 디코딩한 프레임을 담아둘 LRU 캐시의 바이트 수 (또는 FrameCache), 0이면 사용 안 함
+        pyramid:     "direct"면 스케일마다 원본에서 리사이즈, "cascade"면 이전 스케일에서 리사이즈, "exact"면 정수배 축소를 블록 평균으로 (pyramid.py)
+        draft:       True면 JPEG를 (width, height)보다 작아지지 않는 범위에서 1/2, 1/4, 1/8 DCT 스케일로 디코딩 (PIL draft)
+        batch_color: True면 워커에서 color_aug를 만들지 않음, collate 이후 augment.BatchColorJitter로 배치 단위 적용
+        uint8:       True면 color, color_aug를 [3, H, W] uint8 텐서로 반환 (IPC 바이트 1/4), 배치는 collate.images_to_float로 한 번에 변환
+        batch_constants: True면 K, inv_K (스테레오는 stereo 대신 stereo_index)를 샘플에 넣지 않음, collate.ConstantCollate가 배치마다 공유 상수로 붙임
+        validate:    True면 생성할 때 frame_ids가 요구하는 모든 이미지와 (depth_store, velodyne_store가 없으면) 키 프레임의 벨로다인 파일이 있는지 확인, 없으면 ValueError
+        timer:       timing.StageTimer, 있으면 timing_stages의 단계별 시간과 바이트를 기록 (None이면 메서드를 감싸지 않으므로 오버헤드 없음)
+        velodyne_store: build_velodyne_store로 만든 frustum 포인트 저장소 경로 (또는 VelodyneStore), depth_store가 없을 때 벨로다인 .bin 대신 memmap에서 읽어서 사영
         """
         if height % 32 != 0 or width % 32 != 0:
             raise "(H, W)는 32의 나눗셉 나머지가 0일 것, KITTI 권장 사이즈는 (320, 1024) or (192, 640)"
+        if pyramid not in PYRAMID_MODES:
+            raise ValueError("pyramid는 {} 중 하나".format(PYRAMID_MODES))
+        if depth_mode not in ["dense", "sparse"]:
+            raise ValueError("depth_mode는 'dense' or 'sparse'")
         self.datapath    = datapath
         self.filename    = filename
         self.is_training = is_training
@@ -274,6 +408,20 @@ class KITTIMonoDataset_v2(Dataset):
         self.width       = width
         self.ext         = ext
         self.scale       = scale
+        self.depth_store = DepthStore(depth_store) if isinstance(depth_store, str) else depth_store
+        self.depth_mode  = depth_mode
+        self.frame_cache = frame_cache if isinstance(frame_cache, FrameCache) else (FrameCache(frame_cache) if frame_cache else None)
+        self.pyramid     = pyramid
+        self.draft       = draft
+        self.batch_color = batch_color
+        self.uint8       = uint8
+        self.batch_constants = batch_constants
+        self.validate    = validate
+        self.timer       = timer
+        self.velodyne_store = VelodyneStore(velodyne_store) if isinstance(velodyne_store, str) else velodyne_store
+        load_calibrations(self.datapath, self.filename) # 워커 fork 전에 날짜별 캘리브레이션을 한 번만 파싱
+        if self.validate == True:
+            check_split(self.datapath, self.filename, self.frame_ids, velodyne = self.depth_store is None and self.velodyne_store is None)
 
         self.interp      = Image.ANTIALIAS
         self.side_map    = {"2": 2, "3": 3, "l": 2, "r": 3}
@@ -283,90 +431,150 @@ class KITTIMonoDataset_v2(Dataset):
                                      [0,       0,      1,    0],
                                      [0,       0,      0,    1]], dtype = np.float32) 
 
-        self.numpy2tensor = transforms.ToTensor()
-        self.transforms   = transforms.ColorJitter.get_params(
-            (0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1))
+        self.numpy2tensor = transforms.PILToTensor() if self.uint8 == True else transforms.ToTensor()
+        self.color_ranges = ((0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1)) # brightness, contrast, saturation, hue
         
         self.resize = {}
         for scale in range(self.scale):
             self.resize[scale] = transforms.Resize(
                 (self.height // (2**scale), self.width // (2**scale)), interpolation = self.interp)
+        self.scale_list = [(self.height // (2**scale), self.width // (2**scale)) for scale in range(self.scale)]
+        self.intrinsics = self.build_intrinsics()
+        if self.timer is not None:
+            instrument(self, self.timer)
 
 
-    def load_image(self, folder, frame_index, side, do_flip):
+    def get_image_path(self, folder, frame_index, side):
         image_name = "{:010d}{}".format(frame_index, self.ext)
-        image_path = os.path.join(self.datapath, folder, "image_0{}/data".format(self.side_map[side]), image_name)
+        return os.path.join(self.datapath, folder, "image_0{}/data".format(self.side_map[side]), image_name)
+
+    def load_image(self, folder, frame_index, side, do_flip):
+        image_path = self.get_image_path(folder, frame_index, side)
+        if self.frame_cache is not None:
+            return self.frame_cache.load(image_path, lambda: self.decode_image(image_path), self.flip_image, do_flip)
+
+        image = self.decode_image(image_path)
+        if do_flip == True:
+            image = self.flip_image(image)
+        return image
+
+
+    def decode_image(self, image_path):
         # open path as file to avoid ResourceWarning
         # (https://github.com/python-pillow/Pillow/issues/835)
         with open(image_path, 'rb') as f:
             with Image.open(f) as img:
-                image = img.convert('RGB')
-                
-                if do_flip == True:
-                    image = image.transpose(Image.FLIP_LEFT_RIGHT)
-                return image
+                if self.draft == True: # 리사이즈 결과가 원본 디코딩과 거의 같도록 스케일 0 크기 이상으로만 줄임
+                    img.draft("RGB", (self.width, self.height))
+                return img.convert('RGB')
+
+
+    def flip_image(self, image):
+        return image.transpose(Image.FLIP_LEFT_RIGHT)
+
+
+    def resize_pyramid(self, image):
+        if self.pyramid == "direct":
+            return [self.resize[scale](image) for scale in range(self.scale)]
+        return build_pyramid(image, self.scale_list, self.interp, self.pyramid)
+
+    def recolor_image(self, image, color_params):
+        return jitter_image(image, color_params)
+
 
+    def sample_paths(self, index):
+        """
+        index번째 샘플이 __getitem__에서 읽는 파일 경로 리스트 (prefetch.ReadAheadSampler가 미리 읽음)
+        depth_store, velodyne_store를 쓰면 벨로다인 파일은 읽지 않으므로 제외
+        """
+        folder_name, key_frame, side = split_entry(self.filename, index)
+        key_frame = int(key_frame)
+        paths     = [self.get_image_path(folder_name, key_frame + frame_id, side) for frame_id in self.frame_ids]
+        if self.depth_store is None and self.velodyne_store is None:
+            paths.append(os.path.join(self.datapath, folder_name, "velodyne_points/data/{:010d}.bin".format(key_frame)))
+        return paths
 
     def load_point(self, folder, frame_index, side, do_flip):
         calib_path = os.path.join(self.datapath, folder.split("/")[0])
         velo_filename = os.path.join(
             self.datapath, folder, "velodyne_points/data/{:010d}.bin".format(int(frame_index)))
 
-        depth = point2depth(calib_path, velo_filename, self.side_map[side])
-        depth = resize(depth, (375, 1242), order = 0, preserve_range = True, mode = "constant")
+        if self.depth_store is not None:
+            depth = self.depth_store.load(folder, frame_index, self.side_map[side])
+        elif self.velodyne_store is not None:
+            depth = self.velodyne_store.load_depth(self.datapath, folder, frame_index, self.side_map[side])
+        else:
+            depth = point2depth(calib_path, velo_filename, self.side_map[side])
+        if depth.shape != (375, 1242): # 같은 크기로의 order = 0 resize는 항등 변환이므로 생략
+            depth = resize(depth, (375, 1242), order = 0, preserve_range = True, mode = "constant")
 
         if do_flip == True:
             depth = np.fliplr(depth)
 
+        if self.depth_mode == "sparse":
+            return torch.from_numpy(dense2sparse(depth))
         depth = np.expand_dims(depth, axis = 0)
         depth = torch.from_numpy(depth.astype(np.float32))
         return depth
 
 
-    def resize_intrinsic(self, input_data):
+    def build_intrinsics(self):
+        """
+        K, inv_K는 데이터셋 설정에만 의존하므로 __init__에서 스케일마다 한 번만 계산
+        """
+        intrinsics = {}
         for scale in range(self.scale):
             K_copy       = self.K.copy()
             K_copy[0, :] = K_copy[0, :] * self.width // (2 ** scale)
             K_copy[1, :] = K_copy[1, :] * self.width // (2 ** scale)
             inv_K        = np.linalg.pinv(K_copy)
 
-            input_data[("K", scale)]     = torch.from_numpy(K_copy)
-            input_data[("inv_K", scale)] = torch.from_numpy(inv_K)
+            intrinsics[("K", scale)]     = torch.from_numpy(K_copy)
+            intrinsics[("inv_K", scale)] = torch.from_numpy(inv_K)
+        return intrinsics
+
+
+    def resize_intrinsic(self, input_data):
+        if self.batch_constants == False:
+            # 샘플을 in-place로 고쳐도 캐시가 바뀌지 않도록 복사 (4x4)
+            input_data.update({key: value.clone() for key, value in self.intrinsics.items()})
         return input_data
 
 
     def __getitem__(self, index):
-        do_color    = self.is_training and random.random() > 0.5
+        do_color    = self.is_training and random.random() > 0.5 and self.batch_color == False
         do_flip     = self.is_training and random.random() > 0.5
 
-        batch_line  = self.filename[index].split()
-        folder_name = batch_line[0]
-        key_frame   = int(batch_line[1])
-        side        = batch_line[2]
+        folder_name, key_frame, side = split_entry(self.filename, index) # SplitIndex면 문자열 파싱 없음
+        key_frame   = int(key_frame)
 
         input_data  = {}
         if do_color == True:
+            color_params = transforms.ColorJitter.get_params(*self.color_ranges) # 샘플마다 한 번, 모든 frame_id, scale에 같은 값
             for frame_id in self.frame_ids:
                 original_image = self.load_image(folder_name, key_frame + frame_id, side, do_flip)
+                pyramid        = self.resize_pyramid(original_image)
 
                 for scale in range(self.scale):
-                    resize_image = self.resize[scale](original_image)
+                    resize_image = pyramid[scale]
                     input_data.update(
                         {("color", frame_id, scale): self.numpy2tensor(resize_image)})
                     input_data.update(
-                        {("color_aug", frame_id, scale): self.numpy2tensor(self.transforms(resize_image))})
+                        {("color_aug", frame_id, scale): self.numpy2tensor(self.recolor_image(resize_image, color_params))})
 
         else: # do_color == False
             identity = (lambda x: x)
             for frame_id in self.frame_ids:
                 original_image = self.load_image(folder_name, key_frame + frame_id, side, do_flip)
+                pyramid        = self.resize_pyramid(original_image)
 
                 for scale in range(self.scale):
-                    resize_image = self.resize[scale](original_image)
+                    resize_image = pyramid[scale]
                     input_data.update(
                         {("color", frame_id, scale): self.numpy2tensor(resize_image)})
-                    input_data.update(
-                        {("color_aug", frame_id, scale): self.numpy2tensor(identity(resize_image))})
+                    if self.batch_color == False:
+                        input_data.update(
+                            {("color_aug", frame_id, scale): self.numpy2tensor(identity(resize_image))})
 
         input_data.update(
             {("depth", 0): self.load_point(folder_name, key_frame, side, do_flip)})
@@ -19,17 +19,46 @@ from albumentations.augmentations.transforms import HorizontalFlip
 from albumentations.augmentations.transforms import ColorJitter
 from skimage.transform import resize
 from model_utility import *
+from .frame_cache import FrameCache
+from .timing import instrument
+from .pyramid import PYRAMID_MODES
+from .pyramid import build_pyramid
+from .depth_store import DepthStore
+from .velodyne_store import VelodyneStore
+from .augment import jitter_image
 
 
 
 class KITTIStereoDataset(Dataset):
-    def __init__(self, datapath, filename, is_training, height = 192, width = 640, ext = "jpg", scale = 4):
+    # 단계 이름 -> 감쌀 메서드 (또는 호출 가능한 속성), timing.instrument 참고
+    timing_stages = {"decode": "decode_image", "resize": "resize_pyramid", "color": "recolor_image", "to_tensor": "numpy2tensor",
+                     "depth": "load_stereo_point", "intrinsics": "resize_intrinsic", "stereo": "stereo_translation"}
+
+    def __init__(self, datapath, filename, is_training, height = 192, width = 640, ext = "jpg", scale = 4,
+                 depth_store = None, depth_mode = "dense", frame_cache = 0, pyramid = "direct", draft = False,
+                 batch_color = False, uint8 = False, batch_constants = False,
+                 validate = False, timer = None, velodyne_store = None):
         super(KITTIStereoDataset, self).__init__()
         """
         KITTIMonoDataset for torchvision
+        depth_store: build_depth_store로 만든 저장소 경로 (또는 DepthStore), None이면 매번 포인트 클라우드를 사영
+        depth_mode:  "dense"면 [1, H, W] 뎁스 맵, "sparse"면 유효한 픽셀의 [N, 3] (u, v, z), 배치는 collate.SparseDepthCollate로 묶음
+        frame_cache: 워커마다 디코딩한 프레임을 담아둘 LRU 캐시의 바이트 수 (또는 FrameCache), 0이면 사용 안 함
+        pyramid:     "direct"면 스케일마다 원본에서 리사이즈, "cascade"면 이전 스케일에서 리사이즈, "exact"면 정수배 축소를 블록 평균으로 (pyramid.py)
+        draft:       True면 JPEG를 (width, height)보다 작아지지 않는 범위에서 1/2, 1/4, 1/8 DCT 스케일로 디코딩 (PIL draft)
+        batch_color: True면 워커에서 color_aug를 만들지 않음, collate 이후 augment.BatchColorJitter로 배치 단위 적용
+        uint8:       True면 color, color_aug를 [3, H, W] uint8 텐서로 반환 (IPC 바이트 1/4), 배치는 collate.images_to_float로 한 번에 변환
+        batch_constants: True면 K, inv_K (스테레오는 stereo 대신 stereo_index)를 샘플에 넣지 않음, collate.ConstantCollate가 배치마다 공유 상수로 붙임
+        validate:    True면 생성할 때 frame_ids가 요구하는 모든 이미지와 (depth_store, velodyne_store가 없으면) 키 프레임의 벨로다인 파일이 있는지 확인, 없으면 ValueError
+        timer:       timing.StageTimer, 있으면 timing_stages의 단계별 시간과 바이트를 기록 (None이면 메서드를 감싸지 않으므로 오버헤드 없음)
+        velodyne_store: build_velodyne_store로 만든 frustum 포인트 저장소 경로 (또는 VelodyneStore), depth_store가 없을 때 벨로다인 .bin 대신 memmap에서 읽어서 사영
         """
         if height % 32 != 0 or width % 32 != 0:
             raise "(H, W)는 32의 나눗셉 나머지가 0일 것, KITTI 권장 사이즈는 (320, 1024) or (192, 640)"
+        if pyramid not in PYRAMID_MODES:
+            raise ValueError("pyramid는 {} 중 하나".format(PYRAMID_MODES))
+        if depth_mode not in ["dense", "sparse"]:
+            raise ValueError("depth_mode는 'dense' or 'sparse'")
         self.datapath    = datapath
         self.filename    = filename
         self.is_training = is_training
@@ -37,6 +66,20 @@ class KITTIStereoDataset(Dataset):
         self.width       = width
         self.ext         = ext
         self.scale       = scale
+        self.depth_store = DepthStore(depth_store) if isinstance(depth_store, str) else depth_store
+        self.depth_mode  = depth_mode
+        self.frame_cache = frame_cache if isinstance(frame_cache, FrameCache) else (FrameCache(frame_cache) if frame_cache else None)
+        self.pyramid     = pyramid
+        self.draft       = draft
+        self.batch_color = batch_color
+        self.uint8       = uint8
+        self.batch_constants = batch_constants
+        self.validate    = validate
+        self.timer       = timer
+        self.velodyne_store = VelodyneStore(velodyne_store) if isinstance(velodyne_store, str) else velodyne_store
+        load_calibrations(self.datapath, self.filename) # 워커 fork 전에 날짜별 캘리브레이션을 한 번만 파싱
+        if self.validate == True:
+            check_split(self.datapath, self.filename, [0, "s"], velodyne = self.depth_store is None and self.velodyne_store is None)
 
         self.others      = {"l": "r", "r": "l"}
         self.interp      = Image.ANTIALIAS
@@ -47,115 +90,203 @@ class KITTIStereoDataset(Dataset):
                                      [0,       0,      1,    0],
                                      [0,       0,      0,    1]], dtype = np.float32) 
 
-        self.numpy2tensor = transforms.ToTensor()
-        self.transforms   = transforms.ColorJitter.get_params(
-            (0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1))
+        self.numpy2tensor = transforms.PILToTensor() if self.uint8 == True else transforms.ToTensor()
+        self.color_ranges = ((0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1)) # brightness, contrast, saturation, hue
         
         self.resize = {}
         for scale in range(self.scale):
             self.resize[scale] = transforms.Resize(
                 (self.height // (2**scale), self.width // (2**scale)), interpolation = self.interp)
+        self.scale_list = [(self.height // (2**scale), self.width // (2**scale)) for scale in range(self.scale)]
+        self.intrinsics   = self.build_intrinsics()
+        self.stereo_table = self.build_stereo_table()
+        if self.timer is not None:
+            instrument(self, self.timer)
 
 
-    def load_image(self, folder, frame_index, side, do_flip):
+    def get_image_path(self, folder, frame_index, side):
         image_name = "{:010d}{}".format(frame_index, self.ext)
-        image_path = os.path.join(self.datapath, folder, "image_0{}/data".format(self.side_map[side]), image_name)
+        return os.path.join(self.datapath, folder, "image_0{}/data".format(self.side_map[side]), image_name)
+
+    def load_image(self, folder, frame_index, side, do_flip):
+        image_path = self.get_image_path(folder, frame_index, side)
+        if self.frame_cache is not None:
+            return self.frame_cache.load(image_path, lambda: self.decode_image(image_path), self.flip_image, do_flip)
+
+        image = self.decode_image(image_path)
+        if do_flip == True:
+            image = self.flip_image(image)
+        return image
+
+
+    def decode_image(self, image_path):
         # open path as file to avoid ResourceWarning
         # (https://github.com/python-pillow/Pillow/issues/835)
         with open(image_path, 'rb') as f:
             with Image.open(f) as img:
-                image = img.convert('RGB')
-                
-                if do_flip == True:
-                    image = image.transpose(Image.FLIP_LEFT_RIGHT)
-                return image
+                if self.draft == True: # 리사이즈 결과가 원본 디코딩과 거의 같도록 스케일 0 크기 이상으로만 줄임
+                    img.draft("RGB", (self.width, self.height))
+                return img.convert('RGB')
+
 
+    def flip_image(self, image):
+        return image.transpose(Image.FLIP_LEFT_RIGHT)
 
-    def load_point(self, folder, frame_index, side, do_flip):
-        calib_path = os.path.join(self.datapath, folder.split("/")[0])
-        velo_filename = os.path.join(
-            self.datapath, folder, "velodyne_points/data/{:010d}.bin".format(int(frame_index)))
 
-        depth = point2depth(calib_path, velo_filename, self.side_map[side])
-        depth = resize(depth, (375, 1242), order = 0, preserve_range = True, mode = "constant")
+    def resize_pyramid(self, image):
+        if self.pyramid == "direct":
+            return [self.resize[scale](image) for scale in range(self.scale)]
+        return build_pyramid(image, self.scale_list, self.interp, self.pyramid)
+
+    def recolor_image(self, image, color_params):
+        return jitter_image(image, color_params)
+
+
+    def sample_paths(self, index):
+        """
+        index번째 샘플이 __getitem__에서 읽는 파일 경로 리스트 (prefetch.ReadAheadSampler가 미리 읽음)
+        depth_store, velodyne_store를 쓰면 벨로다인 파일은 읽지 않으므로 제외
+        """
+        folder_name, key_frame, side = split_entry(self.filename, index)
+        key_frame = int(key_frame)
+        paths     = [self.get_image_path(folder_name, key_frame, side), self.get_image_path(folder_name, key_frame, self.others[side])]
+        if self.depth_store is None and self.velodyne_store is None:
+            paths.append(os.path.join(self.datapath, folder_name, "velodyne_points/data/{:010d}.bin".format(key_frame)))
+        return paths
+
+    def load_stereo_point(self, folder, frame_index, side, do_flip):
+        """
+        벨로다인 파일을 한 번만 읽어서 side 카메라와 반대쪽 카메라의 뎁스를 같이 만듬
+        returns:
+            [side 카메라 뎁스, 반대쪽 카메라 뎁스]
+        """
+        cams = [self.side_map[side], self.side_map[self.others[side]]]
+        if self.depth_store is not None:
+            depths = [self.depth_store.load(folder, frame_index, cam) for cam in cams]
+        elif self.velodyne_store is not None:
+            depths = [self.velodyne_store.load_depth(self.datapath, folder, frame_index, cam) for cam in cams]
+        else:
+            calib_path = os.path.join(self.datapath, folder.split("/")[0])
+            velo_filename = os.path.join(
+                self.datapath, folder, "velodyne_points/data/{:010d}.bin".format(int(frame_index)))
+            depths = point2depth_stereo(calib_path, velo_filename, cams)
+        return [self.convert_point(depth, do_flip) for depth in depths]
+
+
+    def convert_point(self, depth, do_flip):
+        if depth.shape != (375, 1242): # 같은 크기로의 order = 0 resize는 항등 변환이므로 생략
+            depth = resize(depth, (375, 1242), order = 0, preserve_range = True, mode = "constant")
 
         if do_flip == True:
             depth = np.fliplr(depth)
 
+        if self.depth_mode == "sparse":
+            return torch.from_numpy(dense2sparse(depth))
         depth = np.expand_dims(depth, axis = 0)
         depth = torch.from_numpy(depth.astype(np.float32))
         return depth
 
 
-    def resize_intrinsic(self, input_data):
+    def build_intrinsics(self):
+        """
+        K, inv_K는 데이터셋 설정에만 의존하므로 __init__에서 스케일마다 한 번만 계산
+        """
+        intrinsics = {}
         for scale in range(self.scale):
             K_copy       = self.K.copy()
             K_copy[0, :] = K_copy[0, :] * self.width // (2 ** scale)
             K_copy[1, :] = K_copy[1, :] * self.height // (2 ** scale)
             inv_K        = np.linalg.pinv(K_copy)
 
-            input_data[("K", scale)]     = torch.from_numpy(K_copy)
-            input_data[("inv_K", scale)] = torch.from_numpy(inv_K)
+            intrinsics[("K", scale)]     = torch.from_numpy(K_copy)
+            intrinsics[("inv_K", scale)] = torch.from_numpy(inv_K)
+        return intrinsics
+
+
+    def resize_intrinsic(self, input_data):
+        if self.batch_constants == False:
+            # 샘플을 in-place로 고쳐도 캐시가 바뀌지 않도록 복사 (4x4)
+            input_data.update({key: value.clone() for key, value in self.intrinsics.items()})
         return input_data
 
 
-    def stereo_translation(self, input_data, side, do_flip):
-        stereo_translation = np.eye(4, dtype=np.float32)
-        baseline_sign      = -1 if do_flip else 1
-        side_sign          = -1 if side == "l" else 1
+    def build_stereo_table(self):
+        """
+        stereo_translation은 (side, do_flip) 조합 4개뿐이므로 미리 만들어 둠, 인덱스 = 2 * (side != "l") + do_flip
+        """
+        table = []
+        for side in ["l", "r"]:
+            for do_flip in [False, True]:
+                stereo_translation = np.eye(4, dtype=np.float32)
+                baseline_sign      = -1 if do_flip else 1
+                side_sign          = -1 if side == "l" else 1
+
+                stereo_translation[0, 3] = side_sign * baseline_sign * 0.1
+                table.append(stereo_translation)
+        return torch.from_numpy(np.stack(table))
 
-        stereo_translation[0, 3] = side_sign * baseline_sign * 0.1
-        input_data["stereo"] = torch.from_numpy(stereo_translation)
+
+    def stereo_translation(self, input_data, side, do_flip):
+        index = 2 * int(side != "l") + int(do_flip)
+        if self.batch_constants == True:
+            input_data["stereo_index"] = torch.tensor(index)
+        else:
+            input_data["stereo"] = self.stereo_table[index].clone() # 정수 인덱스는 view
         return input_data
 
     
     def __getitem__(self, index):
-        do_color    = self.is_training and random.random() > 0.5
+        do_color    = self.is_training and random.random() > 0.5 and self.batch_color == False
         do_flip     = self.is_training and random.random() > 0.5
 
-        batch_line  = self.filename[index].split()
-        folder_name = batch_line[0]
-        key_frame   = int(batch_line[1])
-        side        = batch_line[2]
+        folder_name, key_frame, side = split_entry(self.filename, index) # SplitIndex면 문자열 파싱 없음
+        key_frame   = int(key_frame)
 
         input_data  = {}
         if do_color == True:
+            color_params = transforms.ColorJitter.get_params(*self.color_ranges) # 샘플마다 한 번, 모든 frame_id, scale에 같은 값
             image = self.load_image(folder_name, key_frame, side, do_flip)
             other = self.load_image(folder_name, key_frame, self.others[side], do_flip)
+            image_pyramid = self.resize_pyramid(image)
+            other_pyramid = self.resize_pyramid(other)
             for scale in range(self.scale):
-                resize_image = self.resize[scale](image)
-                resize_other = self.resize[scale](other)
+                resize_image = image_pyramid[scale]
+                resize_other = other_pyramid[scale]
 
                 input_data.update(
                     {("color", 0, scale): self.numpy2tensor(resize_image)})
                 input_data.update(
                     {("color", "s", scale): self.numpy2tensor(resize_other)})
                 input_data.update(
-                    {("color_aug", 0, scale): self.numpy2tensor(self.transforms(resize_image))})
+                    {("color_aug", 0, scale): self.numpy2tensor(self.recolor_image(resize_image, color_params))})
                 input_data.update(
-                    {("color_aug", "s", scale): self.numpy2tensor(self.transforms(resize_other))})
+                    {("color_aug", "s", scale): self.numpy2tensor(self.recolor_image(resize_other, color_params))})
 
         else:
             idnetity = (lambda x: x)
             image = self.load_image(folder_name, key_frame, side, do_flip)
             other = self.load_image(folder_name, key_frame, self.others[side], do_flip)
+            image_pyramid = self.resize_pyramid(image)
+            other_pyramid = self.resize_pyramid(other)
             for scale in range(self.scale):
-                resize_image = self.resize[scale](image)
-                resize_other = self.resize[scale](other)
+                resize_image = image_pyramid[scale]
+                resize_other = other_pyramid[scale]
 
                 input_data.update(
                     {("color", 0, scale): self.numpy2tensor(resize_image)})
                 input_data.update(
                     {("color", "s", scale): self.numpy2tensor(resize_other)})
-                input_data.update(
-                    {("color_aug", 0, scale): self.numpy2tensor(idnetity(resize_image))})
-                input_data.update(
-                    {("color_aug", "s", scale): self.numpy2tensor(idnetity(resize_other))})
+                if self.batch_color == False:
+                    input_data.update(
+                        {("color_aug", 0, scale): self.numpy2tensor(idnetity(resize_image))})
+                    input_data.update(
+                        {("color_aug", "s", scale): self.numpy2tensor(idnetity(resize_other))})
         
+        depth, depth_other = self.load_stereo_point(folder_name, key_frame, side, do_flip)
         input_data.update(
-            {("depth", 0, 0): self.load_point(folder_name, key_frame, side, do_flip)})
+            {("depth", 0, 0): depth})
         input_data.update(
-            {("depth", "s", 0): self.load_point(folder_name, key_frame, self.others[side], do_flip)})
+            {("depth", "s", 0): depth_other})
         input_data = self.resize_intrinsic(input_data)
         input_data = self.stereo_translation(input_data, side, do_flip)
         return input_data
@@ -166,13 +297,35 @@ class KITTIStereoDataset(Dataset):
 
 
 class KITTIMonoStereoDataset(Dataset):
-    def __init__(self, datapath, filename, is_training, frame_ids, height = 192, width = 640, ext = "jpg", scale = 4):
+    # 단계 이름 -> 감쌀 메서드 (또는 호출 가능한 속성), timing.instrument 참고
+    timing_stages = {"decode": "decode_image", "resize": "resize_pyramid", "color": "recolor_image", "to_tensor": "numpy2tensor",
+                     "depth": "load_stereo_point", "intrinsics": "resize_intrinsic", "stereo": "stereo_translation"}
+
+    def __init__(self, datapath, filename, is_training, frame_ids, height = 192, width = 640, ext = "jpg", scale = 4,
+                 depth_store = None, depth_mode = "dense", frame_cache = 0, pyramid = "direct", draft = False,
+                 batch_color = False, uint8 = False, batch_constants = False,
+                 validate = False, timer = None, velodyne_store = None):
         super(KITTIMonoStereoDataset, self).__init__()
         """
         KITTIMonoDataset for torchvision
+        depth_store: build_depth_store로 만든 저장소 경로 (또는 DepthStore), None이면 매번 포인트 클라우드를 사영
+        depth_mode:  "dense"면 [1, H, W] 뎁스 맵, "sparse"면 유효한 픽셀의 [N, 3] (u, v, z), 배치는 collate.SparseDepthCollate로 묶음
+        frame_cache: 워커마다 디코딩한 프레임을 담아둘 LRU 캐시의 바이트 수 (또는 FrameCache), 0이면 사용 안 함
+        pyramid:     "direct"면 스케일마다 원본에서 리사이즈, "cascade"면 이전 스케일에서 리사이즈, "exact"면 정수배 축소를 블록 평균으로 (pyramid.py)
+        draft:       True면 JPEG를 (width, height)보다 작아지지 않는 범위에서 1/2, 1/4, 1/8 DCT 스케일로 디코딩 (PIL draft)
+        batch_color: True면 워커에서 color_aug를 만들지 않음, collate 이후 augment.BatchColorJitter로 배치 단위 적용
+        uint8:       True면 color, color_aug를 [3, H, W] uint8 텐서로 반환 (IPC 바이트 1/4), 배치는 collate.images_to_float로 한 번에 변환
+        batch_constants: True면 K, inv_K (스테레오는 stereo 대신 stereo_index)를 샘플에 넣지 않음, collate.ConstantCollate가 배치마다 공유 상수로 붙임
+        validate:    True면 생성할 때 frame_ids가 요구하는 모든 이미지와 (depth_store, velodyne_store가 없으면) 키 프레임의 벨로다인 파일이 있는지 확인, 없으면 ValueError
+        timer:       timing.StageTimer, 있으면 timing_stages의 단계별 시간과 바이트를 기록 (None이면 메서드를 감싸지 않으므로 오버헤드 없음)
+        velodyne_store: build_velodyne_store로 만든 frustum 포인트 저장소 경로 (또는 VelodyneStore), depth_store가 없을 때 벨로다인 .bin 대신 memmap에서 읽어서 사영
         """
         if height % 32 != 0 or width % 32 != 0:
             raise "(H, W)는 32의 나눗셉 나머지가 0일 것, KITTI 권장 사이즈는 (320, 1024) or (192, 640)"
+        if pyramid not in PYRAMID_MODES:
+            raise ValueError("pyramid는 {} 중 하나".format(PYRAMID_MODES))
+        if depth_mode not in ["dense", "sparse"]:
+            raise ValueError("depth_mode는 'dense' or 'sparse'")
         if "s" not in frame_ids:
             raise "'s'는 frame_ids에 포함되어야 함"
 
@@ -184,6 +337,20 @@ class KITTIMonoStereoDataset(Dataset):
         self.width       = width
         self.ext         = ext
         self.scale       = scale
+        self.depth_store = DepthStore(depth_store) if isinstance(depth_store, str) else depth_store
+        self.depth_mode  = depth_mode
+        self.frame_cache = frame_cache if isinstance(frame_cache, FrameCache) else (FrameCache(frame_cache) if frame_cache else None)
+        self.pyramid     = pyramid
+        self.draft       = draft
+        self.batch_color = batch_color
+        self.uint8       = uint8
+        self.batch_constants = batch_constants
+        self.validate    = validate
+        self.timer       = timer
+        self.velodyne_store = VelodyneStore(velodyne_store) if isinstance(velodyne_store, str) else velodyne_store
+        load_calibrations(self.datapath, self.filename) # 워커 fork 전에 날짜별 캘리브레이션을 한 번만 파싱
+        if self.validate == True:
+            check_split(self.datapath, self.filename, self.frame_ids, velodyne = self.depth_store is None and self.velodyne_store is None)
 
         self.others      = {"l": "r", "r": "l"}
         self.interp      = Image.ANTIALIAS
@@ -194,79 +361,162 @@ class KITTIMonoStereoDataset(Dataset):
                                      [0,       0,      1,    0],
                                      [0,       0,      0,    1]], dtype = np.float32) 
 
-        self.numpy2tensor = transforms.ToTensor()
-        self.transforms   = transforms.ColorJitter.get_params(
-            (0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1))
+        self.numpy2tensor = transforms.PILToTensor() if self.uint8 == True else transforms.ToTensor()
+        self.color_ranges = ((0.8, 1.2), (0.8, 1.2), (0.8, 1.2), (-0.1, 0.1)) # brightness, contrast, saturation, hue
         
         self.resize = {}
         for scale in range(self.scale):
             self.resize[scale] = transforms.Resize(
                 (self.height // (2**scale), self.width // (2**scale)), interpolation = self.interp)
+        self.scale_list = [(self.height // (2**scale), self.width // (2**scale)) for scale in range(self.scale)]
+        self.intrinsics   = self.build_intrinsics()
+        self.stereo_table = self.build_stereo_table()
+        if self.timer is not None:
+            instrument(self, self.timer)
 
 
-    def load_image(self, folder, frame_index, side, do_flip):
+    def get_image_path(self, folder, frame_index, side):
         image_name = "{:010d}{}".format(frame_index, self.ext)
-        image_path = os.path.join(self.datapath, folder, "image_0{}/data".format(self.side_map[side]), image_name)
+        return os.path.join(self.datapath, folder, "image_0{}/data".format(self.side_map[side]), image_name)
+
+    def load_image(self, folder, frame_index, side, do_flip):
+        image_path = self.get_image_path(folder, frame_index, side)
+        if self.frame_cache is not None:
+            return self.frame_cache.load(image_path, lambda: self.decode_image(image_path), self.flip_image, do_flip)
+
+        image = self.decode_image(image_path)
+        if do_flip == True:
+            image = self.flip_image(image)
+        return image
+
+
+    def decode_image(self, image_path):
         # open path as file to avoid ResourceWarning
         # (https://github.com/python-pillow/Pillow/issues/835)
         with open(image_path, 'rb') as f:
             with Image.open(f) as img:
-                image = img.convert('RGB')
-                
-                if do_flip == True:
-                    image = image.transpose(Image.FLIP_LEFT_RIGHT)
-                return image
+                if self.draft == True: # 리사이즈 결과가 원본 디코딩과 거의 같도록 스케일 0 크기 이상으로만 줄임
+                    img.draft("RGB", (self.width, self.height))
+                return img.convert('RGB')
 
 
-    def load_point(self, folder, frame_index, side, do_flip):
-        calib_path = os.path.join(self.datapath, folder.split("/")[0])
-        velo_filename = os.path.join(
-            self.datapath, folder, "velodyne_points/data/{:010d}.bin".format(int(frame_index)))
+    def flip_image(self, image):
+        return image.transpose(Image.FLIP_LEFT_RIGHT)
+
+
+    def resize_pyramid(self, image):
+        if self.pyramid == "direct":
+            return [self.resize[scale](image) for scale in range(self.scale)]
+        return build_pyramid(image, self.scale_list, self.interp, self.pyramid)
+
+    def recolor_image(self, image, color_params):
+        return jitter_image(image, color_params)
+
+
+    def sample_paths(self, index):
+        """
+        index번째 샘플이 __getitem__에서 읽는 파일 경로 리스트 (prefetch.ReadAheadSampler가 미리 읽음)
+        depth_store, velodyne_store를 쓰면 벨로다인 파일은 읽지 않으므로 제외
+        """
+        folder_name, key_frame, side = split_entry(self.filename, index)
+        key_frame = int(key_frame)
+        paths     = [self.get_image_path(folder_name, key_frame, self.others[side]) if frame_id == "s" else
+                     self.get_image_path(folder_name, key_frame + frame_id, side) for frame_id in self.frame_ids]
+        if self.depth_store is None and self.velodyne_store is None:
+            paths.append(os.path.join(self.datapath, folder_name, "velodyne_points/data/{:010d}.bin".format(key_frame)))
+        return paths
+
+    def load_stereo_point(self, folder, frame_index, side, do_flip):
+        """
+        벨로다인 파일을 한 번만 읽어서 side 카메라와 반대쪽 카메라의 뎁스를 같이 만듬
+        returns:
+            [side 카메라 뎁스, 반대쪽 카메라 뎁스]
+        """
+        cams = [self.side_map[side], self.side_map[self.others[side]]]
+        if self.depth_store is not None:
+            depths = [self.depth_store.load(folder, frame_index, cam) for cam in cams]
+        elif self.velodyne_store is not None:
+            depths = [self.velodyne_store.load_depth(self.datapath, folder, frame_index, cam) for cam in cams]
+        else:
+            calib_path = os.path.join(self.datapath, folder.split("/")[0])
+            velo_filename = os.path.join(
+                self.datapath, folder, "velodyne_points/data/{:010d}.bin".format(int(frame_index)))
+            depths = point2depth_stereo(calib_path, velo_filename, cams)
+        return [self.convert_point(depth, do_flip) for depth in depths]
+
 
-        depth = point2depth(calib_path, velo_filename, self.side_map[side])
-        depth = resize(depth, (375, 1242), order = 0, preserve_range = True, mode = "constant")
+    def convert_point(self, depth, do_flip):
+        if depth.shape != (375, 1242): # 같은 크기로의 order = 0 resize는 항등 변환이므로 생략
+            depth = resize(depth, (375, 1242), order = 0, preserve_range = True, mode = "constant")
 
         if do_flip == True:
             depth = np.fliplr(depth)
 
+        if self.depth_mode == "sparse":
+            return torch.from_numpy(dense2sparse(depth))
         depth = np.expand_dims(depth, axis = 0)
         depth = torch.from_numpy(depth.astype(np.float32))
         return depth
 
 
-    def resize_intrinsic(self, input_data):
+    def build_intrinsics(self):
+        """
+        K, inv_K는 데이터셋 설정에만 의존하므로 __init__에서 스케일마다 한 번만 계산
+        """
+        intrinsics = {}
         for scale in range(self.scale):
             K_copy       = self.K.copy()
             K_copy[0, :] = K_copy[0, :] * self.width // (2 ** scale)
             K_copy[1, :] = K_copy[1, :] * self.height // (2 ** scale)
             inv_K        = np.linalg.pinv(K_copy)
 
-            input_data[("K", scale)]     = torch.from_numpy(K_copy)
-            input_data[("inv_K", scale)] = torch.from_numpy(inv_K)
+            intrinsics[("K", scale)]     = torch.from_numpy(K_copy)
+            intrinsics[("inv_K", scale)] = torch.from_numpy(inv_K)
+        return intrinsics
+
+
+    def resize_intrinsic(self, input_data):
+        if self.batch_constants == False:
+            # 샘플을 in-place로 고쳐도 캐시가 바뀌지 않도록 복사 (4x4)
+            input_data.update({key: value.clone() for key, value in self.intrinsics.items()})
         return input_data
 
 
-    def stereo_translation(self, input_data, side, do_flip):
-        stereo_translation = np.eye(4, dtype=np.float32)
-        baseline_sign      = -1 if do_flip else 1
-        side_sign          = -1 if side == "l" else 1
+    def build_stereo_table(self):
+        """
+        stereo_translation은 (side, do_flip) 조합 4개뿐이므로 미리 만들어 둠, 인덱스 = 2 * (side != "l") + do_flip
+        """
+        table = []
+        for side in ["l", "r"]:
+            for do_flip in [False, True]:
+                stereo_translation = np.eye(4, dtype=np.float32)
+                baseline_sign      = -1 if do_flip else 1
+                side_sign          = -1 if side == "l" else 1
+
+                stereo_translation[0, 3] = side_sign * baseline_sign * 0.1
+                table.append(stereo_translation)
+        return torch.from_numpy(np.stack(table))
 
-        stereo_translation[0, 3] = side_sign * baseline_sign * 0.1
-        input_data["stereo"] = torch.from_numpy(stereo_translation)
+
+    def stereo_translation(self, input_data, side, do_flip):
+        index = 2 * int(side != "l") + int(do_flip)
+        if self.batch_constants == True:
+            input_data["stereo_index"] = torch.tensor(index)
+        else:
+            input_data["stereo"] = self.stereo_table[index].clone() # 정수 인덱스는 view
         return input_data
 
 
     def __getitem__(self, index):
-        do_color    = self.is_training and random.random() > 0.5
+        do_color    = self.is_training and random.random() > 0.5 and self.batch_color == False
         do_flip     = self.is_training and random.random() > 0.5
 
-        batch_line  = self.filename[index].split()
-        folder_name = batch_line[0]
-        key_frame   = int(batch_line[1])
-        side        = batch_line[2]
+        folder_name, key_frame, side = split_entry(self.filename, index) # SplitIndex면 문자열 파싱 없음
+        key_frame   = int(key_frame)
 
         input_data  = {}
         if do_color == True:
+            color_params = transforms.ColorJitter.get_params(*self.color_ranges) # 샘플마다 한 번, 모든 frame_id, scale에 같은 값
             for frame_id in self.frame_ids:
                 if frame_id != "s":
                     image = self.load_image(folder_name, key_frame + frame_id, side, do_flip)
@@ -274,12 +524,13 @@ class KITTIMonoStereoDataset(Dataset):
                     other = self.others[side]
                     image = self.load_image(folder_name, key_frame, other, do_flip)
                 
+                pyramid = self.resize_pyramid(image)
                 for scale in range(self.scale):
-                    resize = self.resize[scale](image)
+                    resize = pyramid[scale]
                     input_data.update(
                         {("color", frame_id, scale): self.numpy2tensor(resize)})
                     input_data.update(
-                        {("color_aug", frame_id, scale): self.numpy2tensor(self.transforms(resize))})
+                        {("color_aug", frame_id, scale): self.numpy2tensor(self.recolor_image(resize, color_params))})
         else:
             identity = (lambda x: x)
             for frame_id in self.frame_ids:
@@ -288,17 +539,20 @@ class KITTIMonoStereoDataset(Dataset):
                 elif frame_id == "s":
                     image = self.load_image(folder_name, key_frame, self.others[side], do_flip)
 
+                pyramid = self.resize_pyramid(image)
                 for scale in range(self.scale):
-                    resize = self.resize[scale](image)
+                    resize = pyramid[scale]
                     input_data.update(
                         {("color", frame_id, scale): self.numpy2tensor(resize)})
-                    input_data.update(
-                        {("color_aug", frame_id, scale): self.numpy2tensor(identity(resize))})
+                    if self.batch_color == False:
+                        input_data.update(
+                            {("color_aug", frame_id, scale): self.numpy2tensor(identity(resize))})
 
+        depth, depth_other = self.load_stereo_point(folder_name, key_frame, side, do_flip)
         input_data.update(
-            {("depth", 0, 0): self.load_point(folder_name, key_frame, side, do_flip)})
+            {("depth", 0, 0): depth})
         input_data.update(
-            {("depth", "s", 0): self.load_point(folder_name, key_frame, self.others[side], do_flip)})
+            {("depth", "s", 0): depth_other})
         input_data = self.resize_intrinsic(input_data)
         input_data = self.stereo_translation(input_data, side, do_flip)
         return input_data
@@ -0,0 +1,237 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from model_utility import *
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+데이터셋 폴더를 스캔해서 스플릿을 만들기 위한 manifest 모듈
+class DirectoryManifest  폴더마다 os.scandir를 병렬로 돌리고, 결과를 디렉토리 mtime으로 검증하는 .npz 캐시에 저장
+class KITTIManifest      드라이브마다 벨로다인 프레임 번호 (GetKITTI)
+class CityscapesManifest 도시마다 (sequence, frame) 정수 열, 실제 시퀀스 단위로 양 끝을 자름 (GetCityscapes)
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+class DirectoryManifest(object):
+    def __init__(self, keys, cache_path = None, num_workers = 8):
+        """
+        키 (드라이브, 도시)마다 폴더 하나를 스캔해서 정렬된 int64 배열을 만드는 기본 클래스, 하위 클래스는 directory와 scan을 구현
+        cache_path가 있으면 결과를 .npz로 저장하고, 다음 실행에서는 디렉토리 mtime (st_mtime_ns)이 바뀐 키만 다시 스캔
+        파일이 추가되거나 지워지면 디렉토리 mtime이 바뀌므로 stat 한 번으로 캐시를 검증할 수 있음
+
+        Args:
+            keys:        스캔할 키 리스트
+            cache_path:  ".npz" 캐시 경로, None이면 캐싱 안 함 (manifest 종류마다 다른 파일을 쓸 것)
+            num_workers: stat, scandir를 동시에 보낼 스레드 수 (NFS처럼 요청 지연이 큰 파일 시스템에서 효과가 큼)
+        """
+        self.keys        = list(keys)
+        self.cache_path  = cache_path
+        self.num_workers = max(num_workers, 1)
+        self.entries     = {}
+        self.mtimes      = {}
+        self.rescanned   = []
+        self.refresh()
+
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def directory(self, key):
+        raise NotImplementedError
+
+    def scan(self, key):
+        """
+        returns:
+            정렬된 int64 배열 (디렉토리가 있는 키만 부름)
+        """
+        raise NotImplementedError
+
+    def stat_mtime(self, key):
+        """
+        디렉토리가 없으면 -1 (refresh에서 FileNotFoundError)
+        """
+        try:
+            return os.stat(self.directory(key)).st_mtime_ns
+        except FileNotFoundError:
+            return -1
+
+
+    def refresh(self):
+        """
+        모든 키를 stat해서 캐시와 mtime이 다른 키만 다시 스캔, 바뀐 것이 있으면 캐시 파일을 갱신
+        stat을 스캔보다 먼저 하기 때문에 스캔 도중 바뀐 키는 다음 refresh에서 다시 스캔됨
+        디렉토리가 없는 키가 있으면 (드라이브 이름 오타 등) 빈 키로 캐싱하지 않고 FileNotFoundError (os.listdir와 같음)
+        """
+        cached = self.load_cache()
+        with ThreadPoolExecutor(self.num_workers) as pool:
+            mtimes  = dict(zip(self.keys, pool.map(self.stat_mtime, self.keys)))
+            missing = [self.directory(key) for key in self.keys if mtimes[key] < 0]
+            if missing:
+                raise FileNotFoundError("디렉토리가 없음 ({}개): {}".format(len(missing), ", ".join(missing)))
+            stale   = [key for key in self.keys if self.directory(key) not in cached
+                       or cached[self.directory(key)][0] != mtimes[key]]
+            scanned = dict(zip(stale, pool.map(self.scan, stale)))
+
+        for key in self.keys:
+            self.mtimes[key]  = mtimes[key]
+            self.entries[key] = scanned[key] if key in scanned else cached[self.directory(key)][1]
+        self.rescanned = stale
+        if stale and self.cache_path is not None:
+            cached.update({self.directory(key): (self.mtimes[key], self.entries[key]) for key in self.keys})
+            self.save_cache(cached)
+        return self
+
+
+    def load_cache(self):
+        """
+        returns:
+            {디렉토리 경로: (mtime_ns, 배열)}, 캐시가 없거나 다른 종류의 manifest가 만든 캐시면 {}
+        """
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return {}
+        arrays = np.load(self.cache_path)
+        if "kind" not in arrays.files or str(arrays["kind"]) != type(self).__name__:
+            return {}
+        values = np.split(arrays["values"], np.cumsum(arrays["counts"])[:-1]) if len(arrays["counts"]) else []
+        return {str(directory): (int(mtime), value)
+                for directory, mtime, value in zip(arrays["directories"], arrays["mtimes"], values)}
+
+    def save_cache(self, cached):
+        """
+        다른 mode (train, val)의 폴더도 같은 캐시 파일에 남도록 기존 캐시와 합쳐서 저장
+        임시 파일에 쓴 다음 os.replace로 바꾸기 때문에 동시에 여러 프로세스가 읽어도 깨진 파일을 보지 않음
+        """
+        directories = sorted(cached)
+        temp        = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(temp, "wb") as f:
+            np.savez(f, kind = np.array(type(self).__name__), directories = np.array(directories, dtype = str),
+                     mtimes = np.array([cached[directory][0] for directory in directories], dtype = np.int64),
+                     counts = np.array([len(cached[directory][1]) for directory in directories], dtype = np.int64),
+                     values = np.concatenate([cached[directory][1] for directory in directories]).astype(np.int64))
+        os.replace(temp, self.cache_path)
+
+
+
+class KITTIManifest(DirectoryManifest):
+    def __init__(self, datapath, drives, cache_path = None, num_workers = 8, subdir = "velodyne_points/data"):
+        """
+        드라이브마다 존재하는 프레임 번호를 숫자 순서로 정렬해두는 클래스
+
+        Args:
+            datapath:    "./dataset/kitti"
+            drives:      ["2011_09_26/2011_09_26_drive_0001_sync", ...]
+            cache_path:  "./dataset/kitti/manifest.npz", None이면 캐싱 안 함
+            num_workers: 병렬 스캔 스레드 수
+            subdir:      프레임 번호를 읽을 드라이브 안의 폴더, 키프레임은 GT가 있어야 하므로 기본은 velodyne_points
+
+        ex)
+        manifest = KITTIManifest("./dataset/kitti", drives, "./dataset/kitti/manifest.npz")
+        manifest["2011_09_26/2011_09_26_drive_0001_sync"] -> array([0, 1, 2, ..., 107])
+        """
+        self.datapath = datapath
+        self.drives   = list(drives)
+        self.subdir   = subdir
+        super(KITTIManifest, self).__init__(self.drives, cache_path, num_workers)
+
+
+    def directory(self, drive):
+        return os.path.join(self.datapath, drive, self.subdir)
+
+    def scan(self, drive):
+        return scan_frames(self.directory(drive)).astype(np.int64)
+
+
+
+class CityscapesManifest(DirectoryManifest):
+    # 도시마다 (sequence, frame)을 sequence * FRAME_BASE + frame 하나의 int64로 캐싱 (프레임 인덱스는 6자리)
+    FRAME_BASE = 10**6
+
+    def __init__(self, datapath, mode, cache_path = None, num_workers = 8,
+                 cam_path = "leftImg8bit_sequence_trainvaltest/leftImg8bit_sequence", suffix = "_leftImg8bit"):
+        """
+        Cityscapes 시퀀스 파일 이름 (aachen_000012_000019_leftImg8bit.png)을 스캔하면서 바로 정수 열로 파싱하는 클래스
+        문자열 리스트 + natsort 대신 (city_ids, sequences, frames) 배열을 np.lexsort로 정렬해서
+        실제 시퀀스 id 단위로 묶기 때문에 양 끝을 자르는 cut이 시퀀스 길이와 상관없이 정확함
+
+        Args:
+            datapath:    "./dataset/cityscapes"
+            mode:        "train" or "val" or "test"
+            cache_path:  "./dataset/cityscapes/manifest_train.npz", None이면 캐싱 안 함
+            num_workers: 병렬 스캔 스레드 수
+            cam_path:    왼쪽 카메라 시퀀스 폴더 (왼쪽, 오른쪽 파일이 같으므로 왼쪽으로 스캔)
+            suffix:      파일 이름에서 잘라낼 카메라 접미사
+
+        배열
+            cities / city_ids: 정렬된 도시 이름 / 줄마다 도시 id (int32)
+            sequences, frames: 줄마다 시퀀스 번호, 프레임 인덱스 (int32)
+        """
+        self.datapath      = datapath
+        self.mode          = mode
+        self.suffix        = suffix
+        self.location_path = os.path.join(datapath, cam_path, mode)
+        with os.scandir(self.location_path) as entries:
+            self.cities    = sorted(entry.name for entry in entries if entry.is_dir())
+        super(CityscapesManifest, self).__init__(self.cities, cache_path, num_workers)
+
+        codes          = np.concatenate([self.entries[city] for city in self.cities] + [np.zeros(0, dtype = np.int64)])
+        self.city_ids  = np.repeat(np.arange(len(self.cities)), [len(self.entries[city]) for city in self.cities]).astype(np.int32)
+        self.sequences = (codes // self.FRAME_BASE).astype(np.int32)
+        self.frames    = (codes % self.FRAME_BASE).astype(np.int32)
+
+
+    def directory(self, city):
+        return os.path.join(self.location_path, city)
+
+    def scan(self, city):
+        codes = []
+        if os.path.isdir(self.directory(city)):
+            with os.scandir(self.directory(city)) as entries:
+                for entry in entries:
+                    name = entry.name.split(self.suffix)[0] # aachen_000012_000019_leftImg8bit.png -> aachen_000012_000019
+                    if name == entry.name:
+                        continue
+                    location, sequence, frame = name.rsplit("_", 2)
+                    codes.append(int(sequence) * self.FRAME_BASE + int(frame))
+        return np.sort(np.array(codes, dtype = np.int64))
+
+
+    def sequence_positions(self):
+        """
+        returns:
+            order:    (city, sequence, frame) 순서의 줄 인덱스
+            position: order의 각 줄이 자기 시퀀스에서 몇 번째 프레임인지
+            length:   order의 각 줄이 속한 시퀀스의 프레임 수
+        """
+        order    = np.lexsort((self.frames, self.sequences, self.city_ids))
+        city_ids = self.city_ids[order]
+        sequence = self.sequences[order]
+        starts   = np.flatnonzero(np.r_[True, (city_ids[1:] != city_ids[:-1]) | (sequence[1:] != sequence[:-1])])
+        lengths  = np.diff(np.r_[starts, len(order)])
+        group    = np.repeat(np.arange(len(starts)), lengths)
+        return order, np.arange(len(order)) - starts[group], lengths[group]
+
+    def num_sequences(self):
+        return len(np.unique(self.city_ids.astype(np.int64) * self.FRAME_BASE + self.sequences))
+
+    def select(self, cut = (0, 0)):
+        """
+        시퀀스마다 앞에서 cut[0]개, 뒤에서 cut[1]개 프레임을 뺀 줄 인덱스 ((city, sequence, frame) 순서)
+        """
+        order, position, length = self.sequence_positions()
+        return order[(position >= cut[0]) & (position < length - cut[1])]
+
+    def lines(self, cut = (0, 0), sides = ("l", "r")):
+        """
+        returns:
+            ["aachen aachen_000000_000004 l", "aachen aachen_000000_000004 r", ...] 스플릿 파일 형식
+        """
+        rows = self.select(cut)
+        return ["{0} {0}_{1:06d}_{2:06d} {3}".format(self.cities[city_id], sequence, frame, side)
+                for city_id, sequence, frame in zip(self.city_ids[rows].tolist(), self.sequences[rows].tolist(), self.frames[rows].tolist())
+                for side in sides]
@@ -0,0 +1,166 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from torch.utils.data import Sampler
+
+
+
+# posix_fadvise가 없는 플랫폼 (macOS, Windows)에서는 파일을 직접 읽어서 page cache를 채움
+PREFETCH_MODES = ["fadvise", "read"] if hasattr(os, "posix_fadvise") else ["read"]
+
+
+def read_ahead(paths, mode = "fadvise", chunk_size = 2**20):
+    """
+    paths의 파일들을 page cache에 올리는 함수, 미리 읽기는 권고일 뿐이므로 열거나 읽지 못한 파일 (없는 파일, EACCES, NFS의 EIO 등)은 건너뜀
+    fadvise: POSIX_FADV_WILLNEED로 커널에 비동기 readahead를 요청하고 바로 반환
+    read:    chunk_size 단위로 끝까지 읽고 버림 (NFS처럼 fadvise가 효과 없는 파일 시스템용)
+
+    returns:
+        (요청한 바이트 수, 실패한 파일 수)
+    """
+    nbytes = 0
+    failed = 0
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            failed += 1
+            continue
+        try:
+            size = os.fstat(fd).st_size
+            if mode == "fadvise":
+                os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+            else:
+                while os.read(fd, chunk_size):
+                    pass
+            nbytes += size
+        except OSError:
+            failed += 1
+        finally:
+            os.close(fd)
+    return nbytes, failed
+
+
+class ReadAheadSampler(Sampler):
+    def __init__(self, sampler, dataset, window = 64, max_bytes = 256 * 2**20, num_threads = 4, mode = None):
+        """
+        sampler (또는 batch_sampler)를 감싸서, 다음에 나올 샘플들의 JPEG, 벨로다인 .bin 파일을 미리 읽어두는 sampler
+        sampler는 메인 프로세스에서 돌고 page cache는 프로세스끼리 공유되므로, 워커가 __getitem__에서 파일을 열 때는 이미 메모리에 있음
+
+        항목 (인덱스 or 인덱스 리스트)을 하나 내보낼 때마다 창을 다시 채움
+            창에는 읽기를 요청했지만 아직 내보내지 않은 항목이 최대 window개, 바이트 합계는 max_bytes 이하
+            아직 크기를 모르는 (읽는 중인) 항목은 지금까지 읽은 항목의 평균 크기로 계산
+        항목을 내보낼 때 읽기가 끝나 있으면 hit, 아직이면 late (창이 너무 작거나 디스크가 느림)
+
+        Args:
+            sampler:     torch Sampler, BatchSampler, SequenceChunkSampler 등 인덱스 or 인덱스 리스트를 내는 iterable
+            dataset:     sample_paths(index)가 있는 데이터셋
+            window:      미리 읽을 최대 항목 수
+            max_bytes:   창 안의 최대 바이트 수 (page cache를 밀어내지 않도록)
+            num_threads: 읽기 요청을 보낼 스레드 수
+            mode:        "fadvise" or "read", None이면 가능한 첫 번째 (PREFETCH_MODES)
+
+        ex)
+        sampler = ReadAheadSampler(SequenceChunkSampler(train_filename, 8, num_workers = 4), train_dataset, window = 32)
+        DataLoader(train_dataset, batch_sampler = sampler, num_workers = 4)
+        print(sampler.stats())
+        """
+        mode = PREFETCH_MODES[0] if mode is None else mode
+        if mode not in PREFETCH_MODES:
+            raise ValueError("mode는 {} 중 하나".format(PREFETCH_MODES))
+        self.sampler     = sampler
+        self.dataset     = dataset
+        self.window      = max(window, 1)
+        self.max_bytes   = max_bytes
+        self.num_threads = max(num_threads, 1)
+        self.mode        = mode
+        self.lock        = threading.Lock() # 읽기 완료 콜백은 스레드 풀에서 불림
+        self.reset_stats()
+
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def set_epoch(self, epoch):
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+
+
+    def item_paths(self, item):
+        indices = item if isinstance(item, (list, tuple)) else [item]
+        return [path for index in indices for path in self.dataset.sample_paths(index)]
+
+    def estimate(self):
+        """
+        읽기가 끝난 항목들의 평균 바이트 수, 아직 없으면 0
+        """
+        return self.counters["bytes"] / max(self.counters["completed"], 1)
+
+    def window_bytes(self, pending):
+        """
+        창 안의 바이트 수, 끝난 읽기는 실제 바이트 (예외로 끝났으면 0), 읽는 중이면 estimate()
+        """
+        estimate = self.estimate()
+        return sum((0 if future.exception() else future.result()[0]) if future.done() else estimate for _, future in pending)
+
+    def completed(self, future):
+        """
+        읽기 완료 콜백, 실패는 failed로 세기만 하고 sampler에서는 절대 예외를 올리지 않음
+        """
+        if future.cancelled():
+            return
+        with self.lock:
+            if future.exception() is not None:
+                self.counters["failed"] += 1
+                return
+            nbytes, failed = future.result()
+            self.counters["completed"] += 1
+            self.counters["bytes"]     += nbytes
+            self.counters["failed"]    += failed
+
+
+    def __iter__(self):
+        items   = iter(self.sampler)
+        pending = deque()
+        pool    = ThreadPoolExecutor(self.num_threads)
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < self.window and (
+                        not pending or self.window_bytes(pending) + self.estimate() <= self.max_bytes):
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    future = pool.submit(read_ahead, self.item_paths(item), self.mode)
+                    future.add_done_callback(self.completed)
+                    pending.append((item, future))
+                    self.counters["issued"] += 1
+                if not pending:
+                    break
+
+                item, future = pending.popleft()
+                self.counters["hits" if future.done() else "late"] += 1
+                yield item
+        finally:
+            pool.shutdown(wait = False, cancel_futures = True)
+
+
+    def stats(self):
+        """
+        returns:
+            issued:    읽기를 요청한 항목 수
+            hits:      내보낼 때 읽기가 끝나 있던 항목 수
+            late:      내보낼 때 아직 읽는 중이던 항목 수
+            hit_rate:  hits / (hits + late)
+            bytes:     읽기를 요청해서 끝난 바이트 수
+            failed:    열거나 읽지 못한 파일 수 (없는 파일, 권한, I/O 에러), 데이터셋이 읽을 때 같은 에러가 나는지 확인할 것
+        """
+        stats = dict(self.counters)
+        stats["hit_rate"] = stats["hits"] / max(stats["hits"] + stats["late"], 1)
+        return stats
+
+    def reset_stats(self):
+        self.counters = {"issued": 0, "hits": 0, "late": 0, "completed": 0, "bytes": 0, "failed": 0}
@@ -0,0 +1,285 @@
+import os
+import math
+import time
+import numpy as np
+
+import torch
+from torch.utils.data import DataLoader
+from torch.utils.data import get_worker_info
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+DataLoader 처리량 프로파일러 (Tools.sample_dataset 대체)
+소비자 (학습 루프) 쪽에서는 next()를 기다린 시간을, 워커 쪽에서는 배치 하나를 만드는 데 걸린 시간을 재서
+첫 배치까지 시간, steady-state 배치 / s, 배치 간격 분포, 소비자 starvation과 워커 idle, num_workers / prefetch_factor 제안을 만듬
+
+class BatchClock      워커마다 배치를 만든 시간 (첫 __getitem__ ~ collate 끝)을 공유 메모리에 기록
+class TimedDataset    데이터셋을 감싸서 배치의 첫 __getitem__ 시각을 BatchClock에 알림
+class TimedCollate    collate_fn을 감싸서 배치가 끝난 시각을 BatchClock에 기록
+class LoaderProfiler  DataLoader를 TimedDataset, TimedCollate로 다시 만들어서 N 배치를 돌리고 요약
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+class BatchClock(object):
+    def __init__(self, max_workers = 64, history = 4096):
+        """
+        워커 (메인 프로세스는 0번 행, 워커 i는 i + 1번 행)마다 [바쁜 ns 합계, 배치 수]와 최근 history개 배치의 걸린 ns
+        시작 시각 (started)은 프로세스마다 따로 있음 (DataLoader 워커는 배치 하나를 끝까지 만든 다음 다음 배치를 시작)
+        """
+        self.history   = history
+        self.totals    = torch.zeros((max_workers + 1, 2), dtype = torch.int64).share_memory_()
+        self.durations = torch.zeros((max_workers + 1, history), dtype = torch.int64).share_memory_()
+        self.cursor    = torch.zeros(max_workers + 1, dtype = torch.int64).share_memory_()
+        self.started   = None
+
+
+    def start(self):
+        if self.started is None:
+            self.started = time.perf_counter_ns()
+
+    def stop(self):
+        if self.started is None:
+            return
+        duration     = time.perf_counter_ns() - self.started
+        self.started = None
+        worker_info  = get_worker_info()
+        worker       = 0 if worker_info is None else worker_info.id + 1
+        if worker >= len(self.cursor): # 행을 같이 쓰면 프로세스 사이의 += 갱신이 서로 덮어씀
+            raise ValueError("워커 {}번을 기록할 행이 없음, LoaderProfiler(max_workers >= num_workers)로 만들 것".format(worker_info.id))
+        totals, durations, cursor = self.totals.numpy(), self.durations.numpy(), self.cursor.numpy()
+        totals[worker] += (duration, 1)
+        durations[worker, cursor[worker] % self.history] = duration
+        cursor[worker] += 1
+
+
+    def busy(self):
+        """
+        returns:
+            모든 워커의 바쁜 시간 합계 (초)
+        """
+        return int(self.totals[:, 0].sum()) / 1e9
+
+    def batch_times(self):
+        """
+        returns:
+            워커들이 최근에 만든 배치의 걸린 시간 (초) 배열
+        """
+        counts = np.minimum(self.cursor.numpy(), self.history)
+        return np.concatenate([self.durations.numpy()[worker, :count] for worker, count in enumerate(counts)]) / 1e9
+
+    def reset(self):
+        for tensor in [self.totals, self.durations, self.cursor]:
+            tensor.zero_()
+        self.started = None
+
+
+
+class TimedDataset(object):
+    def __init__(self, dataset, clock):
+        self.dataset = dataset
+        self.clock   = clock
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        self.clock.start()
+        return self.dataset[index]
+
+    def __getattr__(self, name): # sample_paths 등은 원래 데이터셋으로
+        if name in ["dataset", "clock"]: # unpickle 중에는 아직 없음
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+
+
+class TimedCollate(object):
+    def __init__(self, collate_fn, clock):
+        self.collate_fn = collate_fn
+        self.clock      = clock
+
+    def __call__(self, samples):
+        batch = self.collate_fn(samples)
+        self.clock.stop()
+        return batch
+
+
+
+class LoaderProfiler(object):
+    def __init__(self, loader, max_workers = None, history = 4096):
+        """
+        loader와 같은 설정 (sampler, num_workers, prefetch_factor, collate_fn ...)으로 DataLoader를 다시 만들어서
+        데이터셋과 collate_fn에 시계를 달고 프로파일링하는 클래스, 원래 loader는 건드리지 않음
+        shuffle이면 sampler를 같이 쓰므로 순서는 원래 loader를 한 번 더 돌린 것과 같음
+
+        측정
+            first:          iter() ~ 첫 배치 (워커 시작 + 첫 배치 생성)
+            steady:         warmup 배치 이후 배치 / s (처음 num_workers * prefetch_factor 배치는 미리 만들어져 있어서 뺌)
+            gaps:           소비자가 배치마다 next()에서 기다린 시간의 분포
+            starved:        steady 구간에서 소비자가 next()를 기다린 시간 비율 (높으면 로더가 병목)
+            worker_idle:    steady 구간에서 워커가 배치를 만들지 않고 쉰 시간 비율 (높으면 소비자가 병목, 워커가 남음)
+
+        Args:
+            loader:      torch DataLoader (map-style 데이터셋)
+            max_workers: 기록할 최대 워커 수, None이면 loader.num_workers (워커마다 한 행), num_workers보다 작으면 ValueError
+            history:     워커마다 보관할 배치 시간 수
+
+        ex)
+        profiler = LoaderProfiler(train_loader)
+        profiler.run(100, step_time = 0.12) # 학습 step 하나가 0.12초라고 보고 소비
+        profiler.report()
+        """
+        if max_workers is not None and max_workers < loader.num_workers:
+            raise ValueError("max_workers ({})는 loader.num_workers ({}) 이상이어야 함".format(max_workers, loader.num_workers))
+        self.loader  = loader
+        self.clock   = BatchClock(loader.num_workers if max_workers is None else max_workers, history)
+        self.batches = []
+        self.result  = None
+
+
+    def build(self):
+        """
+        loader의 설정을 그대로 복사하고 dataset, collate_fn만 감싼 DataLoader
+        """
+        loader = self.loader
+        kwargs = {
+            "num_workers":             loader.num_workers,
+            "collate_fn":              TimedCollate(loader.collate_fn, self.clock),
+            "pin_memory":              loader.pin_memory,
+            "timeout":                 loader.timeout,
+            "worker_init_fn":          loader.worker_init_fn,
+            "multiprocessing_context": loader.multiprocessing_context,
+            "generator":               loader.generator,
+            "persistent_workers":      loader.persistent_workers}
+        if loader.num_workers > 0:
+            kwargs["prefetch_factor"] = loader.prefetch_factor
+        if loader.batch_sampler is not None:
+            kwargs["batch_sampler"] = loader.batch_sampler
+        else: # batch_size = None (auto collation 없음)
+            kwargs.update({"sampler": loader.sampler, "batch_size": None})
+        return DataLoader(TimedDataset(loader.dataset, self.clock), **kwargs)
+
+
+    def run(self, num_batches = 50, warmup = None, step_time = 0.0, keep = False):
+        """
+        Args:
+            num_batches: 돌릴 배치 수, None이면 loader가 끝날 때까지
+            warmup:      steady 계산에서 뺄 앞쪽 배치 수, None이면 num_workers * prefetch_factor (미리 채워진 큐)
+            step_time:   배치마다 소비자가 쓰는 시간 (초, 학습 step 대신 sleep), 0이면 로더 최대 처리량 측정 (starved는 항상 ~1)
+            keep:        True면 배치를 self.batches에 보관
+
+        returns:
+            summary()
+        """
+        loader  = self.build()
+        workers = loader.num_workers
+        if warmup is None:
+            warmup = workers * (loader.prefetch_factor or 2) if workers > 0 else 1
+        self.clock.reset()
+        self.batches = []
+
+        gaps     = []
+        start    = time.perf_counter()
+        iterator = iter(loader)
+        steady   = None
+        while num_batches is None or len(gaps) < num_batches:
+            wait = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                break
+            now = time.perf_counter()
+            gaps.append(now - wait)
+            if len(gaps) == 1:
+                first = now - start
+            if len(gaps) == warmup + 1: # warmup 배치 다음부터 steady (이 배치를 기다린 시간부터 포함)
+                steady = (wait, self.clock.busy(), len(gaps) - 1)
+            if keep:
+                self.batches.append(batch)
+            if step_time > 0:
+                time.sleep(step_time)
+        end  = time.perf_counter()
+        busy = self.clock.busy()
+        del iterator # 워커 종료
+
+        if not gaps:
+            raise ValueError("loader가 배치를 하나도 내지 않음")
+        if steady is None: # 배치가 warmup보다 적으면 두 번째 배치부터
+            steady = (start + gaps[0], 0.0, 1) if len(gaps) > 1 else (start, 0.0, 0)
+        steady_start, steady_busy, steady_index = steady
+        wall     = max(end - steady_start, 1e-9)
+        measured = gaps[steady_index:]
+        self.result = {
+            "num_workers":     workers,
+            "prefetch_factor": loader.prefetch_factor if workers > 0 else None,
+            "step_time":       step_time,
+            "batches":         len(gaps),
+            "warmup":          steady_index,
+            "first":           first,
+            "steady_per_sec":  len(measured) / wall,
+            "gaps":            np.array(gaps),
+            "batch_times":     self.clock.batch_times(),
+            "starved":         min(sum(measured) / wall, 1.0),
+            "worker_idle":     max(1.0 - (busy - steady_busy) / (wall * max(workers, 1)), 0.0) if workers > 0 else 0.0}
+        return self.summary()
+
+
+    def summary(self):
+        """
+        returns:
+            first (s), steady_per_sec, gap_ms {mean, p50, p90, p99, max}, batch_ms {mean, p50, p99},
+            starved, worker_idle, diagnosis, suggest {num_workers, prefetch_factor}
+        """
+        if self.result is None:
+            raise ValueError("run()을 먼저 부를 것")
+        result = self.result
+        gaps   = result["gaps"][result["warmup"]:] if len(result["gaps"]) > result["warmup"] else result["gaps"]
+        times  = result["batch_times"] if len(result["batch_times"]) else np.zeros(1)
+        if result["starved"] > 0.1 and result["worker_idle"] < 0.2:
+            diagnosis = "loader-bound"   # 소비자가 기다리고 워커는 쉬지 않음 -> 워커를 늘림
+        elif result["worker_idle"] > 0.3 and result["starved"] < 0.05:
+            diagnosis = "consumer-bound" # 워커가 남음 -> 줄여도 됨
+        else:
+            diagnosis = "balanced"
+        return {
+            "num_workers":     result["num_workers"],
+            "prefetch_factor": result["prefetch_factor"],
+            "batches":         result["batches"],
+            "first":           result["first"],
+            "steady_per_sec":  result["steady_per_sec"],
+            "gap_ms":          {"mean": float(gaps.mean() * 1000), "p50": float(np.percentile(gaps, 50) * 1000),
+                                "p90": float(np.percentile(gaps, 90) * 1000), "p99": float(np.percentile(gaps, 99) * 1000),
+                                "max": float(gaps.max() * 1000)},
+            "batch_ms":        {"mean": float(times.mean() * 1000), "p50": float(np.percentile(times, 50) * 1000),
+                                "p99": float(np.percentile(times, 99) * 1000)},
+            "starved":         result["starved"],
+            "worker_idle":     result["worker_idle"],
+            "diagnosis":       diagnosis,
+            "suggest":         self.suggest(times)}
+
+
+    def suggest(self, times):
+        """
+        배치 하나를 만드는 평균 시간 T, p99 시간 T99, 소비자 step 시간 S, CPU 수 C로 근사
+            num_workers:     S > 0이면 ceil(T / S) (소비자가 기다리지 않는 최소 워커 수), S = 0이면 C - 1 (메인 프로세스 몫 하나), 1 ~ C
+            prefetch_factor: 느린 배치 하나 (T99 - T) 동안 소비자가 가져갈 배치 수를 워커들이 나눠서 미리 들고 있을 만큼, 2 ~ 16
+        """
+        cpus    = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        mean    = float(times.mean())
+        step    = self.result["step_time"]
+        workers = math.ceil(mean / step) if step > 0 else cpus - 1
+        workers = min(max(workers, 1), cpus)
+        period  = max(step, mean / workers) # steady에서 소비자가 배치를 가져가는 간격
+        extra   = math.ceil(max(float(np.percentile(times, 99)) - mean, 0.0) / max(period, 1e-9))
+        return {"num_workers": workers, "prefetch_factor": min(max(math.ceil(extra / workers) + 1, 2), 16)}
+
+
+    def report(self):
+        summary = self.summary()
+        print(">>>  Loader workers        :  {0}  prefetch_factor {1}".format(summary["num_workers"], summary["prefetch_factor"]))
+        print(">>>  First batch (s)       :  {0:.3f}".format(summary["first"]))
+        print(">>>  Steady batches / s    :  {0:.2f}  ({1} batches)".format(summary["steady_per_sec"], summary["batches"]))
+        print(">>>  Gap (ms)              :  mean {mean:.1f}  p50 {p50:.1f}  p90 {p90:.1f}  p99 {p99:.1f}  max {max:.1f}".format(**summary["gap_ms"]))
+        print(">>>  Worker batch (ms)     :  mean {mean:.1f}  p50 {p50:.1f}  p99 {p99:.1f}".format(**summary["batch_ms"]))
+        print(">>>  Starved / worker idle :  {0:.2f} / {1:.2f}  ({2})".format(summary["starved"], summary["worker_idle"], summary["diagnosis"]))
+        print(">>>  Suggest               :  num_workers {num_workers}  prefetch_factor {prefetch_factor}".format(**summary["suggest"]))
+        return summary
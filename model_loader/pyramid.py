@@ -0,0 +1,118 @@
+import time
+import numpy as np
+import cv2
+
+
+
+"""
+이미지 피라미드를 만드는 함수 모듈
+direct:  모든 스케일을 원본 해상도에서 각각 리사이즈 (기존 방식)
+cascade: 스케일 i를 스케일 i - 1에서 리사이즈
+exact:   cascade와 같지만 크기 비율이 정수면 (192 -> 96 -> 48 -> 24) 블록 평균으로 정확하게 줄임
+numpy 배열은 cv2.resize (albumentations Resize와 같은 경로), PIL 이미지는 Image.resize를 사용
+"""
+PYRAMID_MODES = ["direct", "cascade", "exact"]
+
+
+def image_size(image):
+    """
+    returns: (height, width)
+    """
+    if isinstance(image, np.ndarray):
+        return image.shape[:2]
+    return image.height, image.width
+
+
+def resize_level(image, size, interpolation):
+    height, width = size
+    if isinstance(image, np.ndarray):
+        return cv2.resize(image, (width, height), interpolation = interpolation)
+    return image.resize((width, height), interpolation)
+
+
+def exact_factor(source, target):
+    """
+    source (H, W)가 target (h, w)의 정수배면 그 배수, 아니면 None
+    """
+    if source[0] % target[0] == 0 and source[1] % target[1] == 0 and source[0] // target[0] == source[1] // target[1]:
+        return source[0] // target[0]
+    return None
+
+
+def reduce_exact(image, factor):
+    """
+    factor x factor 블록의 평균으로 이미지를 줄이는 함수
+    cv2.INTER_AREA는 정수배 축소일 때 블록 평균과 같고, PIL은 Image.reduce가 블록 평균
+    """
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[0] // factor, image.shape[1] // factor
+        return cv2.resize(image, (width, height), interpolation = cv2.INTER_AREA)
+    return image.reduce(factor)
+
+
+def build_pyramid(image, scale_list, interpolation, mode = "cascade"):
+    """
+    Args:
+        image:         원본 해상도 이미지 (numpy [H, W, C] or PIL)
+        scale_list:    [(192, 640), (96, 320), (48, 160), (24, 80)]
+        interpolation: numpy면 cv2 플래그 (cv2.INTER_AREA), PIL이면 PIL 필터 (Image.ANTIALIAS)
+        mode:          "direct" or "cascade" or "exact"
+
+    returns:
+        scale_list 순서대로의 이미지 리스트
+    """
+    if mode not in PYRAMID_MODES:
+        raise ValueError("pyramid mode는 {} 중 하나".format(PYRAMID_MODES))
+
+    pyramid = []
+    source  = image
+    for size in scale_list:
+        if mode == "direct":
+            source = image
+
+        factor = exact_factor(image_size(source), size) if mode == "exact" else None
+        if factor == 1:
+            level = source
+        elif factor is not None:
+            level = reduce_exact(source, factor)
+        else:
+            level = resize_level(source, size, interpolation)
+        pyramid.append(level)
+        source = level
+    return pyramid
+
+
+def pyramid_report(image, scale_list, interpolation, repeat = 5):
+    """
+    cascade / exact 피라미드를 기존 방식 (direct)과 스케일별로 비교하는 함수
+    Args:
+        image:         원본 해상도 이미지 (numpy or PIL)
+        scale_list:    [(192, 640), (96, 320), (48, 160), (24, 80)]
+        interpolation: cv2.INTER_AREA or Image.ANTIALIAS
+        repeat:        시간 측정 반복 횟수 (최솟값을 사용)
+
+    returns:
+        {mode: {"ms": 피라미드 하나 만드는 시간, "max_abs": [스케일별], "mean_abs": [스케일별], "psnr": [스케일별]}}
+    """
+    report = {}
+    for mode in PYRAMID_MODES:
+        elapsed = []
+        for _ in range(repeat):
+            start   = time.perf_counter()
+            pyramid = build_pyramid(image, scale_list, interpolation, mode)
+            elapsed.append(time.perf_counter() - start)
+        report[mode] = {"ms": 1000 * min(elapsed), "levels": [np.asarray(level, dtype = np.float64) for level in pyramid]}
+
+    reference = report["direct"].pop("levels")
+    for mode in ["cascade", "exact"]:
+        levels = report[mode].pop("levels")
+        diffs  = [np.abs(level - direct) for level, direct in zip(levels, reference)]
+        report[mode]["max_abs"]  = [float(diff.max()) for diff in diffs]
+        report[mode]["mean_abs"] = [float(diff.mean()) for diff in diffs]
+        report[mode]["psnr"]     = [float(10 * np.log10(255.0 ** 2 / max(np.mean(diff ** 2), 1e-12))) for diff in diffs]
+
+    print(">>>  Pyramid direct        :  {0:.2f} ms".format(report["direct"]["ms"]))
+    for mode in ["cascade", "exact"]:
+        print(">>>  Pyramid {0:<13} :  {1:.2f} ms  max_abs {2}  psnr {3}".format(
+            mode, report[mode]["ms"], report[mode]["max_abs"], ["{:.1f}".format(psnr) for psnr in report[mode]["psnr"]]))
+    return report
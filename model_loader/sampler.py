@@ -0,0 +1,178 @@
+import math
+import random
+import numpy as np
+from collections import deque
+
+from torch.utils.data import Sampler
+
+
+
+def parse_sequence(line):
+    """
+    스플릿 파일 한 줄에서 (시퀀스 키, 프레임 번호)를 뽑는 함수
+    ex)
+    KITTI:      "2011_09_26/2011_09_26_drive_0057_sync 311 l"     -> (("2011_09_26/2011_09_26_drive_0057_sync", "l"), 311)
+    Cityscapes: "aachen aachen_000000_000019 l"                   -> (("aachen", "000000", "l"), 19)
+    side가 없는 레거시 스플릿 (city_watson)은 "l"로 취급
+    """
+    line = line.split()
+    folder, key_frame, side = line[0], line[1], line[2] if len(line) > 2 else "l"
+    if key_frame.isdigit():
+        return (folder, side), int(key_frame)
+
+    location, sequence, frame_index = key_frame.split("_")
+    return (folder, sequence, side), int(frame_index)
+
+
+class SequenceChunkSampler(Sampler):
+    def __init__(self, filename, batch_size, chunk_length = 8, num_workers = 1, drop_last = False, seed = None):
+        """
+        드라이브 (시퀀스) 안에서 연속된 chunk_length개의 프레임을 한 덩어리로 묶어서 섞는 batch_sampler
+        전체를 섞는 대신 덩어리 단위로 섞기 때문에 워커마다 직전 배치와 이웃한 프레임을 읽게 되어
+        page cache와 FrameCache 재사용이 크게 늘어남
+
+        배치 구성
+            워커마다 batch_size개의 레인이 있고, 레인은 섞인 덩어리를 하나씩 받아서 앞에서부터 소비
+            배치 b는 DataLoader가 b % num_workers번 워커에 보내므로, 그 워커의 레인에서 하나씩 뽑아서 배치를 만듬
+            -> 한 배치 안의 샘플은 서로 다른 덩어리 (무작위 드라이브)에서 오고
+            -> 같은 워커의 다음 배치는 같은 레인의 다음 프레임을 읽음
+
+        Args:
+            filename:     splits file of KITTI or Cityscapes
+            batch_size:   DataLoader의 batch_size
+            chunk_length: 한 덩어리의 프레임 수, 1이면 전체 셔플과 같음
+            num_workers:  DataLoader의 num_workers (0이면 1로 취급)
+            drop_last:    마지막 배치가 batch_size보다 작으면 버림
+            seed:         None이면 매 에폭 random 모듈의 상태를 사용, 아니면 seed + epoch
+
+        ex)
+        sampler = SequenceChunkSampler(train_filename, 8, chunk_length = 16, num_workers = 4)
+        DataLoader(train_dataset, batch_sampler = sampler, num_workers = 4)
+        """
+        self.filename     = filename
+        self.batch_size   = batch_size
+        self.chunk_length = chunk_length
+        self.num_workers  = max(num_workers, 1)
+        self.drop_last    = drop_last
+        self.seed         = seed
+        self.epoch        = 0
+
+        # 시퀀스 키마다 프레임 번호 순으로 정렬된 샘플 인덱스
+        groups = {}
+        self.frames = np.zeros(len(filename), dtype = np.int64)
+        self.groups = np.zeros(len(filename), dtype = np.int64)
+        for index, line in enumerate(filename):
+            key, frame = parse_sequence(line)
+            groups.setdefault(key, []).append(index)
+            self.frames[index] = frame
+        self.sequences = []
+        for group, indices in enumerate(groups.values()):
+            indices = np.array(indices, dtype = np.int64)
+            self.sequences.append(indices[np.argsort(self.frames[indices], kind = "stable")])
+            self.groups[indices] = group
+
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def make_chunks(self, rng):
+        """
+        시퀀스마다 시작 위치를 무작위로 밀어서 덩어리 경계가 에폭마다 달라지게 하고, 덩어리 순서를 섞음
+        """
+        chunks = []
+        for indices in self.sequences:
+            offset  = rng.randrange(self.chunk_length) or self.chunk_length
+            bounds  = [0] + list(range(offset, len(indices), self.chunk_length)) + [len(indices)]
+            chunks += [indices[start: end].tolist() for start, end in zip(bounds[:-1], bounds[1:])]
+        rng.shuffle(chunks)
+        return chunks
+
+
+    def __iter__(self):
+        rng    = random.Random(self.seed + self.epoch) if self.seed is not None else random
+        queue  = deque(self.make_chunks(rng))
+        lanes  = [[deque() for _ in range(self.batch_size)] for _ in range(self.num_workers)]
+
+        batch_index = 0
+        leftover    = []
+        while queue:
+            batch = []
+            for lane in lanes[batch_index % self.num_workers]:
+                if not lane and queue:
+                    lane.extend(queue.popleft())
+                if lane:
+                    batch.append(lane.popleft())
+
+            if len(batch) < self.batch_size: # 덩어리가 바닥나서 배치를 못 채우면 남은 것과 함께 처리
+                leftover = batch
+                break
+            yield batch
+            batch_index += 1
+
+        # 남은 레인을 워커, 레인 순서로 이어 붙여서 순서대로 배치를 만듬
+        for worker_lanes in lanes:
+            for lane in worker_lanes:
+                leftover += list(lane)
+        for start in range(0, len(leftover), self.batch_size):
+            batch = leftover[start: start + self.batch_size]
+            if len(batch) == self.batch_size or not self.drop_last:
+                yield batch
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.filename) // self.batch_size
+        return math.ceil(len(self.filename) / self.batch_size)
+
+
+    def worker_streams(self, batches):
+        """
+        배치 순서를 DataLoader와 똑같이 워커에 나눠서, 워커마다 처리하는 샘플 순서 리스트를 반환
+        """
+        streams = [[] for _ in range(self.num_workers)]
+        for batch_index, batch in enumerate(batches):
+            streams[batch_index % self.num_workers].append(batch)
+        return streams
+
+    def locality(self, batches, frame_ids = [0]):
+        """
+        Args:
+            batches:   배치 (샘플 인덱스 리스트)의 리스트
+            frame_ids: 샘플마다 읽는 상대 프레임 위치
+
+        returns:
+            frame_reuse:     워커가 읽는 프레임 중 바로 직전 배치에서도 읽은 프레임의 비율 (FrameCache hit rate의 근사)
+            same_sequence:   워커의 직전 배치와 같은 시퀀스에서 온 샘플의 비율
+            groups_per_batch 배치 하나에 섞여 있는 서로 다른 시퀀스 수의 평균
+        """
+        reused, needed, same, total, groups = 0, 0, 0, 0, []
+        for stream in self.worker_streams(batches):
+            previous_frames = set()
+            previous_groups = set()
+            for batch in stream:
+                frames = {(self.groups[index], self.frames[index] + frame_id) for index in batch for frame_id in frame_ids}
+                reused += len(frames & previous_frames)
+                needed += len(frames)
+                same   += sum(self.groups[index] in previous_groups for index in batch)
+                total  += len(batch)
+                groups.append(len({self.groups[index] for index in batch}))
+                previous_frames = frames
+                previous_groups = {self.groups[index] for index in batch}
+        return {
+            "frame_reuse":      reused / max(needed, 1),
+            "same_sequence":    same / max(total, 1),
+            "groups_per_batch": float(np.mean(groups)) if groups else 0.0}
+
+    def locality_report(self, frame_ids = [0]):
+        """
+        이번 에폭의 배치 순서와 전체 셔플을 같은 기준으로 비교해서 출력
+        """
+        batches  = list(iter(self))
+        shuffled = list(range(len(self.filename)))
+        random.Random(self.epoch).shuffle(shuffled)
+        shuffled = [shuffled[start: start + self.batch_size] for start in range(0, len(shuffled), self.batch_size)]
+
+        report = {"chunk": self.locality(batches, frame_ids), "shuffle": self.locality(shuffled, frame_ids)}
+        print(">>>  Chunk length       :  {0}".format(self.chunk_length))
+        for key in ["frame_reuse", "same_sequence", "groups_per_batch"]:
+            print(">>>  {0:<18} :  chunk {1:.3f}  shuffle {2:.3f}".format(key, report["chunk"][key], report["shuffle"][key]))
+        return report
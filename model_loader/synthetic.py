@@ -0,0 +1,262 @@
+import os
+import cv2
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from model_utility import *
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+원본 데이터셋 (KITTI raw 175 GB, Cityscapes sequence) 없이 로더를 벤치마크하기 위한 가짜 데이터셋 트리 생성 모듈
+폴더 구조, 파일 이름, 이미지 해상도, JPEG / PNG 크기, 벨로다인 스캔 크기는 실제 데이터와 같게 맞춤
+
+def synthetic_velodyne  HDL-64E 스캔 하나 (64 빔 x 약 1900 방위각, 지면 + 장애물 거리 분포, float32 (N, 4))
+def synthetic_image     하늘 / 도로 그라디언트 + 저주파 구조물 + 센서 노이즈 (JPEG 92 기준 실제와 비슷한 파일 크기)
+def make_kitti          날짜 폴더 (캘리브레이션 파일) + 드라이브 폴더 (image_02/03, velodyne_points) 생성, 스플릿 줄 반환
+def make_cityscapes     도시별 leftImg8bit / rightImg8bit 시퀀스 폴더 생성, 스플릿 줄 반환
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# 날짜별 rectified 이미지 크기 (height, width), KITTI raw와 같음
+KITTI_IMAGE_SIZES = {
+    "2011_09_26": (375, 1242),
+    "2011_09_28": (370, 1224),
+    "2011_09_29": (374, 1238),
+    "2011_09_30": (370, 1226),
+    "2011_10_03": (376, 1241)}
+CITYSCAPES_IMAGE_SIZE = (1024, 2048)
+
+# 2011_09_26의 캘리브레이션 값, 다른 날짜는 S_rect만 그 날짜의 이미지 크기로 바꿔서 씀
+KITTI_CAM2CAM = """calib_time: 09-Jan-2012 13:57:47
+corner_dist: 9.950000e-02
+S_rect_00: {width:.6e} {height:.6e}
+R_rect_00: 9.999239e-01 9.837760e-03 -7.445048e-03 -9.869795e-03 9.999421e-01 -4.278459e-03 7.402527e-03 4.351614e-03 9.999631e-01
+P_rect_00: 7.215377e+02 0.000000e+00 6.095593e+02 0.000000e+00 0.000000e+00 7.215377e+02 1.728540e+02 0.000000e+00 0.000000e+00 0.000000e+00 1.000000e+00 0.000000e+00
+S_rect_02: {width:.6e} {height:.6e}
+R_rect_02: 9.998817e-01 1.511453e-02 -2.841595e-03 -1.511724e-02 9.998853e-01 -9.338510e-04 2.827154e-03 9.766976e-04 9.999955e-01
+P_rect_02: 7.215377e+02 0.000000e+00 6.095593e+02 4.485728e+01 0.000000e+00 7.215377e+02 1.728540e+02 2.163791e-01 0.000000e+00 0.000000e+00 1.000000e+00 2.745884e-03
+S_rect_03: {width:.6e} {height:.6e}
+R_rect_03: 9.998321e-01 -7.193136e-03 1.685599e-02 7.232804e-03 9.999712e-01 -2.293585e-03 -1.683901e-02 2.415116e-03 9.998553e-01
+P_rect_03: 7.215377e+02 0.000000e+00 6.095593e+02 -3.395242e+02 0.000000e+00 7.215377e+02 1.728540e+02 2.199936e+00 0.000000e+00 0.000000e+00 1.000000e+00 2.729905e-03
+"""
+KITTI_VELO2CAM = """calib_time: 15-Mar-2012 11:37:16
+R: 7.533745e-03 -9.999714e-01 -6.166020e-04 1.480249e-02 7.280733e-04 -9.998902e-01 9.998621e-01 7.523790e-03 1.480755e-02
+T: -4.069766e-03 -7.631618e-02 -2.717806e-01
+delta_f: 0.000000e+00 0.000000e+00
+delta_c: 0.000000e+00 0.000000e+00
+"""
+
+
+def synthetic_velodyne(rng, beams = 64, azimuths = 1900, sensor_height = 1.73, max_range = 120.0, dropout = 0.05):
+    """
+    HDL-64E 스캔 하나를 흉내 낸 포인트 클라우드, 실제 스캔처럼 약 12만 개 (1.9 MB)
+    아래쪽 빔은 지면 (센서 높이 sensor_height)에, 그 외는 방위각 구간마다 거리 5 ~ 60 m, 높이 1.5 ~ 15 m인 장애물에 맞음
+    장애물보다 높게 지나가거나 max_range를 넘는 빔, dropout 비율의 빔은 반사가 없는 것으로 보고 뺌
+
+    returns:
+        (N, 4) float32 [x, y, z, reflectance] 벨로다인 좌표계 (x 앞, y 왼쪽, z 위)
+    """
+    elevation = np.deg2rad(np.linspace(2.0, -24.8, beams))[:, np.newaxis]
+    azimuth   = np.linspace(-np.pi, np.pi, azimuths, endpoint = False)[np.newaxis, :]
+
+    # 방위각을 구간으로 나눠서 구간마다 장애물 하나 (건물, 차량, 나무)
+    edges     = np.sort(rng.integers(0, azimuths, 47))
+    sectors   = np.searchsorted(edges, np.arange(azimuths), side = "right")
+    distance  = rng.uniform(5.0, 60.0, 48)[sectors][np.newaxis, :]
+    height    = rng.uniform(1.5, 15.0, 48)[sectors][np.newaxis, :]
+
+    ground    = np.where(elevation < 0, sensor_height / np.tan(-np.minimum(elevation, -1e-6)), np.inf)
+    obstacle  = distance / np.cos(elevation)
+    hit_wall  = (distance * np.tan(elevation) + sensor_height) < height
+    ranges    = np.minimum(ground, np.where(hit_wall, obstacle, np.inf))
+    ranges    = ranges + rng.normal(0, 0.02, ranges.shape)
+    valid     = (ranges < max_range) & (rng.random(ranges.shape) >= dropout)
+
+    ranges    = ranges[valid]
+    elevation = np.broadcast_to(elevation, valid.shape)[valid]
+    azimuth   = np.broadcast_to(azimuth, valid.shape)[valid]
+    points       = np.empty((len(ranges), 4), dtype = np.float32)
+    points[:, 0] = ranges * np.cos(elevation) * np.cos(azimuth)
+    points[:, 1] = ranges * np.cos(elevation) * np.sin(azimuth)
+    points[:, 2] = ranges * np.sin(elevation)
+    points[:, 3] = np.clip(rng.normal(0.3, 0.15, len(ranges)), 0, 1)
+    return points
+
+
+def synthetic_image(rng, height, width, noise = 6.0):
+    """
+    하늘 (위) -> 도로 (아래) 그라디언트에 저주파 블록 (건물, 차량 크기)과 가우시안 센서 노이즈를 더한 BGR 이미지
+    완전한 노이즈는 JPEG이 너무 크고, 그라디언트만 있으면 너무 작기 때문에 그 사이로 실제 파일 크기에 맞춤
+
+    returns:
+        (height, width, 3) uint8
+    """
+    rows     = np.linspace(0, 1, height, dtype = np.float32)[:, np.newaxis, np.newaxis]
+    sky      = np.array([200, 170, 140], dtype = np.float32)
+    road     = np.array([ 90,  95, 100], dtype = np.float32)
+    image    = sky * (1 - rows) + road * rows
+    blocks   = rng.uniform(-60, 60, (height // 24 + 1, width // 24 + 1, 3)).astype(np.float32)
+    image    = image + cv2.resize(blocks, (width, height), interpolation = cv2.INTER_NEAREST)
+    image    = cv2.GaussianBlur(image, (0, 0), 2.0)
+    image    = image + rng.normal(0, noise, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def encode_image(image, ext, quality = 92):
+    """
+    README의 png -> jpg 변환과 같은 화질 (quality 92)로 인코딩한 바이트
+    """
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext.lower() in [".jpg", ".jpeg"] else []
+    ok, encoded = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError("{} 인코딩 실패".format(ext))
+    return encoded.tobytes()
+
+
+def write_files(files, num_workers = 8):
+    """
+    files: [(경로, 바이트), ...] 폴더가 없으면 만듬
+    """
+    for directory in sorted({os.path.dirname(path) for path, _ in files}):
+        os.makedirs(directory, exist_ok = True)
+
+    def write(item):
+        path, payload = item
+        with open(path, "wb") as f:
+            f.write(payload)
+    with ThreadPoolExecutor(max(num_workers, 1)) as pool:
+        list(pool.map(write, files))
+
+
+def make_kitti(root, dates = ("2011_09_26",), drives = 2, frames = 100, ext = ".jpg", variants = 8, seed = 0, num_workers = 8):
+    """
+    KITTI raw와 같은 구조의 가짜 트리를 만드는 함수
+    ㄴroot
+        ㄴ2011_09_26
+            ㄴcalib_cam_to_cam.txt, calib_velo_to_cam.txt
+            ㄴ2011_09_26_drive_0001_sync
+                ㄴimage_02/data/0000000000.jpg ... ...
+                ㄴimage_03/data/0000000000.jpg ... ...
+                ㄴvelodyne_points/data/0000000000.bin ... ...
+
+    드라이브마다 카메라별 이미지 variants개, 스캔 variants개를 만들어서 프레임마다 돌려 씀
+    파일은 프레임마다 따로 있으므로 page cache, 디코딩 비용은 실제와 같고, 생성 시간은 variants개 만큼만 듬
+
+    Args:
+        root:     "./dataset/kitti_synthetic"
+        dates:    KITTI_IMAGE_SIZES의 날짜들, 날짜마다 이미지 크기가 다름
+        drives:   날짜마다 드라이브 수
+        frames:   드라이브마다 프레임 수 (int) or 드라이브 순서대로 프레임 수 리스트 (실제 드라이브는 100 ~ 4500)
+        ext:      ".jpg" or ".png"
+        variants: 드라이브, 카메라마다 서로 다른 이미지 (스캔) 수
+        seed:     같은 seed면 같은 트리
+
+    returns:
+        스플릿 줄 리스트 ["2011_09_26/2011_09_26_drive_0001_sync 0 l", ...] 모든 프레임, 양쪽 카메라
+    """
+    rng   = np.random.default_rng(seed)
+    lines = []
+    count = 0
+    for date in dates:
+        if date not in KITTI_IMAGE_SIZES:
+            raise ValueError("dates는 {} 중에서".format(list(KITTI_IMAGE_SIZES)))
+        height, width = KITTI_IMAGE_SIZES[date]
+        os.makedirs(os.path.join(root, date), exist_ok = True)
+        with open(os.path.join(root, date, "calib_cam_to_cam.txt"), "w") as f:
+            f.write(KITTI_CAM2CAM.format(height = height, width = width))
+        with open(os.path.join(root, date, "calib_velo_to_cam.txt"), "w") as f:
+            f.write(KITTI_VELO2CAM)
+
+        for drive in range(drives):
+            length = frames if isinstance(frames, int) else frames[count % len(frames)]
+            folder = "{0}/{0}_drive_{1:04d}_sync".format(date, drive + 1)
+            images = {camera: [encode_image(synthetic_image(rng, height, width), ext) for _ in range(variants)]
+                      for camera in ["image_02", "image_03"]}
+            scans  = [synthetic_velodyne(rng).tobytes() for _ in range(variants)]
+
+            files = []
+            for frame in range(length):
+                for camera in ["image_02", "image_03"]:
+                    files.append((os.path.join(root, folder, camera, "data", "{:010d}{}".format(frame, ext)), images[camera][frame % variants]))
+                files.append((os.path.join(root, folder, "velodyne_points", "data", "{:010d}.bin".format(frame)), scans[frame % variants]))
+                lines += ["{} {} {}".format(folder, frame, side) for side in ["l", "r"]]
+            write_files(files, num_workers)
+            count += 1
+    return lines
+
+
+def make_cityscapes(root, mode = "train", cities = ("aachen", "bochum"), sequences = 2, frames = 30, ext = ".png",
+                    variants = 8, seed = 0, num_workers = 8):
+    """
+    Cityscapes leftImg8bit_sequence / rightImg8bit_sequence와 같은 구조의 가짜 트리를 만드는 함수
+    ㄴroot
+        ㄴleftImg8bit_sequence_trainvaltest/leftImg8bit_sequence/train/aachen
+            ㄴaachen_000000_000000_leftImg8bit.png ... ...
+        ㄴrightImg8bit_sequence_trainvaltest/rightImg8bit_sequence/train/aachen
+            ㄴaachen_000000_000000_rightImg8bit.png ... ...
+
+    Args:
+        root:      "./dataset/cityscapes_synthetic"
+        mode:      "train" or "val" or "test"
+        cities:    도시 이름들
+        sequences: 도시마다 시퀀스 수
+        frames:    시퀀스마다 프레임 수 (실제 시퀀스는 30 프레임, 19번이 GT 프레임)
+        ext:       ".png" (원본) or ".jpg"
+        variants:  도시, 카메라마다 서로 다른 이미지 수
+        seed:      같은 seed면 같은 트리
+
+    returns:
+        스플릿 줄 리스트 ["aachen aachen_000000_000000 l", ...] 모든 프레임, 양쪽 카메라
+    """
+    rng           = np.random.default_rng(seed)
+    height, width = CITYSCAPES_IMAGE_SIZE
+    cam_path      = {
+        "l": ("leftImg8bit_sequence_trainvaltest/leftImg8bit_sequence", "_leftImg8bit"),
+        "r": ("rightImg8bit_sequence_trainvaltest/rightImg8bit_sequence", "_rightImg8bit")}
+
+    lines = []
+    for city in cities:
+        # 2048 x 1024는 같은 장면이 더 부드러워서 노이즈를 줄여야 PNG 크기가 실제 (2 ~ 3 MB)와 비슷함
+        images = {side: [encode_image(synthetic_image(rng, height, width, noise = 2.0), ext) for _ in range(variants)] for side in cam_path}
+        files  = []
+        for sequence in range(sequences):
+            for frame in range(frames):
+                name = "{}_{:06d}_{:06d}".format(city, sequence, frame)
+                for side, (path, suffix) in cam_path.items():
+                    files.append((os.path.join(root, path, mode, city, name + suffix + ext), images[side][frame % variants]))
+                lines += ["{} {} {}".format(city, name, side) for side in ["l", "r"]]
+        write_files(files, num_workers)
+    return lines
+
+
+
+if __name__ == "__main__":
+    """
+    python -m model_loader.synthetic --dataset kitti --root ./dataset/kitti_synthetic \
+        --dates 2011_09_26 2011_09_30 --drives 2 --frames 200
+    python -m model_loader.synthetic --dataset cityscapes --root ./dataset/cityscapes_synthetic \
+        --cities aachen bochum --sequences 4
+    스플릿 (모든 프레임, 양쪽 카메라)은 root/all_files.txt로 저장
+    """
+    parser = argparse.ArgumentParser(description = "generate a synthetic KITTI or Cityscapes tree")
+    parser.add_argument("--dataset",     type = str, default = "kitti", choices = ["kitti", "cityscapes"])
+    parser.add_argument("--root",        type = str, required = True)
+    parser.add_argument("--dates",       type = str, nargs = "+", default = ["2011_09_26"])
+    parser.add_argument("--drives",      type = int, default = 2)
+    parser.add_argument("--frames",      type = int, default = None)
+    parser.add_argument("--mode",        type = str, default = "train")
+    parser.add_argument("--cities",      type = str, nargs = "+", default = ["aachen", "bochum"])
+    parser.add_argument("--sequences",   type = int, default = 2)
+    parser.add_argument("--ext",         type = str, default = None)
+    parser.add_argument("--variants",    type = int, default = 8)
+    parser.add_argument("--seed",        type = int, default = 0)
+    parser.add_argument("--num_workers", type = int, default = 8)
+    args = parser.parse_args()
+
+    if args.dataset == "kitti":
+        lines = make_kitti(args.root, args.dates, args.drives, args.frames or 100, args.ext or ".jpg",
+                           args.variants, args.seed, args.num_workers)
+    else:
+        lines = make_cityscapes(args.root, args.mode, args.cities, args.sequences, args.frames or 30, args.ext or ".png",
+                                args.variants, args.seed, args.num_workers)
+    savelines(lines, os.path.join(args.root, "all_files.txt"))
+    print(">>>  Synthetic {0:<10}:  {1} lines -> {2}".format(args.dataset, len(lines), args.root))
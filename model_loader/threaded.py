@@ -0,0 +1,73 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from torch.utils.data import BatchSampler
+from torch.utils.data import RandomSampler
+from torch.utils.data import SequentialSampler
+from torch.utils.data.dataloader import default_collate
+
+
+
+class ThreadedLoader(object):
+    def __init__(self, dataset, batch_size = 1, shuffle = False, num_threads = 4, collate_fn = default_collate,
+                 drop_last = False, prefetch_batches = 2, batch_sampler = None):
+        """
+        DataLoader(num_workers = N) 대신 한 프로세스 안에서 N개 스레드가 __getitem__을 동시에 부르는 로더
+        PIL / cv2 디코딩과 리사이즈는 GIL을 놓기 때문에 스레드로도 병렬로 돌고,
+        워커 프로세스마다 생기는 메모리 (데이터셋 사본, 워커별 FrameCache)와 샘플의 공유 메모리 IPC가 없음
+        FrameCache는 모든 스레드가 하나를 같이 씀
+
+        Args:
+            dataset:          재진입 가능한 데이터셋 (이 패키지의 데이터셋은 __getitem__에서 인스턴스를 수정하지 않음)
+            batch_size:       DataLoader와 같음
+            shuffle:          DataLoader와 같음
+            num_threads:      동시에 __getitem__을 부를 스레드 수
+            collate_fn:       DataLoader와 같음, 메인 스레드에서 배치 순서대로 부름
+            drop_last:        DataLoader와 같음
+            prefetch_batches: 미리 요청해둘 배치 수 (DataLoader의 prefetch_factor * num_workers에 해당)
+            batch_sampler:    있으면 batch_size, shuffle, drop_last 대신 사용 (SequenceChunkSampler 등)
+
+        ex)
+        train_loader = ThreadedLoader(train_dataset, 8, True, num_threads = 8, drop_last = True)
+        for inputs in train_loader:
+            ...
+        """
+        if num_threads < 1:
+            raise ValueError("num_threads는 1 이상")
+        if batch_sampler is None:
+            sampler       = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+            batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+
+        self.dataset          = dataset
+        self.batch_sampler    = batch_sampler
+        self.num_threads      = num_threads
+        self.collate_fn       = collate_fn
+        self.prefetch_batches = max(prefetch_batches, 1)
+
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        """
+        항상 prefetch_batches개 배치의 샘플을 스레드 풀에 걸어두고, 맨 앞 배치가 끝나면 collate해서 반환
+        반복을 중간에 멈추면 아직 시작하지 않은 샘플은 취소
+        """
+        batches = iter(self.batch_sampler)
+        pending = deque()
+        pool    = ThreadPoolExecutor(self.num_threads)
+
+        def submit():
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append([pool.submit(self.dataset.__getitem__, index) for index in batch])
+
+        try:
+            for _ in range(self.prefetch_batches):
+                submit()
+            while pending:
+                futures = pending.popleft()
+                submit()
+                yield self.collate_fn([future.result() for future in futures])
+        finally:
+            pool.shutdown(wait = True, cancel_futures = True)
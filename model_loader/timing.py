@@ -0,0 +1,227 @@
+import json
+import time
+import threading
+import functools
+import numpy as np
+
+import torch
+from torch.utils.data import get_worker_info
+
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+__getitem__ 단계별 시간 측정 모듈
+데이터셋은 timing_stages = {단계 이름: 메서드 (또는 호출 가능한 속성) 이름}만 선언하고,
+timer를 넘겼을 때만 instrument가 그 메서드들을 인스턴스 속성으로 감싸기 때문에 timer = None이면 코드 경로가 그대로 (오버헤드 0)
+
+def payload_nbytes  단계의 반환값 (numpy, tensor, PIL, dict, list)이 차지하는 바이트 수
+class StageTimer    워커별 단계 히스토그램 (공유 메모리) + Chrome trace 이벤트 링 버퍼
+def instrument      데이터셋의 timing_stages 메서드를 StageTimer로 감쌈
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+STAGES = ["decode", "store", "resize", "color", "to_tensor", "depth", "intrinsics", "stereo"]
+# 샘플 딕셔너리 전체를 반환하는 단계는 바이트를 세지 않음
+PASSTHROUGH_STAGES = ["intrinsics", "stereo"]
+
+
+def payload_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if torch.is_tensor(value):
+        return value.element_size() * value.nelement()
+    if isinstance(value, dict):
+        return sum(payload_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_nbytes(item) for item in value)
+    if hasattr(value, "getbands"): # PIL 이미지
+        return value.width * value.height * len(value.getbands())
+    return 0
+
+
+class StageTimer(object):
+    def __init__(self, max_workers = 64, trace_events = 2048, bins = 32):
+        """
+        __getitem__ 안의 단계 (decode, resize, color, to_tensor, depth, intrinsics ...)마다 걸린 시간과 바이트를 모으는 클래스
+        모든 배열은 공유 메모리 텐서라서 DataLoader 워커가 각자 자기 행에 쓰고, 메인 프로세스에서 summary()를 부르면 합계를 볼 수 있음
+
+        히스토그램
+            시간은 마이크로초 단위 log2 버킷 (버킷 b는 [2^(b-1), 2^b) us), p50 / p99는 버킷 경계로 근사
+        trace
+            워커마다 최근 trace_events개의 (단계, 시작 ns, 길이 ns, 바이트)를 링 버퍼로 보관, chrome_trace()로 chrome://tracing 형식 저장
+
+        Args:
+            max_workers:  행을 둘 최대 워커 수, 메인 프로세스 (num_workers = 0, ThreadedLoader)는 0번 행, DataLoader의 num_workers 이상이어야 함 (아니면 ValueError)
+            trace_events: 워커마다 보관할 이벤트 수, 0이면 trace 없음
+            bins:         히스토그램 버킷 수
+
+        ex)
+        timer   = StageTimer()
+        dataset = KITTIMonoDataset(..., timer = timer)
+        for inputs in DataLoader(dataset, 8, num_workers = 4): ...
+        timer.report()
+        timer.chrome_trace("./trace.json")
+        """
+        self.bins         = bins
+        self.trace_events = trace_events
+        self.histogram    = torch.zeros((max_workers + 1, len(STAGES), bins), dtype = torch.int64).share_memory_()
+        # 워커, 단계별 [호출 수, 전체 ns, 전체 바이트]
+        self.totals       = torch.zeros((max_workers + 1, len(STAGES), 3), dtype = torch.int64).share_memory_()
+        self.events       = torch.zeros((max_workers + 1, max(trace_events, 1), 4), dtype = torch.int64).share_memory_()
+        self.cursor       = torch.zeros(max_workers + 1, dtype = torch.int64).share_memory_()
+        self.lock         = threading.Lock()
+        self.arrays       = None
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy() # spawn 워커로 넘길 때 lock, numpy view는 새로 만듬
+        del state["lock"]
+        state["arrays"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+    def views(self):
+        """
+        공유 메모리 텐서의 numpy view, 텐서 인덱싱보다 훨씬 싸기 때문에 record는 view에 씀
+        """
+        if self.arrays is None:
+            self.arrays = (self.histogram.numpy(), self.totals.numpy(), self.events.numpy(), self.cursor.numpy())
+        return self.arrays
+
+    def record(self, stage, start, end, nbytes):
+        worker_info = get_worker_info()
+        worker      = 0 if worker_info is None else worker_info.id + 1
+        if worker >= len(self.cursor): # 한 행을 여러 프로세스가 같이 쓰면 += 갱신이 서로 덮어씀 (self.lock은 프로세스 사이를 막지 못함)
+            raise ValueError("워커 {}번을 기록할 행이 없음, StageTimer(max_workers >= num_workers)로 만들 것".format(worker_info.id))
+        duration    = end - start
+        bucket      = min((duration // 1000).bit_length(), self.bins - 1)
+        histogram, totals, events, cursor = self.views()
+        with self.lock:
+            histogram[worker, stage, bucket] += 1
+            totals[worker, stage]            += (1, duration, nbytes)
+            if self.trace_events > 0:
+                events[worker, cursor[worker] % self.trace_events] = (stage, start, duration, nbytes)
+                cursor[worker] += 1
+
+    def timed(self, stage, function):
+        """
+        function을 감싸서 호출마다 (시작, 끝, 반환값 바이트)를 record
+        """
+        stage_index = STAGES.index(stage)
+        count_bytes = stage not in PASSTHROUGH_STAGES
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start  = time.perf_counter_ns()
+            output = function(*args, **kwargs)
+            self.record(stage_index, start, time.perf_counter_ns(), payload_nbytes(output) if count_bytes else 0)
+            return output
+        return wrapper
+
+
+    def percentile(self, histogram, q):
+        """
+        log2 버킷 히스토그램의 q 분위수 (버킷 위쪽 경계, ms)
+        """
+        count = histogram.sum()
+        if count == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(histogram), q * count))
+        return (2 ** bucket) / 1000.0
+
+    def summary(self, worker = None):
+        """
+        Args:
+            worker: None이면 모든 워커의 합계, 아니면 그 행 (0은 메인 프로세스, i + 1은 워커 i)
+
+        returns:
+            {stage: {"count", "total_ms", "mean_ms", "p50_ms", "p99_ms", "bytes", "mb_per_s"}} 한 번도 불리지 않은 단계는 제외
+        """
+        histogram = self.histogram.numpy() if worker is None else self.histogram.numpy()[worker: worker + 1]
+        totals    = self.totals.numpy() if worker is None else self.totals.numpy()[worker: worker + 1]
+        histogram = histogram.sum(axis = 0)
+        totals    = totals.sum(axis = 0)
+
+        summary = {}
+        for index, stage in enumerate(STAGES):
+            count, duration, nbytes = [int(value) for value in totals[index]]
+            if count == 0:
+                continue
+            summary[stage] = {
+                "count":    count,
+                "total_ms": duration / 1e6,
+                "mean_ms":  duration / 1e6 / count,
+                "p50_ms":   self.percentile(histogram[index], 0.5),
+                "p99_ms":   self.percentile(histogram[index], 0.99),
+                "bytes":    nbytes,
+                "mb_per_s": nbytes / 2**20 / max(duration / 1e9, 1e-9)}
+        return summary
+
+    def workers(self):
+        """
+        returns:
+            {행 번호: summary(행)} 기록이 있는 행만
+        """
+        counts = self.totals.numpy()[:, :, 0].sum(axis = 1)
+        return {int(worker): self.summary(int(worker)) for worker in np.flatnonzero(counts)}
+
+
+    def to_json(self, path = None):
+        """
+        전체 합계와 워커별 summary를 JSON 문자열로, path가 있으면 파일로도 저장
+        """
+        text = json.dumps({"stages": self.summary(), "workers": self.workers()}, indent = 2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def trace(self):
+        """
+        returns:
+            Chrome trace 이벤트 리스트 (ph = "X", ts / dur는 us, tid는 워커 행 번호)
+        """
+        events = []
+        for worker in range(self.cursor.shape[0]):
+            written = int(self.cursor[worker])
+            if written == 0 or self.trace_events == 0:
+                continue
+            rows = self.events[worker].numpy()[:min(written, self.trace_events)]
+            for stage, start, duration, nbytes in rows.tolist():
+                events.append({"name": STAGES[stage], "ph": "X", "pid": 0, "tid": worker,
+                               "ts": start / 1000.0, "dur": duration / 1000.0, "args": {"bytes": nbytes}})
+        return sorted(events, key = lambda event: event["ts"])
+
+    def chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace(), "displayTimeUnit": "ms"}, f)
+        return path
+
+
+    def report(self):
+        summary = self.summary()
+        print(">>>  {0:<11} {1:>8} {2:>11} {3:>9} {4:>9} {5:>9} {6:>10}".format(
+            "stage", "count", "total (ms)", "mean", "p50", "p99", "MB/s"))
+        for stage, value in summary.items():
+            print(">>>  {0:<11} {1:>8} {2:>11.1f} {3:>9.3f} {4:>9.3f} {5:>9.3f} {6:>10.1f}".format(
+                stage, value["count"], value["total_ms"], value["mean_ms"], value["p50_ms"], value["p99_ms"], value["mb_per_s"]))
+        return summary
+
+    def reset(self):
+        for tensor in [self.histogram, self.totals, self.events, self.cursor]:
+            tensor.zero_()
+
+
+def instrument(dataset, timer):
+    """
+    dataset.timing_stages의 메서드 (또는 ToTensor, ColorJitter 같은 호출 가능한 속성)를 timer.timed로 감싼 인스턴스 속성으로 덮어씀
+    클래스는 건드리지 않으므로 같은 클래스의 다른 인스턴스에는 영향 없음
+    감싼 함수는 pickle할 수 없으므로 DataLoader 워커는 fork (Linux 기본)로 띄울 것
+    """
+    for stage, name in dataset.timing_stages.items():
+        function = getattr(dataset, name, None)
+        if callable(function):
+            setattr(dataset, name, timer.timed(stage, function))
+    return dataset
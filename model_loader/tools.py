@@ -1,11 +1,11 @@
-import os
 import random
-from natsort import natsorted
+from .manifest import KITTIManifest
+from .manifest import CityscapesManifest
 
 
 
 class GetKITTI(object):
-    def __init__(self, datapath: str, mode: list, cut: list):
+    def __init__(self, datapath: str, mode: list, cut: list, manifest: str = None, num_workers: int = 8):
         """
         KITTI 데이터 폴더의 구조
         ㄴKITTI
@@ -42,10 +42,14 @@ class GetKITTI(object):
             datapath: "./dataset/kitti"
             model: "train" or "val" 데이터 폴더 리스트
             side: "l" or "r"
+            manifest: KITTIManifest 캐시 경로 ("./dataset/kitti/manifest.npz"), 다음 실행부터는 바뀐 드라이브만 다시 스캔
+            num_workers: 드라이브를 병렬로 스캔할 스레드 수
         """
         self.datapath  = datapath
         self.mode      = mode
         self.cut       = cut
+        self.manifest  = manifest
+        self.num_workers = num_workers
         self.side_map  = {"2": 2, "3": 3, "l": 2, "r": 3}
         self.l_path    = "image_02/data"
         self.r_path    = "image_03/data"
@@ -54,21 +58,14 @@ class GetKITTI(object):
 
     def search(self):
         all_filename = []
+        # 드라이브마다 벨로다인 폴더를 병렬로 한 번씩만 스캔, 프레임 번호는 숫자 순서로 정렬되어 있음
+        manifest = KITTIManifest(self.datapath, self.mode, self.manifest, self.num_workers, self.velo_path)
         for yyyy_mm_dd in self.mode: # 각 날짜 별 폴더마다 순회
-            velodyne_path = os.path.join(self.datapath, yyyy_mm_dd, self.velo_path)
-            # left_path  = os.path.join(self.datapath, yyyy_mm_dd, self.l_path)
-            # right_path = os.path.join(self.datapath, yyyy_mm_dd, self.r_path)
-
-            # 왼쪽 카메라 파일 (image_02) 와 오른쪽 카메라 파일 (image_03)을 순회
-            left_filename  = []
-            right_filename = []
-            for filename in os.listdir(velodyne_path): # 벨로다인 파일 이름을 순회
-                # 0000000011.bin, ... ... 0000000035.bin 파일을 0000000011, 0000000035으로 쪼갬
-                frame_index = filename.split(".bin")[0]
-
-                # 쪼갠 frame_index은 image_02, image_03 폴더에 이미지 파일로 매칭됨 (스테레오 이미지)
-                left_filename.append("".join([yyyy_mm_dd, " ", frame_index, " ", "l"]))
-                right_filename.append("".join([yyyy_mm_dd, " ", frame_index, " ", "r"]))
+            # 벨로다인 파일 0000000011.bin, ... ... 0000000035.bin의 프레임 번호 11, ..., 35
+            # 프레임 번호는 image_02, image_03 폴더에 이미지 파일로 매칭됨 (스테레오 이미지)
+            frame_indices  = ["{:010d}".format(frame_index) for frame_index in manifest[yyyy_mm_dd].tolist()]
+            left_filename  = ["".join([yyyy_mm_dd, " ", frame_index, " ", "l"]) for frame_index in frame_indices]
+            right_filename = ["".join([yyyy_mm_dd, " ", frame_index, " ", "r"]) for frame_index in frame_indices]
             
             # 상대적인 프레임 아이디를 위해 양 끝 N개는 잘라줌
             modified_left_filename  = self.side_cut(left_filename, self.cut)
@@ -76,6 +73,7 @@ class GetKITTI(object):
             all_filename += modified_left_filename
             all_filename += modified_right_filename
 
+        print("다시 스캔한 드라이브  :  {} / {}".format(len(manifest.rescanned), len(manifest)))
         print("전체 길이  :  {}".format(len(all_filename)))
         random.shuffle(all_filename)
         return all_filename
@@ -95,7 +93,7 @@ class GetKITTI(object):
 
 
 class GetCityscapes(object):
-    def __init__(self, datapath: str, mode: str, cut: list):
+    def __init__(self, datapath: str, mode: str, cut: list, manifest: str = None, num_workers: int = 8):
         """
         시티스케이프 시퀀스용 데이터는 좌, 우 카메라마다 31곳의 위치와 train, val, test 합해서 총 150,002장의 사진을 제공
         한 번 촬영은 30장, 즉 1초 단위로 되어있음 (30FPS 촬영), 그래서 30장으로 끊어주면 편함
@@ -104,11 +102,15 @@ class GetCityscapes(object):
         Args:
             datapath: "./dataset/cityscapes
             mode: "train" or "val" or "test"
-            cut: 양 끝을 자를 프레임 수, 예를 들어서 양 끝을 4프레임씩 자르면 [4: len(list) - 4]
+            cut: 시퀀스마다 양 끝을 자를 프레임 수, 예를 들어서 양 끝을 4프레임씩 자르면 [4: len(sequence) - 4]
+            manifest: CityscapesManifest 캐시 경로 ("./dataset/cityscapes/manifest_train.npz"), 다음 실행부터는 바뀐 도시만 다시 스캔
+            num_workers: 도시 폴더를 병렬로 스캔할 스레드 수
         """
         self.datapath = datapath
         self.mode     = mode
         self.cut      = cut
+        self.manifest = manifest
+        self.num_workers = num_workers
         self.side_map = {
             "l": "_leftImg8bit", 
             "r": "_rightImg8bit"}
@@ -117,21 +119,16 @@ class GetCityscapes(object):
             "r": "rightImg8bit_sequence_trainvaltest/rightImg8bit_sequence"}
 
 
-    def side_cut(self, filename, l: int, r: int):
+    def side_cut(self, manifest, l: int, r: int):
         """
         이 클래스가 존재하는 이유
         프레임 인덱스가 키 프레임 기준으로 좌, 우 몇 까지 consecutive frame을 쓸 지 모름
         만약 키 프레임 인덱스가 0이면 왼쪽 consecutive frame은 음수가 되기 때문에 사용할 수 없음
         그래서 consecutive frame 범위를 두기 위해 맨 끝 프레임은 잘라내는 목적
+        30장씩 끊는 대신 파일 이름의 실제 시퀀스 번호로 묶어서 시퀀스마다 양 끝을 자름 (CityscapesManifest.select)
         """
-        num_chunk = len(filename) // 30
-        print("Number divided by 30       :  {}".format(num_chunk))
-        filename = [filename[30*index: 30*(index+1)] for index in range(num_chunk)]
-        
-        modified_filename = []
-        for chunk in filename:
-            modified_filename += chunk[l: 30-r]
-        
+        print("Number of sequences        :  {}".format(manifest.num_sequences()))
+        modified_filename = manifest.lines((l, r))
         print("Modified Filename Length   :  {}".format(len(modified_filename)))
 
         random.shuffle(modified_filename)
@@ -139,22 +136,14 @@ class GetCityscapes(object):
 
 
     def search(self):
-        all_filename = []
-
         # ex) "./dataset/cityscapes/leftImg8bit_sequence_trainvaltest/leftImg8bit_sequence/train"
-        location_path = os.path.join(self.datapath, self.cam_path["l"], self.mode) # 왼쪽, 오른쪽 카메라 파일들이 모두 똑같아서 왼쪽 경로를 탐색으로 활용
-        for location in os.listdir(location_path):
-            
-            # ex) "./dataset/cityscapes/leftImg8bit_sequence_trainvaltest/leftImg8bit_sequence/train/aachen"
-            file_path = os.path.join(location_path, location)
-            for filename in os.listdir(file_path):
-                line = filename.split(self.side_map["l"]) # aachen_000000_000000_leftImg8bit -> [aachen_000000_000000, aachen]
-
-                # 촬영 좡소마다 사진 파일들을 "위치 사진 파일 이름" 형태의 무자열로 모두 append
-                all_filename.append("".join([location, " ", line[0], " ", "l"])) # [aachen, aachen_000000_000000, "l"]
-                all_filename.append("".join([location, " ", line[0], " ", "r"])) # [aachem, aachem_000000_000000, "r"]
-        
-        all_filename = natsorted(all_filename) # 모든 파일 이름 정렬
+        # 왼쪽, 오른쪽 카메라 파일들이 모두 똑같아서 왼쪽 경로를 도시마다 병렬로 스캔, 파일 이름은 (시퀀스, 프레임) 정수로 파싱
+        manifest = CityscapesManifest(
+            self.datapath, self.mode, self.manifest, self.num_workers, self.cam_path["l"], self.side_map["l"])
+
+        # (도시, 시퀀스, 프레임) 순서로 "위치 사진 파일 이름 side" 형태의 문자열, 한 프레임마다 "l", "r" 두 줄
+        all_filename = manifest.lines()
+        print("Rescanned locations        :  {} / {}".format(len(manifest.rescanned), len(manifest)))
         print("Filename Full Length       :  {}".format(len(all_filename)))
 
         if self.cut == [0, 0]:
@@ -162,5 +151,5 @@ class GetCityscapes(object):
             return all_filename
         elif self.cut != [0, 0]:
             print("Cut filename O")
-            modified_filename = self.side_cut(all_filename, self.cut[0], self.cut[1])
-            return modified_filename
\ No newline at end of file
+            modified_filename = self.side_cut(manifest, self.cut[0], self.cut[1])
+            return modified_filename
@@ -0,0 +1,249 @@
+import os
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from model_utility import *
+
+
+
+# 포인트 하나 = xyz 3개, float32면 12 bytes, int16이면 6 bytes (엔트리, 축마다 offset + scale로 복원)
+VELODYNE_DTYPES = {"float32": np.float32, "int16": np.int16}
+INT16_MIN       = -32768
+INT16_STEPS     = 65535
+
+
+def frustum_mask(velo, P_velo2im, im_shape):
+    """
+    velo2depth가 뎁스 맵에 남기는 포인트 (카메라 앞, 반올림한 픽셀이 이미지 안)만 True인 마스크
+    같은 사영, 반올림, 경계 검사를 쓰기 때문에 이 포인트들로 만든 뎁스 맵은 원래 스캔으로 만든 것과 bit 단위로 같음
+    """
+    front       = velo[:, 0] >= 0
+    velo_pts_im = np.dot(P_velo2im, velo[front].T).T
+    cols        = np.round(velo_pts_im[:, 0] / velo_pts_im[:, 2]) - 1
+    rows        = np.round(velo_pts_im[:, 1] / velo_pts_im[:, 2]) - 1
+    mask        = np.zeros(len(velo), dtype = bool)
+    mask[front] = (cols >= 0) & (rows >= 0) & (cols < im_shape[1]) & (rows < im_shape[0])
+    return mask
+
+
+def quantize(xyz, dtype):
+    """
+    returns:
+        (저장할 배열, [2, 3] float32 (축마다 offset, scale)), xyz ~= offset + 배열 * scale
+        int16은 축마다 [최솟값, 최댓값]을 65535 단계로 나눔 (frustum 안에서 x 80 m, y 80 m, z 수 m 기준 약 1.2 mm, 1.2 mm, 0.1 mm 간격)
+    """
+    params = np.array([[0, 0, 0], [1, 1, 1]], dtype = np.float32)
+    if dtype == "float32":
+        return xyz.astype(np.float32), params
+    if len(xyz) == 0:
+        return np.zeros((0, 3), dtype = np.int16), params
+    low       = xyz.min(axis = 0)
+    scale     = np.maximum(xyz.max(axis = 0) - low, 1e-6) / INT16_STEPS
+    params[1] = scale
+    params[0] = low - INT16_MIN * params[1]
+    return np.clip(np.round((xyz - params[0]) / params[1]), INT16_MIN, INT16_MIN + INT16_STEPS).astype(np.int16), params
+
+
+def dequantize(xyz, params):
+    """
+    [N, 3] 저장 배열 -> [N, 4] float32 homogeneous 포인트 (read_velodyne_points와 같은 모양)
+    """
+    velo        = np.empty((len(xyz), 4), dtype = np.float32)
+    velo[:, :3] = xyz if xyz.dtype == np.float32 else params[0] + xyz * params[1]
+    velo[:, 3]  = 1.0
+    return velo
+
+
+def filter_entry(args):
+    """
+    (datapath, folder, frame, cams, dtype) 스캔 하나를 읽어서 카메라마다 frustum 포인트의 (xyz, params)
+    int16은 카메라 앞 포인트를 먼저 양자화하고, 복원한 좌표로 frustum을 다시 계산 (로드할 때 사영하는 좌표와 같은 좌표로 거름)
+    multiprocessing.Pool에 넘기기 위해 모듈 함수로 둠
+    """
+    datapath, folder, frame, cams, dtype = args
+    calibration = read_calibration(os.path.join(datapath, folder.split("/")[0]))
+    velo        = read_velodyne_points(os.path.join(datapath, folder, "velodyne_points/data/{:010d}.bin".format(frame)))
+    entries     = []
+    for cam in cams:
+        xyz = velo[frustum_mask(velo, *calibration[cam]), :3]
+        if dtype == "int16":
+            front       = velo[velo[:, 0] >= 0, :3]
+            xyz, params = quantize(front, dtype)
+            xyz         = xyz[frustum_mask(dequantize(xyz, params), *calibration[cam])]
+            entries.append((xyz, params))
+        else:
+            entries.append(quantize(xyz, dtype))
+    return entries
+
+
+def build_velodyne_store(datapath, filename, store_path, cams = (2, 3), dtype = "float32", num_workers = 0):
+    """
+    스플릿 파일에 등장하는 스캔마다 카메라 frustum 안의 포인트만 xyz로 드라이브별 파일에 저장하는 함수
+    반사율 (read_velodyne_points가 1.0으로 덮어씀)과 카메라 뒤, 이미지 밖 포인트를 버려서 샘플당 읽는 바이트를 줄임
+    depth_store와 달리 사영은 로드할 때 하므로 vel_depth, 다른 해상도 등 뎁스 계산을 바꿔도 다시 만들 필요 없음
+
+    Args:
+        datapath:    "./dataset/kitti"
+        filename:    splits file of KITTI
+        store_path:  "./dataset/kitti_velodyne/eigen_zhou" 저장할 폴더
+        cams:        저장할 카메라, 스테레오 데이터셋은 반대쪽 카메라도 필요하므로 기본 값은 (2, 3)
+        dtype:       "float32" (point2depth와 bit 단위로 같음) or "int16" (엔트리, 축마다 offset + scale, 바이트 1/2)
+                     int16은 픽셀 경계 근처의 포인트가 옆 픽셀로 넘어가므로 뎁스 맵이 같지 않음
+                     (합성 KITTI 트리에서 유효 픽셀의 약 5%가 한쪽 맵에만 있음, benchmark.benchmark_velodyne으로 확인), 평가용 GT는 float32
+        num_workers: 0이면 현재 프로세스에서, 아니면 Pool(num_workers)로 필터링
+
+    store 구조
+        meta.json                 {"dtype", "cams", "drives"}
+        <folder>/points.bin       [M, 3] dtype, 드라이브의 모든 엔트리 포인트를 이어 붙임 (np.memmap)
+        <folder>/offsets.npy      [F * len(cams) + 1] int64, (frames[i], cams[j])의 포인트는 points[offsets[k]: offsets[k + 1]], k = i * len(cams) + j
+        <folder>/frames.npy       [F] int64, 정렬된 프레임 번호
+        <folder>/scales.npy       [F * len(cams), 2, 3] float32, 엔트리마다 축별 (offset, scale) (float32는 0, 1)
+    """
+    if dtype not in VELODYNE_DTYPES:
+        raise ValueError("dtype은 {} 중 하나".format(list(VELODYNE_DTYPES)))
+    keys   = sorted({(line.split()[0], int(line.split()[1])) for line in filename})
+    drives = {}
+    for folder, frame in keys:
+        drives.setdefault(folder, []).append(frame)
+
+    pool       = Pool(num_workers) if num_workers > 0 else None
+    raw_bytes  = 0
+    store_size = 0
+    for folder, frames in drives.items():
+        os.makedirs(os.path.join(store_path, folder), exist_ok = True)
+        entries = [(datapath, folder, frame, tuple(cams), dtype) for frame in frames]
+        results = pool.imap(filter_entry, entries, chunksize = 16) if pool else map(filter_entry, entries)
+        offsets = np.zeros(len(frames) * len(cams) + 1, dtype = np.int64)
+        scales  = np.zeros((len(frames) * len(cams), 2, 3), dtype = np.float32)
+        with open(os.path.join(store_path, folder, "points.bin"), "wb") as f:
+            for index, result in enumerate(results):
+                for cam_index, (xyz, params) in enumerate(result):
+                    entry = index * len(cams) + cam_index
+                    f.write(xyz.tobytes())
+                    offsets[entry + 1] = offsets[entry] + len(xyz)
+                    scales[entry]      = params
+        np.save(os.path.join(store_path, folder, "offsets.npy"), offsets)
+        np.save(os.path.join(store_path, folder, "frames.npy"), np.array(frames, dtype = np.int64))
+        np.save(os.path.join(store_path, folder, "scales.npy"), scales)
+        raw_bytes  += sum(os.path.getsize(os.path.join(datapath, folder, "velodyne_points/data/{:010d}.bin".format(frame))) for frame in frames)
+        store_size += os.path.getsize(os.path.join(store_path, folder, "points.bin"))
+    if pool:
+        pool.close()
+        pool.join()
+
+    with open(os.path.join(store_path, "meta.json"), "w") as f:
+        json.dump({"dtype": dtype, "cams": list(cams), "drives": sorted(drives)}, f, indent = 2)
+
+    print(">>>  Velodyne store scans  :  {0}  drives {1}".format(len(keys), len(drives)))
+    print(">>>  Velodyne raw (MB)     :  {0:.1f}".format(raw_bytes / 2**20))
+    print(">>>  Velodyne store (MB)   :  {0:.1f}  ({1:.1f}x smaller)".format(store_size / 2**20, raw_bytes / max(store_size, 1)))
+    return store_path
+
+
+
+class VelodyneStore(object):
+    def __init__(self, store_path):
+        """
+        build_velodyne_store로 만든 frustum 포인트 저장소를 읽는 클래스
+        드라이브마다 points.bin을 np.memmap으로 열어두고, 엔트리는 memmap의 slice (복사 없음)로 반환
+        DataLoader 워커들은 fork로 같은 매핑과 page cache를 공유함
+        pickle (spawn, forkserver 워커)에는 memmap 대신 경로만 넘기고 받은 쪽에서 다시 열음
+
+        Args:
+            store_path: build_velodyne_store의 store_path
+        """
+        with open(os.path.join(store_path, "meta.json")) as f:
+            meta = json.load(f)
+        self.store_path = store_path
+        self.dtype      = meta["dtype"]
+        self.cams       = meta["cams"]
+        self.drives     = {}
+        for folder in meta["drives"]:
+            offsets = np.load(os.path.join(store_path, folder, "offsets.npy"))
+            scales  = np.load(os.path.join(store_path, folder, "scales.npy"))
+            if scales.shape[1:] != (2, 3):
+                raise ValueError("{}는 엔트리마다 scale 하나인 이전 형식, build_velodyne_store로 다시 만들 것".format(store_path))
+            self.drives[folder] = (np.load(os.path.join(store_path, folder, "frames.npy")), offsets, scales,
+                                   self.open_memmap(folder, offsets))
+
+
+    def open_memmap(self, folder, offsets):
+        if offsets[-1] == 0: # 크기가 0인 파일은 memmap으로 열 수 없음
+            return np.zeros((0, 3), dtype = VELODYNE_DTYPES[self.dtype])
+        return np.memmap(os.path.join(self.store_path, folder, "points.bin"), dtype = VELODYNE_DTYPES[self.dtype],
+                         mode = "r", shape = (int(offsets[-1]), 3))
+
+    def __getstate__(self):
+        state = self.__dict__.copy() # np.memmap을 pickle하면 파일 내용 전체가 직렬화됨
+        state["drives"] = {folder: (frames, offsets, scales, None) for folder, (frames, offsets, scales, _) in self.drives.items()}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.drives = {folder: (frames, offsets, scales, self.open_memmap(folder, offsets))
+                       for folder, (frames, offsets, scales, _) in self.drives.items()}
+
+
+    def __len__(self):
+        return sum(len(frames) for frames, _, _, _ in self.drives.values()) * len(self.cams)
+
+    def entry(self, folder, frame, cam):
+        """
+        returns:
+            드라이브 안의 엔트리 번호, 없으면 -1
+        """
+        if folder not in self.drives or int(cam) not in self.cams:
+            return -1
+        frames   = self.drives[folder][0]
+        position = int(np.searchsorted(frames, int(frame)))
+        if position == len(frames) or frames[position] != int(frame):
+            return -1
+        return position * len(self.cams) + self.cams.index(int(cam))
+
+    def __contains__(self, key):
+        return self.entry(*key) >= 0
+
+
+    def load_points(self, folder, frame, cam):
+        """
+        returns:
+            [N, 3] xyz (float32 or int16, memmap의 view, 복사 없음), [2, 3] (offset, scale) (offset + xyz * scale이 미터)
+        """
+        entry = self.entry(folder, frame, cam)
+        if entry < 0:
+            raise KeyError((folder, frame, cam))
+        _, offsets, scales, points = self.drives[folder]
+        return points[offsets[entry]: offsets[entry + 1]], scales[entry]
+
+    def load(self, folder, frame, cam):
+        """
+        read_velodyne_points와 같은 [N, 4] float32 homogeneous 포인트 (frustum 안의 포인트만)
+        """
+        return dequantize(*self.load_points(folder, frame, cam))
+
+    def load_depth(self, datapath, folder, frame, cam):
+        """
+        point2depth(calib_path, point_path, cam)와 같은 뎁스 맵 (float32 store는 bit 단위로 같음)
+        """
+        P_velo2im, im_shape = read_calibration(os.path.join(datapath, folder.split("/")[0]))[int(cam)]
+        return velo2depth(self.load(folder, frame, cam), P_velo2im, im_shape)
+
+
+
+if __name__ == "__main__":
+    """
+    python -m model_loader.velodyne_store \
+        --datapath ./dataset/kitti --split ./splits/kitti_eigen_zhou/train_files.txt \
+        --store ./dataset/kitti_velodyne/eigen_zhou_train --dtype int16 --num_workers 8
+    """
+    parser = argparse.ArgumentParser(description = "store camera-frustum velodyne points for a split file")
+    parser.add_argument("--datapath",    type = str, required = True)
+    parser.add_argument("--split",       type = str, required = True)
+    parser.add_argument("--store",       type = str, required = True)
+    parser.add_argument("--cams",        type = int, nargs = "+", default = [2, 3])
+    parser.add_argument("--dtype",       type = str, default = "float32", choices = list(VELODYNE_DTYPES))
+    parser.add_argument("--num_workers", type = int, default = 0)
+    args = parser.parse_args()
+
+    build_velodyne_store(args.datapath, readlines(args.split), args.store, tuple(args.cams), args.dtype, args.num_workers)
@@ -1,14 +1,8 @@
 import os
-import time
+import sys
 import json
-from tqdm import tqdm
 import numpy as np
-from scipy import misc
-from collections import Counter
-
-import torch
-import torch.nn as nn
-import matplotlib.pyplot as plt
+# torch, matplotlib은 Tools에서 처음 쓸 때 import (스플릿 유틸리티, GetKITTI, GetCityscapes는 numpy만으로 import)
 
 
 
@@ -16,18 +10,33 @@ import matplotlib.pyplot as plt
 KITTI 데이터셋을 위한 함수 모듈
 def readlines  스플릿 파일을 읽어들이는 함수
 def savelines  스플릿 파일을 저장하는 함수
+class SplitIndex # 스플릿을 문자열 리스트 대신 NumPy 배열 (폴더 id, int32 프레임, side 비트마스크)로 들고 있는 클래스
+def split_entry # 스플릿 리스트 또는 SplitIndex의 index번째 (folder, key_frame, side)
+def build_frame_index # 드라이브마다 한 번만 디렉토리를 읽어서 카메라별, 벨로다인 프레임 번호를 모아둠
 def removefile 레거시 splits에서 n개 프레임 이상을 쓰기 위해 프레임 인덱스가 n 이하인 파일은 제거하는 함수
+def validate_split # frame_ids가 요구하는 모든 프레임이 실제로 있는지 확인 (check_split은 없으면 ValueError)
+def removemissing # validate_split이 찾은 줄 (없는 프레임이 있는 줄)을 스플릿에서 뺌
 def read_cam2cam # 카메라 캘리브레이션 파일을 읽는 함수
 def read_velo2cam # 벨로다인 캘리브레이션 파일을 읽는 함수
 def read_velodyne_points # 포인트 클라우드를 로드하는 함수
 def sub2ind
+def project_depth # 사영된 포인트 -> 뎁스 맵 (중복 픽셀은 최솟값)
+def velo2depth # 벨로다인 포인트 + 사영 행렬 -> 뎁스 맵
+def read_calibration # 날짜별 사영 행렬과 이미지 모양을 한 번만 파싱해서 캐싱
+def load_calibrations # 스플릿에 등장하는 날짜의 캘리브레이션을 미리 캐싱
 def Point2Depth # 실제로 쓰는 함수
+def velo2depth_stereo # 포인트 클라우드 하나를 여러 카메라로 한 번에 사영
+def point2depth_stereo # 벨로다인 파일을 한 번만 읽어서 양쪽 카메라 뎁스 맵을 만듬
+def dense2sparse # 뎁스 맵 -> 유효한 픽셀의 (u, v, z) 리스트
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
-def readlines(datapath):
+def readlines(datapath, compact = False):
     # Read all the lines in a text file and return as a list
+    # compact = True면 SplitIndex로 반환, SplitIndex.save로 저장한 .npz는 바로 로드
+    if datapath.endswith(".npz"):
+        return SplitIndex.load(datapath)
     with open(datapath, 'r') as f:
         lines = f.read().splitlines()
-    return lines
+    return SplitIndex(lines) if compact else lines
 
 
 def savelines(filename, datapath: str):
@@ -37,28 +46,286 @@ def savelines(filename, datapath: str):
     f.close()
 
 
-def removelines(datapath, filename, frame_ids):
+class SplitIndex(object):
+    # save / load하는 배열, 생성할 때 모든 줄이 원래 줄로 정확히 되돌아오는지 확인하고 아니면 ValueError
+    fields = ["folder_ids", "frames", "widths", "location_ids", "sequences", "sides", "length", "has_side"]
+
+    def __init__(self, lines = None):
+        """
+        스플릿 파일을 Python 문자열 리스트 대신 NumPy 배열로 들고 있는 클래스
+        문자열 9만 개는 워커 fork 이후 refcount 갱신 때문에 페이지가 전부 복사되지만 (copy-on-access), NumPy 배열은 그대로 공유됨
+        __getitem__은 원래 줄 (문자열)을 돌려주므로 기존 코드와 호환되고, 데이터셋은 entry()로 파싱 없이 바로 읽음
+
+        Args:
+            lines: ["2011_09_26/2011_09_26_drive_0022_sync 0000000473 r", ...] or ["ulm ulm_000002_000025", ...]
+
+        배열
+            folders / folder_ids:     고유한 폴더 이름 (intern) / 줄마다 폴더 id (int32)
+            frames / widths:          KITTI 프레임 번호 or Cityscapes 프레임 인덱스 (int32) / 원래 문자열의 자릿수 (uint8)
+            locations / location_ids: Cityscapes 이미지 이름 앞부분 (aachen) / 줄마다 id, KITTI는 -1 (int32)
+            sequences:                Cityscapes 시퀀스 번호 (int32)
+            sides:                    side == "r" 비트를 np.packbits로 묶은 uint8 배열
+        """
+        if lines is None:
+            return
+        lines        = list(lines)
+        folder_map   = {}
+        location_map = {}
+        self.length       = len(lines)
+        self.folder_ids   = np.zeros(self.length, dtype = np.int32)
+        self.frames       = np.zeros(self.length, dtype = np.int32)
+        self.widths       = np.zeros(self.length, dtype = np.uint8)
+        self.location_ids = np.full(self.length, -1, dtype = np.int32)
+        self.sequences    = np.zeros(self.length, dtype = np.int32)
+        rights            = np.zeros(self.length, dtype = bool)
+
+        field_counts  = {len(line.split()) for line in lines}
+        if not field_counts <= {2, 3} or len(field_counts) > 1:
+            raise ValueError("SplitIndex는 모든 줄이 'folder frame' or 'folder frame side'일 것, {}".format(sorted(field_counts)))
+        self.has_side = field_counts == {3}
+
+        for index, line in enumerate(lines):
+            fields = line.split()
+            self.folder_ids[index] = folder_map.setdefault(fields[0], len(folder_map))
+            if fields[1].isdigit():
+                self.frames[index] = int(fields[1])
+                self.widths[index] = len(fields[1])
+            else:
+                location, sequence, frame_index = fields[1].rsplit("_", 2)
+                self.location_ids[index] = location_map.setdefault(location, len(location_map))
+                self.sequences[index]    = int(sequence)
+                self.frames[index]       = int(frame_index)
+                self.widths[index]       = len(frame_index)
+            rights[index] = self.has_side and fields[2] == "r"
+
+        self.folders   = [sys.intern(folder) for folder in folder_map]
+        self.locations = [sys.intern(location) for location in location_map]
+        self.sides     = np.packbits(rights)
+        for index, line in enumerate(lines):
+            if self[index] != " ".join(line.split()):
+                raise ValueError("SplitIndex로 되돌릴 수 없는 줄: '{}'".format(line))
+
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        folder, key_frame, side = self.entry(index)
+        if isinstance(key_frame, int):
+            key_frame = "{:0{}d}".format(key_frame, self.widths.item(index))
+        return " ".join([folder, key_frame] + ([side] if self.has_side else []))
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+
+    def side(self, index):
+        if not self.has_side:
+            return None
+        return "r" if (self.sides.item(index >> 3) >> (7 - (index & 7))) & 1 else "l"
+
+    def entry(self, index):
+        """
+        returns:
+            (folder, key_frame, side), key_frame은 KITTI면 int, Cityscapes면 "aachen_000000_000019", side가 없는 스플릿은 None
+        """
+        index       = index + self.length if index < 0 else index # .item()은 NumPy 스칼라를 만들지 않아서 훨씬 빠름
+        location_id = self.location_ids.item(index)
+        if location_id < 0:
+            key_frame = self.frames.item(index)
+        else:
+            key_frame = "{}_{:06d}_{:0{}d}".format(
+                self.locations[location_id], self.sequences.item(index), self.frames.item(index), self.widths.item(index))
+        return self.folders[self.folder_ids.item(index)], key_frame, self.side(index)
+
+
+    def subset(self, indices):
+        """
+        indices번째 줄만 남긴 SplitIndex, 문자열을 다시 파싱하지 않음 (folders, locations는 그대로 공유)
+        """
+        indices = np.asarray(indices, dtype = np.int64)
+        split   = SplitIndex()
+        for field in ["folder_ids", "frames", "widths", "location_ids", "sequences"]:
+            setattr(split, field, getattr(self, field)[indices])
+        split.sides     = np.packbits(np.unpackbits(self.sides, count = self.length)[indices])
+        split.length    = len(indices)
+        split.has_side  = self.has_side
+        split.folders   = self.folders
+        split.locations = self.locations
+        return split
+
+
+    def save(self, path):
+        """
+        np.savez로 저장, readlines(path) or SplitIndex.load(path)로 바로 로드 (문자열 파싱 없음)
+        """
+        with open(path, "wb") as f:
+            np.savez(f, folders = np.array(self.folders), locations = np.array(self.locations, dtype = str),
+                     **{field: np.asarray(getattr(self, field)) for field in self.fields})
+
+    @staticmethod
+    def load(path):
+        split  = SplitIndex()
+        arrays = np.load(path)
+        for field in SplitIndex.fields:
+            setattr(split, field, arrays[field])
+        split.length    = int(split.length)
+        split.has_side  = bool(split.has_side)
+        split.folders   = [sys.intern(str(folder)) for folder in arrays["folders"]]
+        split.locations = [sys.intern(str(location)) for location in arrays["locations"]]
+        return split
+
+
+def split_entry(filename, index):
     """
-    for KITTI
+    스플릿 리스트 or SplitIndex의 index번째 줄
+    returns:
+        (folder, key_frame, side), 리스트면 key_frame은 문자열 그대로
+    """
+    if isinstance(filename, SplitIndex):
+        return filename.entry(index)
+    line = filename[index].split()
+    return line[0], line[1], line[2]
+
+
+def scan_frames(directory):
+    """
+    디렉토리를 한 번만 읽어서 프레임 번호 ("0000000123.jpg" -> 123)를 정렬된 int32 배열로 반환, 디렉토리가 없으면 빈 배열
+    """
+    if not os.path.isdir(directory):
+        return np.zeros(0, dtype = np.int32)
+    with os.scandir(directory) as entries:
+        frames = [name for name in (entry.name.split(".")[0] for entry in entries) if name.isdigit()]
+    return np.sort(np.array(frames, dtype = np.int64)).astype(np.int32)
+
+
+def build_frame_index(datapath, folders):
+    """
+    드라이브마다 image_02, image_03, velodyne_points를 한 번씩만 읽어서 존재하는 프레임 번호를 모아두는 함수
     Args:
-        filename:  ['2011_09_26/2011_09_26_drive_0057_sync 311 l', 
-                    '2011_09_26/2011_09_26_drive_0035_sync 130 r]
-        frame_ids: [-3, -2, -1, 0, 1, 2]
+        datapath: "./dataset/kitti"
+        folders:  ["2011_09_26/2011_09_26_drive_0057_sync", ...] 중복 가능
+
+    returns:
+        {folder: {2: image_02 프레임 배열, 3: image_03 프레임 배열, "velodyne": velodyne_points 프레임 배열}}
+        프레임 수는 len(index[folder][2])
     """
-    modified_key = []
-    side_map     = {"2": 2, "3": 3, "l": 2, "r": 3}
+    frame_index = {}
+    for folder in sorted(set(folders)):
+        drive = os.path.join(datapath, folder)
+        frame_index[folder] = {
+            2:          scan_frames(os.path.join(drive, "image_02/data")),
+            3:          scan_frames(os.path.join(drive, "image_03/data")),
+            "velodyne": scan_frames(os.path.join(drive, "velodyne_points/data"))}
+    return frame_index
+
+
+def split_columns(filename):
+    """
+    KITTI 스플릿을 열 단위 배열로 바꾸는 함수
+    returns:
+        folders:    고유한 폴더 이름 리스트
+        folder_ids: 줄마다 folders의 인덱스 (int32)
+        keys:       줄마다 키 프레임 번호 (int64)
+        cameras:    줄마다 카메라 번호 2 or 3 (int64)
+    """
+    side_map = {"2": 2, "3": 3, "l": 2, "r": 3}
+    if isinstance(filename, SplitIndex):
+        rights  = np.unpackbits(filename.sides, count = filename.length).astype(np.int64)
+        return filename.folders, filename.folder_ids, filename.frames.astype(np.int64), 2 + rights
+
+    folder_map = {}
+    folder_ids = np.zeros(len(filename), dtype = np.int32)
+    keys       = np.zeros(len(filename), dtype = np.int64)
+    cameras    = np.zeros(len(filename), dtype = np.int64)
     for index, data in enumerate(filename):
         line = data.split()
-        name = line[0]      # 2011_09_26/2011_09_26_drive_0035_sync or
-        key  = int(line[1]) # 311 or 130
-        side = line[2]      # l or r
-        length = len(os.listdir(datapath + "/" + name + "/" + "image_0{}/data".format(side_map[side])))
-        
-        if key in list(range(-frame_ids[0], length - frame_ids[-1] - 1)): # 포함되어 있다면
-            modified_key.append(data)                                     # 수정된 키 리스트에 추가
-        else:
-            pass
-    return modified_key
+        folder_ids[index] = folder_map.setdefault(line[0], len(folder_map))
+        keys[index]       = int(line[1])
+        cameras[index]    = side_map[line[2]]
+    return list(folder_map), folder_ids, keys, cameras
+
+
+def removelines(datapath, filename, frame_ids, frame_index = None):
+    """
+    for KITTI
+    Args:
+        filename:    ['2011_09_26/2011_09_26_drive_0057_sync 311 l', 
+                      '2011_09_26/2011_09_26_drive_0035_sync 130 r] or SplitIndex
+        frame_ids:   [-3, -2, -1, 0, 1, 2]
+        frame_index: build_frame_index의 결과, None이면 스플릿에 나오는 드라이브만 한 번씩 읽어서 만듬
+
+    returns:
+        key가 range(-frame_ids[0], length - frame_ids[-1] - 1)에 포함되는 줄만 (SplitIndex면 SplitIndex로)
+    """
+    folders, folder_ids, keys, cameras = split_columns(filename)
+    if frame_index is None:
+        frame_index = build_frame_index(datapath, folders)
+
+    lengths = np.array([[len(frame_index[folder][2]), len(frame_index[folder][3])] for folder in folders],
+                       dtype = np.int64).reshape(-1, 2) # [폴더 수, 2] 카메라별 프레임 수
+    length  = lengths[folder_ids, cameras - 2]
+    keep    = (keys >= -frame_ids[0]) & (keys < length - frame_ids[-1] - 1)
+    if isinstance(filename, SplitIndex):
+        return filename.subset(np.flatnonzero(keep))
+    return [data for data, flag in zip(filename, keep.tolist()) if flag]
+
+
+def validate_split(datapath, filename, frame_ids, frame_index = None, velodyne = True):
+    """
+    학습 전에 스플릿의 모든 줄이 frame_ids로 요구하는 프레임이 실제로 있는지 확인하는 함수
+    정수 frame_id는 같은 카메라의 key + frame_id, "s"는 반대쪽 카메라의 key, velodyne = True면 key의 벨로다인 파일도 확인
+
+    returns:
+        없는 프레임 리스트 [(줄 인덱스, "image_02" or "image_03" or "velodyne_points", 프레임 번호), ...], 모두 있으면 []
+    """
+    folders, folder_ids, keys, cameras = split_columns(filename)
+    if frame_index is None:
+        frame_index = build_frame_index(datapath, folders)
+
+    missing = []
+    order   = np.argsort(folder_ids, kind = "stable")
+    bounds  = np.searchsorted(folder_ids[order], np.arange(len(folders) + 1))
+    for folder_id, folder in enumerate(folders):
+        rows = order[bounds[folder_id]: bounds[folder_id + 1]]
+        for camera in [2, 3]:
+            camera_rows = rows[cameras[rows] == camera]
+            for frame_id in frame_ids:
+                target = 5 - camera if frame_id == "s" else camera
+                frames = keys[camera_rows] + (0 if frame_id == "s" else frame_id)
+                absent = ~np.isin(frames, frame_index[folder][target])
+                missing += [(row, "image_0{}".format(target), frame)
+                            for row, frame in zip(camera_rows[absent].tolist(), frames[absent].tolist())]
+        if velodyne == True:
+            absent   = ~np.isin(keys[rows], frame_index[folder]["velodyne"])
+            missing += [(row, "velodyne_points", frame) for row, frame in zip(rows[absent].tolist(), keys[rows][absent].tolist())]
+    return sorted(set(missing))
+
+
+def removemissing(datapath, filename, frame_ids, frame_index = None, velodyne = True):
+    """
+    validate_split이 없는 프레임을 찾은 줄을 모두 뺀 스플릿 (SplitIndex면 SplitIndex로)
+    removelines는 드라이브의 프레임 수로 양 끝만 자르므로 중간에 빠진 프레임 (이웃 프레임, 반대쪽 카메라, 벨로다인)은 이 함수로 걸러냄
+    """
+    rows = {row for row, _, _ in validate_split(datapath, filename, frame_ids, frame_index, velodyne)}
+    keep = [index for index in range(len(filename)) if index not in rows]
+    if isinstance(filename, SplitIndex):
+        return filename.subset(keep)
+    return [filename[index] for index in keep]
+
+
+def check_split(datapath, filename, frame_ids, velodyne = True):
+    """
+    validate_split에서 없는 프레임이 하나라도 있으면 ValueError (데이터셋 생성 시 validate = True)
+    """
+    missing = validate_split(datapath, filename, frame_ids, velodyne = velodyne)
+    if missing:
+        examples = ["{} -> {} {:010d}".format(filename[row], directory, frame) for row, directory, frame in missing[:5]]
+        raise ValueError("스플릿의 {}줄에서 요구하는 프레임 {}개가 없음 (validate_split이 반환하는 줄을 removemissing으로 먼저 걸러낼 것)\n{}".format(
+            len({row for row, _, _ in missing}), len(missing), "\n".join(examples)))
 
 
 def read_cam2cam(path):
@@ -126,76 +393,210 @@ def sub2ind(matrixSize, rowSub, colSub):
     return rowSub * (n-1) + colSub - 1
 
 
-def point2depth(calib_path, point_path, cam = 2, vel_depth = False):
+def project_depth(velo_pts_im, im_shape):
     """
-    캘리브레이션 경로와 벨로다인 파일 경로를 읽어서 뎁스 맵을 만드는 함수
+    이미지 좌표로 사영된 포인트를 뎁스 맵으로 만드는 함수
+    Args:
+        velo_pts_im: [N, 3] (x, y, depth), x와 y는 아직 반올림 전의 이미지 좌표
+        im_shape:    (375, 1242)
+
+    같은 픽셀 (sub2ind 기준)에 여러 포인트가 맺히면 가장 가까운 뎁스를 남김
+    Counter + np.where 루프 대신 인덱스를 stable 정렬한 뒤 np.minimum.reduceat로 한 번에 처리
+    sub2ind가 (row, W-1)과 (row+1, 0)을 같은 인덱스로 보는 것까지 포함해서 이전 결과와 bit 단위로 동일
+    """
+    # check if in bounds
+    # use minus 1 to get the exact same value as KITTI matlab code
+    # 1. velo_path_im.shape는 3개 (x, y, 1) 성분이 61021개 있다. 여기의 x, y 좌표에서 1씩 빼준 것을 다시 velo_pts_im[:, 0] and [:, 1]에 대입
+    # 2. 그리고 x 좌표가 0 이상이고 y 좌표가 0 이상인 값만 유효한 인덱스로 취급한다.
+    # 3. 그리고 val_ind 이면서 동시에 velo_pts_im 좌표의 위치가 이미지의 크기보다 작은 것만 다시 val_inds로 할당 (그래야만 이미지에 좌표가 잘 맺히므로)
+    # 4. 마지막으로 그 유효한 좌표의 위치, 즉 True만 velo_pts_im로 취급
+    velo_pts_im[:, 0] = np.round(velo_pts_im[:, 0]) - 1
+    velo_pts_im[:, 1] = np.round(velo_pts_im[:, 1]) - 1
+    val_inds          = (velo_pts_im[:, 0] >= 0) & (velo_pts_im[:, 1] >= 0)
+    val_inds          = val_inds & (velo_pts_im[:, 0] < im_shape[1]) & (velo_pts_im[:, 1] < im_shape[0])
+    velo_pts_im       = velo_pts_im[val_inds, :]
+
+    rows  = velo_pts_im[:, 1].astype(np.int64)
+    cols  = velo_pts_im[:, 0].astype(np.int64)
+    depth = np.zeros((im_shape[:2])) # 이미지로 사영, 375, 1245 사이즈의 zero map을 만듬
+    depth[rows, cols] = velo_pts_im[:, 2]
+
+    # 마지막, 중복된 값을 제거
+    # 같은 인덱스끼리 묶은 뒤 각 묶음의 최솟값을 묶음의 첫 번째 포인트 위치에 기록
+    inds = sub2ind(depth.shape, rows, cols)
+    if len(inds) > 1:
+        order       = np.argsort(inds, kind = "stable")
+        sorted_inds = inds[order]
+        starts      = np.flatnonzero(np.r_[True, sorted_inds[1:] != sorted_inds[:-1]])
+        counts      = np.diff(np.r_[starts, len(sorted_inds)])
+        minimum     = np.minimum.reduceat(velo_pts_im[order, 2], starts)
+        dupes       = counts > 1
+        first       = order[starts[dupes]]
+        depth[rows[first], cols[first]] = minimum[dupes]
+
+    depth[depth < 0] = 0
+    return depth
+
+
+def velo2depth(velo, P_velo2im, im_shape, vel_depth = False):
+    """
+    homogenous 벨로다인 포인트와 사영 행렬로 뎁스 맵을 만드는 함수
+    Args:
+        velo:      [N, 4] (forward, left, up, 1)
+        P_velo2im: [3, 4] 벨로다인 포인트 -> 이미지로 사영하는 매트릭스
+        im_shape:  (375, 1242)
+    """
+    # load velodyne points and remove all behind image plane (approximation)
+    # each row of the velodyne data is forward, left, up, reflectance
+    velo = velo[velo[:, 0] >= 0, :]
+
+    # 벨로다인 포인트 homogenous 값을 카메라의 이미지 좌표에 사영하는 계산과정 이미지 = 사영행렬 * 3차원 벨로다인 포인트
+    velo_pts_im        = np.dot(P_velo2im, velo.T).T
+    velo_pts_im[:, :2] = velo_pts_im[:, :2] / velo_pts_im[:, 2][..., np.newaxis] # shape is (포인트 갯수, x, y, 1 값)
+
+    if vel_depth:
+        velo_pts_im[:, 2] = velo[:, 0]
+    return project_depth(velo_pts_im, im_shape)
+
+
+# 날짜 폴더 경로 -> {cam: (P_velo2im, im_shape)}, 프로세스마다 날짜 당 한 번만 파싱
+CALIBRATION = {}
+
+
+def read_calibration(calib_path):
+    """
+    날짜별 캘리브레이션 파일을 읽어서 바로 쓸 수 있는 사영 행렬과 이미지 모양을 캐싱하는 함수
+    KITTI raw의 캘리브레이션 날짜는 5개 뿐이라서 샘플마다 파일을 다시 열고 파싱할 필요가 없음
+    DataLoader 워커는 fork 시점의 CALIBRATION을 그대로 물려받음
     Args:
         calib_path: ./dataset/kitti-master/2011_09_26
-        point_path: ./dataset/kitti-master/2011_09_26/2011_09_26_drive_0022_sync/velodyne_points/data/0000000473.bin
 
     returns:
-        GT depth image (np.max: 80.0, np.min: 0.1)
-        shape: [375, 1242]
+        {2: (P_velo2im, im_shape), 3: (P_velo2im, im_shape)}
+        P_velo2im: [3, 4] 벨로다인 포인트 -> 이미지로 사영하는 매트릭스
+        im_shape:  (375, 1242)
     """
+    if calib_path in CALIBRATION:
+        return CALIBRATION[calib_path]
+
     # 1. load calibration files
     cam2cam  = read_velo2cam(os.path.join(calib_path + "/" + "calib_cam_to_cam.txt"))
     velo2cam = read_velo2cam(os.path.join(calib_path + "/" + "calib_velo_to_cam.txt"))
     velo2cam = np.hstack((velo2cam['R'].reshape(3, 3), velo2cam['T'][..., np.newaxis]))
     velo2cam = np.vstack((velo2cam, np.array([0, 0, 0, 1.0])))
 
-    # 2. 이미지 모양을 획득 (375, 1242)
-    im_shape = cam2cam["S_rect_02"][::-1].astype(np.int32)
-    
-    # 3.
+    # 2.
     # 3차원 포인트 점을 카메라 좌표계로 변환하고 다시 K를 곱해서 이미지로 사영시키는 수식
     # 먼저 4x4 항등행렬을 선언하고 여기서 3x3 부분은 회전 행렬을 붙인다. (R_rect_00)
     # 그리고 모션 벡터를 cam2cam의 P_rect_0 성분을 불러와서 둘을 np.dot한다.
     # 마지막으로 velo2cam 매트릭스를 np.dot하면 벨로다인 포인트 -> 이미지로 사영하는 매트릭스를 만듬
     R_cam2rect = np.eye(4)                                  # 4x4 항등행렬
     R_cam2rect[:3, :3] = cam2cam['R_rect_00'].reshape(3, 3) # 회전 운동
-    P_rect = cam2cam['P_rect_0'+str(cam)].reshape(3, 4)     # 모션 벡터
-    P_velo2im = np.dot(np.dot(P_rect, R_cam2rect), velo2cam)
 
-    # 4.
-    # 벨로다인 포인트 클라우드를 불러오고, x, y, z, 1의 homogenous 좌표계로 만듬
-    # load velodyne points and remove all behind image plane (approximation)
-    # each row of the velodyne data is forward, left, up, reflectance
+    calibration = {}
+    for cam in [2, 3]:
+        P_rect    = cam2cam['P_rect_0'+str(cam)].reshape(3, 4)           # 모션 벡터
+        P_velo2im = np.dot(np.dot(P_rect, R_cam2rect), velo2cam)
+        im_shape  = cam2cam['S_rect_0'+str(cam)][::-1].astype(np.int32) # 이미지 모양 (375, 1242)
+        P_velo2im.setflags(write = False)
+        im_shape.setflags(write = False)
+        calibration[cam] = (P_velo2im, im_shape)
+
+    CALIBRATION[calib_path] = calibration
+    return calibration
+
+
+def load_calibrations(datapath, filename):
+    """
+    스플릿 파일에 등장하는 모든 날짜의 캘리브레이션을 미리 읽어두는 함수
+    데이터셋 생성 시점 (메인 프로세스)에 호출하면 워커들은 파싱 없이 CALIBRATION을 공유
+    Args:
+        datapath: "./dataset/kitti"
+        filename: ['2011_09_26/2011_09_26_drive_0057_sync 311 l', ...] or SplitIndex
+    """
+    folders = filename.folders if isinstance(filename, SplitIndex) else [line.split()[0] for line in filename]
+    dates   = sorted({folder.split("/")[0] for folder in folders})
+    for yyyy_mm_dd in dates:
+        read_calibration(os.path.join(datapath, yyyy_mm_dd))
+    return dates
+
+
+def point2depth(calib_path, point_path, cam = 2, vel_depth = False):
+    """
+    캘리브레이션 경로와 벨로다인 파일 경로를 읽어서 뎁스 맵을 만드는 함수
+    Args:
+        calib_path: ./dataset/kitti-master/2011_09_26
+        point_path: ./dataset/kitti-master/2011_09_26/2011_09_26_drive_0022_sync/velodyne_points/data/0000000473.bin
+
+    returns:
+        GT depth image (np.max: 80.0, np.min: 0.1)
+        shape: [375, 1242]
+    """
+    # 1. 캐싱된 사영 행렬과 이미지 모양을 획득 (375, 1242)
+    P_velo2im, im_shape = read_calibration(calib_path)[cam]
+
+    # 2. 벨로다인 포인트 클라우드를 불러오고, x, y, z, 1의 homogenous 좌표계로 만듬
     velo = read_velodyne_points(point_path)
+    return velo2depth(velo, P_velo2im, im_shape, vel_depth)
+
+
+def velo2depth_stereo(velo, calibrations, vel_depth = False):
+    """
+    포인트 클라우드 하나를 여러 카메라로 한 번에 사영하는 함수
+    카메라 뒤쪽 포인트 제거는 한 번만 하고, 사영 행렬을 세로로 쌓아서 행렬 곱도 한 번만 수행
+    Args:
+        velo:         [N, 4] (forward, left, up, 1)
+        calibrations: [(P_velo2im, im_shape), ...] read_calibration(calib_path)[cam]의 리스트
+
+    returns:
+        카메라 순서대로의 뎁스 맵 리스트, 각각 velo2depth와 같은 결과
+    """
     velo = velo[velo[:, 0] >= 0, :]
 
-    # 5. 벨로다인 포인트 homogenous 값을 카메라의 이미지 좌표에 사영하는 계산과정 이미지 = 사영행렬 * 3차원 벨로다인 포인트
-    velo_pts_im        = np.dot(P_velo2im, velo.T).T
-    velo_pts_im[:, :2] = velo_pts_im[:, :2] / velo_pts_im[:, 2][..., np.newaxis] # shape is (포인트 갯수, x, y, 1 값)
+    # [카메라 수, 3, 4] x [4, N] -> [카메라 수, 3, N]
+    # 카메라마다 np.dot을 따로 부르는 것과 같은 모양의 행렬 곱이라서 결과도 bit 단위로 같음
+    P_velo2ims   = np.stack([P_velo2im for P_velo2im, _ in calibrations], axis = 0)
+    velo_pts_ims = np.matmul(P_velo2ims, velo.astype(np.float64).T)
 
-    if vel_depth:
-        velo_pts_im[:, 2] = velo[:, 0]
+    depths = []
+    for index, (_, im_shape) in enumerate(calibrations):
+        cam_pts_im        = velo_pts_ims[index].T
+        cam_pts_im[:, :2] = cam_pts_im[:, :2] / cam_pts_im[:, 2][..., np.newaxis]
 
-    # check if in bounds
-    # use minus 1 to get the exact same value as KITTI matlab code
-    # 1. velo_path_im.shape는 3개 (x, y, 1) 성분이 61021개 있다. 여기의 x, y 좌표에서 1씩 빼준 것을 다시 velo_pts_im[:, 0] and [:, 1]에 대입
-    # 2. 그리고 x 좌표가 0 이상이고 y 좌표가 0 이상인 값만 유효한 인덱스로 취급한다.
-    # 3. 그리고 val_ind 이면서 동시에 velo_pts_im 좌표의 위치가 이미지의 크기보다 작은 것만 다시 val_inds로 할당 (그래야만 이미지에 좌표가 잘 맺히므로)
-    # 4. 마지막으로 그 유효한 좌표의 위치, 즉 True만 velo_pts_im로 취급
-    velo_pts_im[:, 0] = np.round(velo_pts_im[:, 0]) - 1
-    velo_pts_im[:, 1] = np.round(velo_pts_im[:, 1]) - 1
-    val_inds          = (velo_pts_im[:, 0] >= 0) & (velo_pts_im[:, 1] >= 0)
-    val_inds          = val_inds & (velo_pts_im[:, 0] < im_shape[1]) & (velo_pts_im[:, 1] < im_shape[0])
-    velo_pts_im       = velo_pts_im[val_inds, :]
+        if vel_depth:
+            cam_pts_im[:, 2] = velo[:, 0]
+        depths.append(project_depth(cam_pts_im, im_shape))
+    return depths
 
-    depth = np.zeros((im_shape[:2])) # 이미지로 사영, 375, 1245 사이즈의 zero map을 만듬
-    depth[velo_pts_im[:, 1].astype(np.int), velo_pts_im[:, 0].astype(np.int)] = velo_pts_im[:, 2]
 
-    # 마지막, 중복된 값을 제거
-    inds = sub2ind(depth.shape, velo_pts_im[:, 1], velo_pts_im[:, 0])
-    dupe_inds = [item for item, count in Counter(inds).items() if count > 1]
-    for dd in dupe_inds:
-        pts   = np.where(inds == dd)[0]
-        x_loc = int(velo_pts_im[pts[0], 0])
-        y_loc = int(velo_pts_im[pts[0], 1])
-        depth[y_loc, x_loc] = velo_pts_im[pts, 2].min()
+def point2depth_stereo(calib_path, point_path, cams = (2, 3), vel_depth = False):
+    """
+    벨로다인 파일을 한 번만 읽어서 여러 카메라의 뎁스 맵을 만드는 함수 (스테레오 데이터셋용)
+    Args:
+        calib_path: ./dataset/kitti-master/2011_09_26
+        point_path: ./dataset/kitti-master/2011_09_26/2011_09_26_drive_0022_sync/velodyne_points/data/0000000473.bin
+        cams:       (2, 3) or (3, 2)
 
-    depth[depth < 0] = 0
-    return depth
+    returns:
+        [point2depth(calib_path, point_path, cam) for cam in cams]와 같은 뎁스 맵 리스트
+    """
+    calibration = read_calibration(calib_path)
+    velo        = read_velodyne_points(point_path)
+    return velo2depth_stereo(velo, [calibration[cam] for cam in cams], vel_depth)
+
+
+def dense2sparse(depth):
+    """
+    뎁스 맵에서 유효한 (depth > 0) 픽셀만 (u, v, z) 리스트로 추출하는 함수
+    Args:
+        depth: [1, H, W] or [H, W]
+
+    returns:
+        [N, 3] float32, u는 열 (가로), v는 행 (세로) 좌표
+    """
+    depth = depth.reshape(depth.shape[-2:])
+    v, u  = np.nonzero(depth > 0)
+    return np.stack([u, v, depth[v, u]], axis = 1).astype(np.float32)
 
 
 
@@ -204,11 +605,14 @@ CITYSCAPES 데이터셋을 위한 함수
 def removeline_city
 def 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
-def read_lines(datapath):
+def read_lines(datapath, compact = False):
+    # compact = True면 SplitIndex로 반환, SplitIndex.save로 저장한 .npz는 바로 로드
+    if datapath.endswith(".npz"):
+        return SplitIndex.load(datapath)
     file = open(datapath, "r")
     lines = file.readlines()
     lines = [line.rstrip(" \n") for line in lines]
-    return lines
+    return SplitIndex(lines) if compact else lines
 
 
 def save_lines(filename, datapath: str):
@@ -468,6 +872,7 @@ class Tools(object):
 
     @staticmethod
     def numpy2tensor(numpy): # 넘파이를 토치 텐서로
+        import torch
         return torch.from_numpy(numpy)
 
 
@@ -477,21 +882,14 @@ class Tools(object):
 
 
     @staticmethod
-    def sample_dataset(dataloader, end): # 모델 데이터로터에서 배치 샘플 하나를 추출
-        sample = []
-        start  = time.time()
-        for index, data in tqdm(enumerate(dataloader)):
-            sample.append(data)
-
-            if end == index:
-                break
-            elif end == "all":
-                pass
-            else:
-                raise "end is 'int' or 'all'"
-
-        print("batch sampling time:  ", time.time() - start)
-        return sample
+    def sample_dataset(dataloader, end = 0): # 데이터로더에서 0 ~ end번째 배치 (end = "all"이면 전부)를 추출, 처리량은 LoaderProfiler로 출력
+        if end != "all" and (not isinstance(end, int) or end < 0):
+            raise ValueError("end는 0 이상의 int 또는 'all'")
+        from model_loader.profiler import LoaderProfiler
+        profiler = LoaderProfiler(dataloader)
+        profiler.run(None if end == "all" else end + 1, keep = True)
+        profiler.report()
+        return profiler.batches
 
 
     @staticmethod
@@ -504,6 +902,7 @@ class Tools(object):
         
         토치면 [B, C, H, W]이거나 [C, H, W]이거나
         """
+        import matplotlib.pyplot as plt
         plt.rcParams["figure.figsize"] = size
 
         if option == "torch":
@@ -544,6 +943,7 @@ class Tools(object):
         color:  str
         marker: "o" or 
         """
+        import matplotlib.pyplot as plt
         plt.rcParams["figure.figsize"] = (10, 6)
         plt.rcParams['lines.linewidth'] = 1.5
         plt.rcParams['axes.grid'] = True 
@@ -0,0 +1,49 @@
+import torch
+import pytest
+from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.dataloader import default_collate
+
+from model_loader.collate import SharedBatchCollate
+
+
+
+class KeyedDataset(Dataset):
+    """
+    KITTI 샘플처럼 tuple 키, 여러 dtype, 샘플마다 길이가 다른 sparse 뎁스를 가진 가짜 데이터셋
+    """
+    def __len__(self):
+        return 70
+
+    def __getitem__(self, index):
+        generator = torch.Generator().manual_seed(index)
+        return {("color", 0, 0):  torch.randint(0, 256, (3, 8, 16), dtype = torch.uint8, generator = generator),
+                ("color", -1, 0): torch.rand((3, 8, 16), generator = generator),
+                ("K", 0):         torch.full((4, 4), float(index)),
+                "index":          index,
+                ("depth", 0):     torch.rand((index % 5 + 1, 3), generator = generator) + 1}
+
+
+def reference(dataset, batch_size):
+    batches = []
+    for start in range(0, len(dataset), batch_size):
+        samples = [dataset[index] for index in range(start, min(start + batch_size, len(dataset)))]
+        depth   = [sample.pop(("depth", 0)) for sample in samples]
+        batches.append((default_collate(samples), depth))
+    return batches
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_kept_batches_match_default_collate(num_workers):
+    # 배치를 전부 들고 있어도 (이전 구현은 slots 배치 뒤에 버퍼를 다시 써서 깨졌음) default_collate와 같아야 함
+    dataset = KeyedDataset()
+    loader  = DataLoader(dataset, 8, False, num_workers = num_workers, collate_fn = SharedBatchCollate(8))
+    kept    = list(loader)
+    assert len(kept) == 9
+
+    for batch, (expected, depth) in zip(kept, reference(dataset, 8)):
+        for key, value in expected.items():
+            assert batch[key].dtype == value.dtype
+            assert torch.equal(batch[key], value)
+        for index, points in enumerate(depth):
+            assert torch.equal(batch[("depth", 0)][index, :len(points)], points)
+            assert not batch[("depth", 0)][index, len(points):].any()